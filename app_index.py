@@ -0,0 +1,175 @@
+import heapq
+import re
+import unicodedata
+from urllib.parse import urlparse
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text: str):
+    """Palabras en minúsculas y sin acentos ("Música HD" -> ["musica", "hd"])"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return _WORD_RE.findall(text.encode('ascii', 'ignore').decode())
+
+
+def _trigrams(word: str):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+def _url_words(url: str):
+    """Palabras del subdominio de la app (whatsapp-messenger.es.uptodown.com)"""
+    host = urlparse(url).netloc.split('.')
+    return tokenize(host[0]) if len(host) > 2 else []
+
+
+class AppIndex:
+    """Índice en memoria de las apps del catálogo para sugerencias instantáneas
+
+    Cada palabra del nombre (y del subdominio de la URL) se indexa por todos sus
+    prefijos hasta `max_prefix` caracteres, que equivale a un trie aplanado en
+    un dict: una consulta es una búsqueda por palabra más la intersección de
+    conjuntos de IDs. Si ningún prefijo coincide se recurre a trigramas, que
+    toleran búsquedas por el medio de la palabra. Los resultados se ordenan por
+    la popularidad de los records (apariciones en búsquedas y clics).
+    """
+
+    def __init__(self, max_entries: int = 20000, max_prefix: int = 12):
+        self.max_entries = max_entries
+        self.max_prefix = max_prefix
+        self._entries = {}    # id -> (record, palabras)
+        self._prefixes = {}   # prefijo -> {id}
+        self._trigrams = {}   # trigrama -> {id}
+        # Prefijos de 1-2 letras tocan muchas apps: se memoriza su ranking
+        # hasta el siguiente cambio del índice
+        self._short = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, app_id):
+        return app_id in self._entries
+
+    def add(self, record):
+        """Indexa un record (o lo reindexa si cambió su nombre)"""
+        self._short = {}
+        entry = self._entries.get(record.id)
+        if entry is not None:
+            if entry[0] is record and entry[1] == self._words(record):
+                return
+            self._unindex(record.id, entry[1])
+
+        words = self._words(record)
+        self._entries[record.id] = (record, words)
+        self._index(record.id, words)
+        if len(self._entries) > self.max_entries:
+            self._evict()
+
+    def add_records(self, records):
+        for record in records:
+            self.add(record)
+
+    def changed(self):
+        """Avisa de que ha cambiado la popularidad de algún record"""
+        self._short = {}
+
+    def remove(self, app_id: int):
+        entry = self._entries.pop(app_id, None)
+        if entry is not None:
+            self._unindex(app_id, entry[1])
+            self._short = {}
+
+    def suggest(self, query: str, limit: int = 10):
+        """Records más populares cuyas palabras empiezan por las de la consulta"""
+        words = tokenize(query)
+        if not words:
+            return []
+        short = len(words) == 1 and len(words[0]) <= 2
+        if short and (words[0], limit) in self._short:
+            return self._short[words[0], limit]
+
+        candidates = self._prefix_candidates(words)
+        if not candidates:
+            candidates = self._trigram_candidates(words)
+
+        entries = self._entries
+        best = heapq.nlargest(
+            limit, candidates,
+            key=lambda app_id: (entries[app_id][0].popularity, -len(entries[app_id][0].name))
+        )
+        suggestions = [entries[app_id][0] for app_id in best]
+        if short:
+            self._short[words[0], limit] = suggestions
+        return suggestions
+
+    def _words(self, record):
+        words = tokenize(record.name)
+        for word in _url_words(record.url):
+            if word not in words:
+                words.append(word)
+        return words
+
+    def _keys(self, words):
+        prefixes = set()
+        trigrams = set()
+        for word in words:
+            for end in range(1, min(len(word), self.max_prefix) + 1):
+                prefixes.add(word[:end])
+            trigrams |= _trigrams(word)
+        return prefixes, trigrams
+
+    def _index(self, app_id: int, words):
+        prefixes, trigrams = self._keys(words)
+        for prefix in prefixes:
+            self._prefixes.setdefault(prefix, set()).add(app_id)
+        for trigram in trigrams:
+            self._trigrams.setdefault(trigram, set()).add(app_id)
+
+    def _unindex(self, app_id: int, words):
+        prefixes, trigrams = self._keys(words)
+        for table, keys in ((self._prefixes, prefixes), (self._trigrams, trigrams)):
+            for key in keys:
+                ids = table.get(key)
+                if ids is not None:
+                    ids.discard(app_id)
+                    if not ids:
+                        del table[key]
+
+    def _prefix_candidates(self, words):
+        sets = []
+        for word in words:
+            ids = self._prefixes.get(word[:self.max_prefix])
+            if not ids:
+                return set()
+            sets.append(ids)
+        sets.sort(key=len)
+        candidates = sets[0] if len(sets) == 1 else sets[0].intersection(*sets[1:])
+
+        long_words = [word for word in words if len(word) > self.max_prefix]
+        if long_words:
+            # El índice solo guarda prefijos cortos: comprobar la palabra completa
+            candidates = {
+                app_id for app_id in candidates
+                if all(any(w.startswith(word) for w in self._entries[app_id][1]) for word in long_words)
+            }
+        return candidates
+
+    def _trigram_candidates(self, words):
+        """Apps que comparten al menos la mitad de los trigramas de la consulta"""
+        trigrams = set()
+        for word in words:
+            trigrams |= _trigrams(word)
+        if not trigrams:
+            return set()
+        votes = {}
+        for trigram in trigrams:
+            for app_id in self._trigrams.get(trigram, ()):
+                votes[app_id] = votes.get(app_id, 0) + 1
+        needed = (len(trigrams) + 1) // 2
+        return {app_id for app_id, count in votes.items() if count >= needed}
+
+    def _evict(self):
+        """Expulsa el 10 % de apps menos populares"""
+        count = max(1, len(self._entries) - int(self.max_entries * 0.9))
+        entries = self._entries
+        for app_id in heapq.nsmallest(count, entries, key=lambda app_id: entries[app_id][0].popularity):
+            self.remove(app_id)
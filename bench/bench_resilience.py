@@ -0,0 +1,116 @@
+"""Compara el parser con y sin la capa de resiliencia frente a un Uptodown degradado
+
+Escenarios contra el stub local:
+  - cola lenta: una fracción de respuestas tarda mucho (hedging y timeouts adaptativos)
+  - errores sueltos: una fracción de 503 (reintentos con jitter)
+  - caída total: todo devuelve 503 (circuit breaker: fallar en milisegundos)
+
+Uso:
+    python bench/bench_resilience.py
+    python bench/bench_resilience.py --requests 300 --slow-ratio 0.05 --slow-ms 3000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run_bench import summarize  # noqa: E402
+from stub_server import start_stub_server  # noqa: E402
+from resilience import Resilience, CircuitBreaker  # noqa: E402
+from uptodown import UptodownParser, is_transient  # noqa: E402
+
+SEARCH_TIMEOUT = 15
+
+
+def make_parser(base_url: str, resilient: bool) -> UptodownParser:
+    resilience = None
+    if resilient:
+        resilience = Resilience(is_transient, breaker=CircuitBreaker(failures=5, cooldown=30))
+    return UptodownParser(base_url=base_url, resilience=resilience)
+
+
+async def run_requests(parser: UptodownParser, requests: int, concurrency: int):
+    """Lanza `requests` búsquedas y devuelve (latencias, errores)"""
+    limit = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with limit:
+            start = time.perf_counter()
+            try:
+                await parser.fetch(f"{parser.base_url}/search", SEARCH_TIMEOUT, params={'q': 'whatsapp'}, op='search')
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, errors
+
+
+async def scenario(name: str, base_url: str, handler, settings: dict, requests: int, concurrency: int, warmup: int):
+    print(f"\n🧪 {name}")
+    for resilient in (False, True):
+        parser = make_parser(base_url, resilient)
+        # Calentamiento sin degradación: la capa aprende la latencia normal
+        for key in ('slow_ratio', 'slow_delay', 'error_ratio'):
+            setattr(handler, key, 0.0)
+        await run_requests(parser, warmup, concurrency)
+        for key, value in settings.items():
+            setattr(handler, key, value)
+
+        latencies, errors = await run_requests(parser, requests, concurrency)
+        summary = summarize(latencies)
+        label = "con resiliencia" if resilient else "sin resiliencia"
+        print(
+            f"  {label:16} p50 {summary['p50_ms']:7.1f} ms · p99 {summary['p99_ms']:7.1f} ms · "
+            f"máx {max(latencies) * 1000:7.1f} ms · errores {errors}/{requests}"
+        )
+        if parser.resilience is not None:
+            stats = parser.resilience.stats()
+            print(
+                f"  {'':16} hedges {stats['hedges']} ({stats['hedge_wins']} ganados) · "
+                f"reintentos {stats['retries']} · circuito {stats['state']} · cortadas {stats['rejected']}"
+            )
+        await parser.close()
+
+
+async def main(args):
+    server, base_url = start_stub_server(delay_ms=args.delay_ms)
+    handler = server.RequestHandlerClass
+    try:
+        await scenario(
+            f"Cola lenta ({args.slow_ratio:.0%} de respuestas +{args.slow_ms:.0f} ms)", base_url, handler,
+            {'slow_ratio': args.slow_ratio, 'slow_delay': args.slow_ms / 1000},
+            args.requests, args.concurrency, args.warmup,
+        )
+        await scenario(
+            f"Errores sueltos ({args.error_ratio:.0%} de 503)", base_url, handler,
+            {'error_ratio': args.error_ratio},
+            args.requests, args.concurrency, args.warmup,
+        )
+        await scenario(
+            "Caída total (100 % de 503)", base_url, handler,
+            {'error_ratio': 1.0},
+            args.requests, args.concurrency, args.warmup,
+        )
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--requests', type=int, default=200)
+    arg_parser.add_argument('--concurrency', type=int, default=10)
+    arg_parser.add_argument('--warmup', type=int, default=50, help="peticiones sanas antes de degradar")
+    arg_parser.add_argument('--delay-ms', type=float, default=20, help="latencia normal del stub")
+    arg_parser.add_argument('--slow-ratio', type=float, default=0.05)
+    arg_parser.add_argument('--slow-ms', type=float, default=2000)
+    arg_parser.add_argument('--error-ratio', type=float, default=0.1)
+    asyncio.run(main(arg_parser.parse_args()))
@@ -0,0 +1,191 @@
+"""Mide el arranque en frío del bot: tiempo hasta la primera respuesta tras un reinicio
+
+Lanza `main.py` como proceso real contra una Bot API falsa (bench/fake_telegram.py)
+y el stub de Uptodown, con un catálogo de apps sembrado en disco. En cada
+arranque hay dos updates esperando (`/start` y una búsqueda hecha antes del
+reinicio) y se mide desde el lanzamiento del proceso:
+  - puerto: la página de estado responde
+  - /start: llega la primera respuesta del bot
+  - búsqueda: llegan los resultados (y si salieron del cache)
+
+Se comparan el arranque clásico (FAST_START=0, sin snapshot) y el rápido.
+
+Uso:
+    python bench/bench_startup.py
+    python bench/bench_startup.py --apps 20000 --runs 5
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from fake_telegram import start_fake_telegram  # noqa: E402
+from stub_server import start_stub_server  # noqa: E402
+from storage import PersistentStore  # noqa: E402
+
+CHAT_ID = 4242
+QUERY = 'whatsapp'
+TIMEOUT = 60
+
+MODES = {
+    'clásico': {'FAST_START': '0', 'SNAPSHOT_PATH': ''},
+    'rápido': {'FAST_START': '1'},
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed_catalog(db_path: str, apps: int):
+    """Catálogo en disco como el de un bot que lleva tiempo funcionando"""
+    store = PersistentStore(db_path)
+    batch = []
+    for number in range(apps):
+        batch.append({'name': f"App {number} editor video {number % 97}",
+                      'url': f"https://app{number}.en.uptodown.com/android"})
+        if len(batch) == 1000:
+            store.intern_apps(batch, popularity=0)
+            batch = []
+    if batch:
+        store.intern_apps(batch, popularity=0)
+    store.close()
+
+
+def health_ok(port: int) -> bool:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=0.2) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def first_sent(telegram, predicate):
+    for sent_at, method, chat_id, text, params in list(telegram.sent):
+        if chat_id == CHAT_ID and predicate(text, params):
+            return sent_at, text
+    return None
+
+
+def is_welcome(text: str, params: dict) -> bool:
+    return 'Bot de Búsqueda' in text
+
+
+def is_results(text: str, params: dict) -> bool:
+    return 'reply_markup' in params
+
+
+def run_bot(env: dict, workdir: str, telegram, updates, log_name: str) -> dict:
+    """Arranca el bot con `updates` pendientes, mide y lo apaga con SIGTERM
+
+    `updates` son pares (texto, nombre de la medida); cada medida es el instante
+    en que el bot manda la respuesta esperada a ese update.
+    """
+    telegram.reset()
+    for text, _ in updates:
+        telegram.push_text(CHAT_ID, text)
+    expected = {name: {'start': is_welcome, 'search': is_results}[name] for _, name in updates}
+
+    start = time.perf_counter()
+    deadline = start + TIMEOUT
+    with open(os.path.join(workdir, log_name), 'w') as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'main.py')], env=env, cwd=workdir,
+            stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            timings = {}
+            port = int(env['PORT'])
+            while time.perf_counter() < deadline and not all(name in timings for name in ['port', *expected]):
+                if 'port' not in timings and health_ok(port):
+                    timings['port'] = time.perf_counter() - start
+                for name, predicate in expected.items():
+                    sent = None if name in timings else first_sent(telegram, predicate)
+                    if sent:
+                        timings[name] = sent[0] - start
+                        if name == 'search':
+                            timings['cached'] = 'desde cache' in sent[1]
+                time.sleep(0.002)
+            return timings
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=20)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def describe(values) -> str:
+    if not values:
+        return "     n/d"
+    return f"{statistics.median(values) * 1000:6.0f} ms"
+
+
+def main(args):
+    telegram, telegram_url = start_fake_telegram()
+    uptodown, uptodown_url = start_stub_server(delay_ms=args.delay_ms)
+    try:
+        for mode, overrides in MODES.items():
+            with tempfile.TemporaryDirectory(prefix='uptodaw-startup-') as workdir:
+                db_path = os.path.join(workdir, 'cache.db')
+                seed_catalog(db_path, args.apps)
+                env = dict(
+                    os.environ,
+                    TELEGRAM_BOT_TOKEN='123456:bench',
+                    TELEGRAM_API_URL=telegram_url,
+                    UPTODOWN_URL=uptodown_url,
+                    CACHE_DB_PATH=db_path,
+                    SNAPSHOT_PATH=os.path.join(workdir, 'snapshot.json.gz'),
+                    STATE_BACKEND='memory',
+                    PORT=str(free_port()),
+                    PREFETCH_ENABLED='0',
+                    PYTHONDONTWRITEBYTECODE='1',
+                )
+                env.update(overrides)
+
+                # Primera vida del bot: hace la búsqueda contra Uptodown y se apaga
+                warm = run_bot(env, workdir, telegram, [(f"/search {QUERY}", 'search')], 'warmup.log')
+                if 'search' not in warm:
+                    print(f"❌ {mode}: el bot no respondió (ver {workdir}/warmup.log)")
+                    with open(os.path.join(workdir, 'warmup.log')) as log:
+                        print("".join(line for line in log if 'getUpdates' not in line)[-3000:])
+                    continue
+
+                runs = []
+                for number in range(args.runs):
+                    env['PORT'] = str(free_port())
+                    runs.append(run_bot(env, workdir, telegram, [('/start', 'start'), (f"/search {QUERY}", 'search')],
+                                        f"run{number}.log"))
+
+                cached = sum(1 for timings in runs if timings.get('cached'))
+                print(
+                    f"{mode:8} puerto {describe([t['port'] for t in runs if 'port' in t])} · "
+                    f"/start {describe([t['start'] for t in runs if 'start' in t])} · "
+                    f"búsqueda {describe([t['search'] for t in runs if 'search' in t])} "
+                    f"(desde cache {cached}/{len(runs)})"
+                )
+    finally:
+        telegram.shutdown()
+        uptodown.shutdown()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--apps', type=int, default=20000, help="apps en el catálogo sembrado")
+    arg_parser.add_argument('--runs', type=int, default=3)
+    arg_parser.add_argument('--delay-ms', type=float, default=20, help="latencia del stub de Uptodown")
+    args = arg_parser.parse_args()
+    print(f"🚀 Arranque en frío con {args.apps} apps en el catálogo (mediana de {args.runs} arranques)")
+    main(args)
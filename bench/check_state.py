@@ -0,0 +1,129 @@
+"""Comprueba que los backends de estado (memory, sqlite, redis) se comportan igual
+
+Para sqlite y redis se crean dos instancias independientes del backend, como
+si fueran dos workers, y se verifica que comparten cache, rate limiting y
+locks, y que el single-flight entre ellos hace un único fetch.
+
+Uso:
+    python bench/check_state.py                         # redis contra el stand-in local
+    REDIS_URL=redis://localhost:6379/15 python bench/check_state.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_redis import start_fake_redis  # noqa: E402
+from singleflight import SingleFlight  # noqa: E402
+from state import MemoryBackend, SQLiteBackend, RedisBackend  # noqa: E402
+
+
+class Checker:
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+
+    def check(self, description: str, ok: bool):
+        print(f"  {'✅' if ok else '❌'} {description}")
+        if not ok:
+            self.failures += 1
+
+
+async def check_backend(checker: Checker, first, second, prefix: str):
+    """`first` y `second` son dos instancias; en memoria son la misma"""
+    await first.set(f'{prefix}:k', b'v', 60)
+    checker.check("set/get", await second.get(f'{prefix}:k') == b'v')
+    await first.set(f'{prefix}:short', b'v', 0.05)
+    await asyncio.sleep(0.1)
+    checker.check("el TTL caduca la entrada", await second.get(f'{prefix}:short') is None)
+    await second.delete(f'{prefix}:k')
+    checker.check("delete", await first.get(f'{prefix}:k') is None)
+
+    # 3 tokens de ráfaga, 1 token/s
+    waits = [await (first if i % 2 else second).take(f'{prefix}:bucket', 1.0, 3) for i in range(4)]
+    checker.check("token bucket compartido: 3 concedidos y el 4º espera", waits[:3] == [0, 0, 0] and waits[3] > 0)
+    checker.check("la espera es ~1 s", 0.5 < waits[3] <= 1.0)
+
+    checker.check("lock exclusivo", await first.lock(f'{prefix}:lock', 'a', 5))
+    checker.check("otro dueño no lo toma", not await second.lock(f'{prefix}:lock', 'b', 5))
+    checker.check("el mismo dueño lo vuelve a tomar", await first.lock(f'{prefix}:lock', 'a', 5))
+    await second.unlock(f'{prefix}:lock', 'b')
+    checker.check("solo el dueño lo libera", not await second.lock(f'{prefix}:lock', 'b', 5))
+    await first.unlock(f'{prefix}:lock', 'a')
+    checker.check("liberado, otro lo toma", await second.lock(f'{prefix}:lock', 'b', 5))
+    await second.unlock(f'{prefix}:lock', 'b')
+    checker.check("un lock caducado se puede tomar", await first.lock(f'{prefix}:ttl', 'a', 0.05)
+                  and not await second.lock(f'{prefix}:ttl', 'b', 5)
+                  and await asyncio.sleep(0.1) is None
+                  and await second.lock(f'{prefix}:ttl', 'b', 5))
+
+
+async def check_single_flight(checker: Checker, first, second, prefix: str):
+    """20 peticiones repartidas entre dos 'workers' -> un único fetch"""
+    fetches = 0
+    key = f'{prefix}:result'
+
+    async def fetch(backend):
+        nonlocal fetches
+        fetches += 1
+        await asyncio.sleep(0.3)
+        await backend.set(key, b'resultado', 60)
+        return b'resultado'
+
+    workers = [(SingleFlight(first, poll_interval=0.02), first), (SingleFlight(second, poll_interval=0.02), second)]
+    calls = []
+    for i in range(20):
+        flight, backend = workers[i % 2]
+        calls.append(flight.do((prefix, 'q'), fetch, backend, lookup=lambda backend=backend: backend.get(key)))
+    results = await asyncio.gather(*calls)
+    checker.check("todas las peticiones reciben el resultado", all(result == b'resultado' for result in results))
+    checker.check(f"un único fetch entre los dos workers (hubo {fetches})", fetches == 1)
+
+
+async def main() -> int:
+    failures = 0
+
+    checker = Checker('memory')
+    print("🧠 memory")
+    memory = MemoryBackend()
+    await check_backend(checker, memory, memory, 'm')
+    failures += checker.failures
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checker = Checker('sqlite')
+        print("🗄 sqlite (dos conexiones al mismo fichero)")
+        path = os.path.join(tmp, 'state.db')
+        first, second = SQLiteBackend(path), SQLiteBackend(path)
+        await check_backend(checker, first, second, 's')
+        await check_single_flight(checker, first, second, 's')
+        await first.close()
+        await second.close()
+        failures += checker.failures
+
+    server = None
+    url = os.getenv('REDIS_URL')
+    if not url:
+        server, _, url = await start_fake_redis()
+    checker = Checker('redis')
+    print(f"🟥 redis ({url}{'' if server is None else ', stand-in local'})")
+    first, second = RedisBackend(url), RedisBackend(url)
+    prefix = f'check-{os.getpid()}'
+    await check_backend(checker, first, second, prefix)
+    await check_single_flight(checker, first, second, prefix)
+    await first.close()
+    await second.close()
+    failures += checker.failures
+    if server is not None:
+        await asyncio.sleep(0.05)  # que el stand-in vea cerrarse las conexiones
+        server.close()
+        await server.wait_closed()
+
+    print("✅ Todo correcto" if not failures else f"❌ {failures} comprobaciones fallidas")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,178 @@
+"""Servidor local que habla RESP y sustituye a Redis en las pruebas del backend de estado
+
+Implementa solo lo que usa state.RedisBackend: PING, AUTH, SELECT, GET, SET
+(NX/EX/PX), DEL, SCRIPT LOAD, EVAL y EVALSHA. No ejecuta Lua: los scripts del
+bot se reconocen por su SHA1 y se ejecutan con una versión equivalente en Python.
+
+Uso independiente:
+    python bench/fake_redis.py --port 6380
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state import LOCK_SCRIPT, TOKEN_BUCKET_SCRIPT, UNLOCK_SCRIPT  # noqa: E402
+
+
+def _sha(script: str) -> str:
+    return hashlib.sha1(script.encode()).hexdigest()
+
+
+class FakeRedis:
+    def __init__(self):
+        self._data = {}  # clave -> (valor, caduca_en o None)
+        self._scripts = {
+            _sha(TOKEN_BUCKET_SCRIPT): self._token_bucket,
+            _sha(LOCK_SCRIPT): self._lock,
+            _sha(UNLOCK_SCRIPT): self._unlock,
+        }
+        self.commands = 0
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def _set(self, key, value, ttl_ms=None):
+        expires_at = time.monotonic() + ttl_ms / 1000 if ttl_ms else None
+        self._data[key] = (value, expires_at)
+
+    def _token_bucket(self, keys, args):
+        rate, capacity, cost, now = (float(arg) for arg in args)
+        state = self._get(keys[0]) or {}
+        tokens = float(state.get('tokens', capacity))
+        updated = float(state.get('updated', now))
+        tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+        wait = 0.0
+        if tokens < cost:
+            wait = (cost - tokens) / rate
+        else:
+            tokens -= cost
+        self._set(keys[0], {'tokens': tokens, 'updated': now}, int(capacity / rate * 1000) + 1000)
+        return str(wait).encode()
+
+    def _lock(self, keys, args):
+        current = self._get(keys[0])
+        if current is None or current == args[0]:
+            self._set(keys[0], args[0], int(args[1]))
+            return 1
+        return 0
+
+    def _unlock(self, keys, args):
+        if self._get(keys[0]) == args[0]:
+            del self._data[keys[0]]
+            return 1
+        return 0
+
+    def execute(self, args):
+        self.commands += 1
+        command = args[0].decode().upper()
+        if command == 'PING':
+            return 'PONG'
+        if command in ('AUTH', 'SELECT'):
+            return 'OK'
+        if command == 'GET':
+            return self._get(args[1])
+        if command == 'SET':
+            key, value = args[1], args[2]
+            options = [arg.decode().upper() for arg in args[3:]]
+            ttl_ms = None
+            if 'PX' in options:
+                ttl_ms = int(options[options.index('PX') + 1])
+            elif 'EX' in options:
+                ttl_ms = int(options[options.index('EX') + 1]) * 1000
+            if 'NX' in options and self._get(key) is not None:
+                return None
+            self._set(key, value, ttl_ms)
+            return 'OK'
+        if command == 'DEL':
+            return sum(1 for key in args[1:] if self._data.pop(key, None) is not None)
+        if command == 'SCRIPT' and args[1].decode().upper() == 'LOAD':
+            sha = _sha(args[2].decode())
+            if sha not in self._scripts:
+                return RuntimeError('ERR script no soportado por el stand-in')
+            return sha.encode()
+        if command in ('EVAL', 'EVALSHA'):
+            sha = _sha(args[1].decode()) if command == 'EVAL' else args[1].decode()
+            script = self._scripts.get(sha)
+            if script is None:
+                return RuntimeError('NOSCRIPT No matching script')
+            count = int(args[2])
+            return script(args[3:3 + count], args[3 + count:])
+        return RuntimeError(f"ERR comando no soportado: {command}")
+
+
+def encode(reply) -> bytes:
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, RuntimeError):
+        return b'-' + str(reply).encode() + b'\r\n'
+    if isinstance(reply, str):
+        return b'+' + reply.encode() + b'\r\n'
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    raise TypeError(reply)
+
+
+async def read_command(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.split()  # comandos en línea (redis-cli, telnet)
+    args = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+async def start_fake_redis(port: int = 0, host: str = '127.0.0.1'):
+    """Arranca el stand-in en el event loop actual; devuelve (server, FakeRedis, url)"""
+    fake = FakeRedis()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                args = await read_command(reader)
+                if not args:
+                    break
+                writer.write(encode(fake.execute(args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    url = f"redis://{host}:{server.sockets[0].getsockname()[1]}/0"
+    return server, fake, url
+
+
+async def serve(port: int):
+    server, _, url = await start_fake_redis(port)
+    print(f"🧪 Redis de pruebas en {url}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--port', type=int, default=6380)
+    args = arg_parser.parse_args()
+    try:
+        asyncio.run(serve(args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,119 @@
+"""Bot API de Telegram mínima para medir el bot sin red (stand-in local)
+
+Entiende lo que usa el bot en modo polling: getMe, deleteWebhook, getUpdates
+(entrega los updates encolados y si no hay espera un poco) y sendMessage /
+editMessageText, que se registran con su instante para medir latencias.
+El resto de métodos responden `true`.
+
+Uso (con el bot apuntando aquí mediante TELEGRAM_API_URL):
+    server, url = start_fake_telegram()
+    server.push_text(chat_id=42, text='/start')
+"""
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {'id': 1000, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+POLL_WAIT = 0.5
+
+
+class FakeTelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _params(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+            return json.loads(body or b'{}')
+        # PTB manda form-urlencoded con los valores no textuales en JSON
+        return {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+
+    def do_POST(self):
+        method = self.path.rsplit('/', 1)[-1]
+        params = self._params()
+        result = self.server.call(method, params)
+        payload = json.dumps({'ok': True, 'result': result}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST
+
+
+class FakeTelegram(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, FakeTelegramHandler)
+        self._lock = threading.Lock()
+        self._updates = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self.sent = []   # (instante perf_counter, método, chat_id, texto, params)
+
+    def handle_error(self, request, client_address):
+        pass  # el bot corta conexiones al apagarse
+
+    def push_text(self, chat_id: int, text: str):
+        """Encola un mensaje de un usuario (los comandos llevan su entidad bot_command)"""
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Usuario'},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        with self._lock:
+            self._updates.append({'update_id': next(self._update_ids), 'message': message})
+
+    def reset(self):
+        with self._lock:
+            self._updates = []
+            self.sent = []
+
+    def call(self, method: str, params: dict):
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getUpdates':
+            return self._get_updates(int(params.get('offset') or 0), float(params.get('timeout') or 0))
+        if method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            chat_id = int(params.get('chat_id') or 0)
+            with self._lock:
+                self.sent.append((time.perf_counter(), method, chat_id, params.get('text', ''), params))
+            return {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+        return True
+
+    def _get_updates(self, offset: int, timeout: float):
+        deadline = time.monotonic() + min(timeout, POLL_WAIT)
+        while True:
+            with self._lock:
+                # Como la API real: pedir desde `offset` confirma los anteriores
+                self._updates = [update for update in self._updates if update['update_id'] >= offset]
+                if self._updates:
+                    return list(self._updates)
+            if time.monotonic() >= deadline:
+                return []
+            time.sleep(0.005)
+
+
+def start_fake_telegram(port: int = 0):
+    """Arranca la API falsa en un hilo y devuelve (servidor, url base para TELEGRAM_API_URL)"""
+    server = FakeTelegram(('127.0.0.1', port))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
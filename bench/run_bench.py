@@ -0,0 +1,217 @@
+"""Benchmark offline de UptodownParser con fixtures grabados y un stub HTTP local
+
+Mide:
+  - throughput de parseo por fixture (páginas/s y MB/s)
+  - latencia extremo a extremo de search_apps / get_download_url (p50/p90/p99)
+  - memoria asignada por petición (pico de tracemalloc)
+  - revalidación de páginas conocidas: cuerpo completo, mismo digest o 304 por ETag
+
+Uso:
+    python bench/run_bench.py
+    python bench/run_bench.py --requests 500 --concurrency 50 --delay-ms 20 --json bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_server import start_stub_server, load_fixtures  # noqa: E402
+from uptodown import UptodownParser  # noqa: E402
+
+SEARCH_QUERIES = ['whatsapp', 'names telegram', 'fallback vlc', 'empty zzz']
+DOWNLOAD_APPS = ['whatsapp-messenger', 'fallback-app']
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies) -> dict:
+    return {
+        'count': len(latencies),
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def bench_parse(iterations: int) -> dict:
+    """Throughput de parseo puro sobre cada fixture"""
+    results = {}
+    for name, body in sorted(load_fixtures().items()):
+        html = body.decode('utf-8')
+        parser = UptodownParser()
+        parse = parser.parse_download_info if name.startswith('download') else parser.parse_search
+        parse(html)  # calentamiento
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            parse(html)
+        elapsed = time.perf_counter() - start
+
+        results[name] = {
+            'pages_per_s': iterations / elapsed,
+            'mb_per_s': len(body) * iterations / elapsed / 1e6,
+            'ms_per_page': elapsed / iterations * 1000,
+        }
+    return results
+
+
+async def bench_end_to_end(base_url: str, requests: int, concurrency: int) -> dict:
+    """Latencia de search_apps y get_download_url contra el stub (siempre con parseo)"""
+    parser = UptodownParser(base_url=base_url, page_cache_entries=0)
+    limit = asyncio.Semaphore(concurrency)
+    timings = {'search_apps': [], 'get_download_url': []}
+
+    async def timed(kind, call):
+        async with limit:
+            start = time.perf_counter()
+            await call
+            timings[kind].append(time.perf_counter() - start)
+
+    tasks = []
+    for i in range(requests):
+        query = SEARCH_QUERIES[i % len(SEARCH_QUERIES)]
+        app_url = f"{base_url}/android/{DOWNLOAD_APPS[i % len(DOWNLOAD_APPS)]}"
+        tasks.append(timed('search_apps', parser.search_apps(query)))
+        tasks.append(timed('get_download_url', parser.get_download_url(app_url)))
+
+    start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - start
+    await parser.close()
+
+    report = {kind: summarize(values) for kind, values in timings.items()}
+    report['throughput_rps'] = len(tasks) / wall
+    return report
+
+
+async def bench_memory(base_url: str, requests: int) -> dict:
+    """Pico de memoria asignada por petición (secuencial, conexión ya abierta)"""
+    parser = UptodownParser(base_url=base_url, page_cache_entries=0)
+    await parser.search_apps(SEARCH_QUERIES[0])  # abre el pool fuera de la medición
+
+    peaks = {'search_apps': [], 'get_download_url': []}
+    tracemalloc.start()
+    for i in range(requests):
+        for kind in peaks:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            if kind == 'search_apps':
+                await parser.search_apps(SEARCH_QUERIES[i % len(SEARCH_QUERIES)])
+            else:
+                await parser.get_download_url(f"{base_url}/android/{DOWNLOAD_APPS[i % len(DOWNLOAD_APPS)]}")
+            peaks[kind].append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    await parser.close()
+
+    return {
+        kind: {'mean_kb': statistics.fmean(values) / 1024, 'max_kb': max(values) / 1024}
+        for kind, values in peaks.items()
+    }
+
+
+async def bench_revalidation(base_url: str, handler, requests: int) -> dict:
+    """Peticiones repetidas a páginas ya vistas: parseo completo, digest igual o 304"""
+    modes = {
+        'full_parse': (0, False),     # sin cache de páginas
+        'same_digest': (100, False),  # 200 con el mismo cuerpo: se salta el parseo
+        'not_modified': (100, True),  # ETag: 304 sin cuerpo
+    }
+    report = {}
+    for mode, (entries, validators) in modes.items():
+        handler.validators = validators
+        parser = UptodownParser(base_url=base_url, page_cache_entries=entries)
+        await parser.search_apps(SEARCH_QUERIES[0])  # primera visita y pool abierto
+
+        received = 0
+
+        async def count_bytes(response):
+            nonlocal received
+            received += int(response.headers.get('Content-Length', 0))
+
+        parser.client.event_hooks['response'].append(count_bytes)
+        latencies = []
+        cpu_start = time.process_time()
+        for i in range(requests):
+            start = time.perf_counter()
+            await parser.search_apps(SEARCH_QUERIES[i % len(SEARCH_QUERIES)])
+            latencies.append(time.perf_counter() - start)
+        cpu = time.process_time() - cpu_start
+        await parser.close()
+
+        report[mode] = dict(summarize(latencies), kb_per_request=received / requests / 1024,
+                            cpu_ms_per_request=cpu / requests * 1000)
+    handler.validators = False
+    return report
+
+
+def print_report(report: dict):
+    print("\n📄 Parseo")
+    for name, row in report['parse'].items():
+        print(f"  {name:<26} {row['ms_per_page']:7.2f} ms/página  "
+              f"{row['pages_per_s']:8.1f} páginas/s  {row['mb_per_s']:6.2f} MB/s")
+
+    print("\n🌐 Extremo a extremo (stub local)")
+    for kind in ('search_apps', 'get_download_url'):
+        row = report['end_to_end'][kind]
+        print(f"  {kind:<18} n={row['count']:<5} p50={row['p50_ms']:7.2f} ms  "
+              f"p90={row['p90_ms']:7.2f} ms  p99={row['p99_ms']:7.2f} ms")
+    print(f"  throughput: {report['end_to_end']['throughput_rps']:.1f} peticiones/s")
+
+    print("\n♻️ Revalidación (búsquedas repetidas)")
+    for mode, row in report['revalidation'].items():
+        print(f"  {mode:<18} p50={row['p50_ms']:7.2f} ms  CPU={row['cpu_ms_per_request']:6.2f} ms  "
+              f"{row['kb_per_request']:7.1f} KB/petición")
+
+    print("\n🧠 Memoria por petición")
+    for kind, row in report['memory'].items():
+        print(f"  {kind:<18} media={row['mean_kb']:8.1f} KB  máx={row['max_kb']:8.1f} KB")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--iterations', type=int, default=200, help="parseos por fixture")
+    arg_parser.add_argument('--requests', type=int, default=200, help="peticiones extremo a extremo por tipo")
+    arg_parser.add_argument('--concurrency', type=int, default=20)
+    arg_parser.add_argument('--memory-requests', type=int, default=20)
+    arg_parser.add_argument('--delay-ms', type=float, default=0, help="latencia simulada del stub")
+    arg_parser.add_argument('--json', help="guardar el informe en este fichero")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger('uptodown').setLevel(logging.WARNING)
+    logging.getLogger('selector_engine').setLevel(logging.WARNING)
+
+    server, base_url = start_stub_server(delay_ms=args.delay_ms)
+    try:
+        report = {
+            'parse': bench_parse(args.iterations),
+            'end_to_end': asyncio.run(bench_end_to_end(base_url, args.requests, args.concurrency)),
+            'memory': asyncio.run(bench_memory(base_url, args.memory_requests)),
+            'revalidation': asyncio.run(bench_revalidation(base_url, server.RequestHandlerClass, args.requests)),
+        }
+    finally:
+        server.shutdown()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Informe guardado en {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Servidor HTTP local que imita Uptodown sirviendo los fixtures de bench/fixtures
+
+Rutas:
+    /search?q=<texto>           página de búsqueda (el fixture se elige por el texto)
+    /android/<app>/download     página de descarga
+    /dwn/..., /files/...        APK ficticio de tamaño fijo
+
+Uso independiente:
+    python bench/stub_server.py --port 8765 --delay-ms 50
+    python bench/stub_server.py --slow-ratio 0.1 --slow-ms 2000 --error-ratio 0.05
+    python bench/stub_server.py --validators    # ETag / Last-Modified y respuestas 304
+"""
+import argparse
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Palabra clave en la búsqueda -> fixture
+SEARCH_FIXTURES = {
+    'names': 'search_name_links.html',
+    'fallback': 'search_fallback.html',
+    'empty': 'search_empty.html',
+}
+DEFAULT_SEARCH_FIXTURE = 'search_app_cards.html'
+DEFAULT_DOWNLOAD_FIXTURE = 'download_button.html'
+FALLBACK_DOWNLOAD_FIXTURE = 'download_fallback.html'
+
+
+def load_fixtures() -> dict:
+    fixtures = {}
+    for name in os.listdir(FIXTURES_DIR):
+        if name.endswith('.html'):
+            with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+def search_fixture_for(query: str) -> str:
+    for keyword, fixture in SEARCH_FIXTURES.items():
+        if keyword in query:
+            return fixture
+    return DEFAULT_SEARCH_FIXTURE
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fixtures = {}
+    delay = 0.0
+    # Cola lenta y errores 503 simulados (se pueden cambiar en caliente en la clase)
+    slow_ratio = 0.0
+    slow_delay = 0.0
+    error_ratio = 0.0
+    validators = False
+    apk_size = 256 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.delay:
+            time.sleep(self.delay)
+        if self.slow_ratio and random.random() < self.slow_ratio:
+            time.sleep(self.slow_delay)
+        if self.error_ratio and random.random() < self.error_ratio:
+            self._send(503, b'Service unavailable', 'text/plain')
+            return
+
+        parsed = urlparse(self.path)
+        if parsed.path == '/search':
+            query = parse_qs(parsed.query).get('q', [''])[0]
+            self._send_page(self.fixtures[search_fixture_for(query)])
+        elif parsed.path.startswith('/android/') and parsed.path.endswith('/download'):
+            fixture = FALLBACK_DOWNLOAD_FIXTURE if 'fallback' in parsed.path else DEFAULT_DOWNLOAD_FIXTURE
+            self._send_page(self.fixtures[fixture])
+        elif parsed.path.startswith(('/dwn/', '/files/')):
+            self._send_apk()
+        else:
+            self._send(404, b'Not found', 'text/plain')
+
+    def _send_apk(self, chunk_size: int = 64 * 1024):
+        """APK ficticio enviado por bloques, para no inflar la memoria del propio stub"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.android.package-archive')
+        self.send_header('Content-Length', str(self.apk_size))
+        self.end_headers()
+        chunk = b'\0' * chunk_size
+        remaining = self.apk_size
+        while remaining > 0:
+            self.wfile.write(chunk[:remaining])
+            remaining -= chunk_size
+
+    def _send_page(self, body: bytes):
+        """Página HTML; con `validators` responde 304 si el cliente ya tiene esta versión"""
+        if not self.validators:
+            self._send(200, body)
+            return
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self._send(200, body, headers={'ETag': etag, 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+
+    def _send(self, status: int, body: bytes, content_type: str = 'text/html; charset=utf-8',
+              headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Los hedges cancelados cierran la conexión a mitad de respuesta
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_stub_server(port: int = 0, delay_ms: float = 0, slow_ratio: float = 0,
+                      slow_ms: float = 0, error_ratio: float = 0, validators: bool = False):
+    """Arranca el servidor en un hilo y devuelve (servidor, url base)"""
+    handler = type('Handler', (StubHandler,), {
+        'fixtures': load_fixtures(),
+        'delay': delay_ms / 1000,
+        'slow_ratio': slow_ratio,
+        'slow_delay': slow_ms / 1000,
+        'error_ratio': error_ratio,
+        'validators': validators,
+    })
+    server = StubServer(('127.0.0.1', port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--port', type=int, default=8765)
+    arg_parser.add_argument('--delay-ms', type=float, default=0)
+    arg_parser.add_argument('--slow-ratio', type=float, default=0, help="fracción de respuestas lentas")
+    arg_parser.add_argument('--slow-ms', type=float, default=0, help="retraso extra de las respuestas lentas")
+    arg_parser.add_argument('--error-ratio', type=float, default=0, help="fracción de respuestas 503")
+    arg_parser.add_argument('--validators', action='store_true', help="ETag / Last-Modified y 304")
+    args = arg_parser.parse_args()
+
+    server, base_url = start_stub_server(
+        args.port, args.delay_ms, args.slow_ratio, args.slow_ms, args.error_ratio, args.validators
+    )
+    print(f"🧪 Stub de Uptodown en {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Cache LRU acotado con expiración y ventana stale-while-revalidate
+
+    Cada entrada es fresca durante `ttl` segundos; después sigue sirviéndose
+    como "stale" durante `stale_ttl` segundos más mientras se refresca en
+    segundo plano. Pasado ese tiempo se elimina.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, stale_ttl: float = 0,
+                 purge_interval: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.purge_interval = purge_interval
+        self._data = OrderedDict()
+        self._purge_task = None
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        """¿Hay una entrada utilizable (fresca o stale)? Sin tocar el orden LRU"""
+        entry = self._data.get(key)
+        return entry is not None and time.monotonic() - entry[1] < self.ttl + self.stale_ttl
+
+    def get(self, key):
+        """Devuelve (valor, es_stale) o None si no hay entrada utilizable"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+
+        value, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age >= self.ttl + self.stale_ttl:
+            del self._data[key]
+            return None
+
+        self._data.move_to_end(key)
+        return value, age >= self.ttl
+
+    def peek(self, key) -> bool:
+        """¿Hay una entrada fresca? Sin tocar el orden LRU"""
+        entry = self._data.get(key)
+        return entry is not None and time.monotonic() - entry[1] < self.ttl
+
+    def set(self, key, value, age: float = 0):
+        """Guarda un valor y expulsa las entradas menos usadas si se supera el límite
+
+        `age` permite cargar entradas que ya tenían cierta antigüedad (p. ej. desde disco).
+        """
+        self._data[key] = (value, time.monotonic() - age)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def dump(self):
+        """Entradas utilizables como [clave, valor, antigüedad], de la menos a la más usada"""
+        now = time.monotonic()
+        limit = self.ttl + self.stale_ttl
+        return [[key, value, now - stored_at] for key, (value, stored_at) in self._data.items()
+                if now - stored_at < limit]
+
+    def load(self, entries, elapsed: float = 0):
+        """Carga entradas de dump(); `elapsed` se suma a su antigüedad"""
+        for key, value, age in entries:
+            if age + elapsed < self.ttl + self.stale_ttl:
+                self.set(key, value, age=age + elapsed)
+
+    def purge(self) -> int:
+        """Elimina las entradas caducadas y devuelve cuántas se borraron"""
+        limit = time.monotonic() - (self.ttl + self.stale_ttl)
+        expired = [key for key, (_, stored_at) in self._data.items() if stored_at <= limit]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            removed = self.purge()
+            if removed:
+                logger.info(f"🧹 Cache: {removed} entradas caducadas eliminadas")
+
+    def start_purger(self):
+        """Arranca la purga periódica en el event loop actual"""
+        if self._purge_task is None or self._purge_task.done():
+            self._purge_task = asyncio.get_running_loop().create_task(self._purge_loop())
+
+    def stop_purger(self):
+        if self._purge_task is not None:
+            self._purge_task.cancel()
+            self._purge_task = None
+
+
+class CachedPage:
+    """Validadores HTTP, digest del cuerpo y resultado del parseo de una página"""
+
+    __slots__ = ('etag', 'last_modified', 'digest', 'result')
+
+    def __init__(self, etag, last_modified, digest: bytes, result):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.result = result
+
+    def conditional_headers(self) -> dict:
+        """Cabeceras para preguntar a Uptodown si la página ha cambiado"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """LRU acotado de páginas de Uptodown ya parseadas, sin expiración
+
+    No sirve respuestas por sí mismo: cuando caduca el cache de búsquedas o de
+    descargas, guarda lo necesario para que la petición sea condicional y, si
+    la página no ha cambiado (304 o mismo cuerpo), reutilizar el parseo.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        page = self._data.get(key)
+        if page is not None:
+            self._data.move_to_end(key)
+        return page
+
+    def set(self, key, page: CachedPage):
+        self._data[key] = page
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def dump(self):
+        """Páginas como [clave, etag, last_modified, digest, resultado], de la menos a la más usada"""
+        return [[key, page.etag, page.last_modified, page.digest.hex(), page.result]
+                for key, page in self._data.items()]
+
+    def load(self, entries, elapsed: float = 0):
+        """Carga páginas de dump() (los validadores no caducan: Uptodown decide con el 304)"""
+        for key, etag, last_modified, digest, result in entries:
+            self.set(_as_key(key), CachedPage(etag, last_modified, bytes.fromhex(digest), result))
+
+
+def _as_key(value):
+    """Las tuplas de las claves vuelven de JSON como listas"""
+    if isinstance(value, list):
+        return tuple(_as_key(item) for item in value)
+    return value
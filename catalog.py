@@ -0,0 +1,149 @@
+import heapq
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_PREFIX = 'app:'
+# Botones de /watch y /unwatch (mismo formato corto con el ID de la app)
+WATCH_PREFIX = 'watch:'
+UNWATCH_PREFIX = 'unwatch:'
+
+
+class AppRecord:
+    """Una app conocida. Se comparte entre búsquedas en cache, botones e índice"""
+
+    __slots__ = ('id', 'name', 'url', 'popularity')
+
+    def __init__(self, app_id: int, name: str, url: str, popularity: float = 0.0):
+        self.id = app_id
+        self.name = name
+        self.url = url
+        self.popularity = popularity
+
+    def __repr__(self):
+        return f"AppRecord({self.id}, {self.name!r})"
+
+    @property
+    def callback_data(self) -> str:
+        """callback_data del botón: "app:<id>" cabe siempre en los 64 bytes de Telegram"""
+        return f"{CALLBACK_PREFIX}{self.id}"
+
+
+def parse_callback(data: str, prefix: str = CALLBACK_PREFIX):
+    """ID de app de un callback_data "<prefix><id>", o None si es de otro tipo"""
+    if not data or not data.startswith(prefix):
+        return None
+    try:
+        return int(data[len(prefix):])
+    except ValueError:
+        return None
+
+
+class AppCatalog:
+    """Catálogo central de apps: un único record por URL con un ID numérico
+
+    Los IDs los asigna SQLite, así que sobreviven a reinicios y los botones de
+    mensajes antiguos siguen funcionando. Si el disco falla se usan IDs
+    negativos solo en memoria, que nunca chocan con los de SQLite. En memoria se
+    guardan hasta `max_entries` records; los menos populares se expulsan y se
+    recargan del disco si vuelven a pedirse.
+    """
+
+    def __init__(self, store=None, max_entries: int = 50000):
+        self.store = store
+        self.max_entries = max_entries
+        self._by_id = {}
+        self._by_url = {}
+        self._local_ids = itertools.count(-1, -1)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    async def intern_results(self, results, popularity: float = 1.0):
+        """Registra las apps de una búsqueda y devuelve sus records"""
+        ids = None
+        if self.store is not None:
+            try:
+                ids = await self.store.run(self.store.intern_apps, results, popularity)
+            except Exception as e:
+                logger.warning(f"⚠️ Error guardando catálogo de apps: {e}")
+
+        records = []
+        for position, app in enumerate(results):
+            record = self._by_url.get(app['url'])
+            if record is None:
+                app_id = ids[position] if ids else next(self._local_ids)
+                record = self._add(AppRecord(app_id, app['name'], app['url']))
+            else:
+                record.name = app['name']
+            record.popularity += popularity
+            records.append(record)
+        self._evict()
+        return records
+
+    def peek(self, app_id: int):
+        """Record por ID solo si está en memoria (sin ir al disco)"""
+        return self._by_id.get(app_id)
+
+    async def get(self, app_id: int):
+        """Record por ID (memoria y, si no está, disco) o None"""
+        record = self._by_id.get(app_id)
+        if record is not None or self.store is None or app_id < 0:
+            return record
+        try:
+            row = await self.store.run(self.store.get_app, app_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Error leyendo catálogo de apps: {e}")
+            return None
+        if row is None:
+            return None
+        record = self._add(AppRecord(*row))
+        self._evict()
+        return record
+
+    async def records(self, ids):
+        """Records de una lista de IDs (omitiendo los desconocidos)"""
+        records = [await self.get(app_id) for app_id in ids]
+        return [record for record in records if record is not None]
+
+    def by_url(self, url: str):
+        return self._by_url.get(url)
+
+    async def touch(self, record: AppRecord, popularity: float = 1.0):
+        """Suma popularidad a una app (p. ej. al pulsar su botón de descarga)"""
+        record.popularity += popularity
+        if self.store is None or record.id < 0:
+            return
+        try:
+            await self.store.run(self.store.bump_app, record.id, popularity)
+        except Exception as e:
+            logger.warning(f"⚠️ Error guardando catálogo de apps: {e}")
+
+    async def load(self, limit: int):
+        """Carga del disco las `limit` apps más populares"""
+        if self.store is None:
+            return []
+        return self.add_rows(await self.store.run(self.store.load_apps, limit))
+
+    def add_rows(self, rows):
+        """Records de filas (id, nombre, url, popularidad) del disco, sin sustituir los que ya están en memoria"""
+        records = [self._by_id.get(row[0]) or self._add(AppRecord(*row)) for row in rows]
+        self._evict()
+        return records
+
+    def _add(self, record: AppRecord) -> AppRecord:
+        self._by_id[record.id] = record
+        self._by_url[record.url] = record
+        return record
+
+    def _evict(self):
+        """Expulsa de memoria el 10 % de records menos populares"""
+        if len(self._by_id) <= self.max_entries:
+            return
+        count = len(self._by_id) - int(self.max_entries * 0.9)
+        for record in heapq.nsmallest(count, self._by_id.values(), key=lambda r: r.popularity):
+            if record.id < 0:
+                continue  # solo existen en memoria
+            del self._by_id[record.id]
+            del self._by_url[record.url]
@@ -1,2 +1,126 @@
 # Las configuraciones se cargan desde Secrets de Replit
 # TELEGRAM_BOT_TOKEN = desde Secrets
+import os
+
+UPTODOWN_URL = os.getenv('UPTODOWN_URL', 'https://www.uptodown.com')
+MAX_REQUESTS_PER_MINUTE = 10
+MAX_SEARCH_RESULTS = 8
+CACHE_DURATION = 300
+
+# Recepción de updates: 'polling' (por defecto) o 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+PORT = int(os.getenv('PORT', '8080'))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # URL pública base, p. ej. https://mi-repl.repl.co
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '')  # por defecto se deriva del token
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # por defecto se deriva del token
+# Servidor de la Bot API alternativo (p. ej. un telegram-bot-api propio); vacío = api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
+
+# Arranque rápido: puerto abierto antes de inicializar el bot, servidor de estado en el
+# event loop (sin Flask) e índice de sugerencias cargado en segundo plano
+FAST_START = os.getenv('FAST_START', '1') == '1'
+# Foto del estado caliente (caches, rate limiting, latencias) al apagar y cada SNAPSHOT_INTERVAL s
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH', 'uptodaw_snapshot.json.gz')  # vacío = desactivado
+SNAPSHOT_INTERVAL = float(os.getenv('SNAPSHOT_INTERVAL', '300'))
+SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', '86400'))
+
+# Procesamiento concurrente de updates
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '8'))
+UPDATE_MAX_QUEUE = int(os.getenv('UPDATE_MAX_QUEUE', '100'))
+UPDATE_PRIORITY_STEP = float(os.getenv('UPDATE_PRIORITY_STEP', '5'))  # segundos de ventaja por nivel
+
+# Catálogo de apps (IDs cortos para los botones) e índice para el modo inline
+APP_INDEX_MAX_ENTRIES = int(os.getenv('APP_INDEX_MAX_ENTRIES', '20000'))
+APP_CATALOG_MAX_ENTRIES = int(os.getenv('APP_CATALOG_MAX_ENTRIES', '50000'))  # records en memoria (el disco guarda todos)
+APP_CLICK_POPULARITY = float(os.getenv('APP_CLICK_POPULARITY', '5'))  # un clic pesa más que aparecer en una búsqueda
+INLINE_MAX_RESULTS = int(os.getenv('INLINE_MAX_RESULTS', '10'))
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '30'))
+
+# /multi: varias búsquedas en paralelo
+MULTI_MAX_QUERIES = int(os.getenv('MULTI_MAX_QUERIES', '5'))
+MULTI_CONCURRENCY = int(os.getenv('MULTI_CONCURRENCY', '3'))
+MULTI_RESULTS_PER_QUERY = int(os.getenv('MULTI_RESULTS_PER_QUERY', '3'))
+
+# /watch: avisos de nuevas versiones
+WATCH_INTERVAL = float(os.getenv('WATCH_INTERVAL', '21600'))  # segundos entre comprobaciones de cada app
+WATCH_JITTER = float(os.getenv('WATCH_JITTER', '0.1'))  # fracción del intervalo para repartir las comprobaciones
+WATCH_CONCURRENCY = int(os.getenv('WATCH_CONCURRENCY', '2'))
+WATCH_BUDGET_RESERVE = float(os.getenv('WATCH_BUDGET_RESERVE', '5'))  # tokens de Uptodown que nunca consume
+WATCH_MAX_PER_CHAT = int(os.getenv('WATCH_MAX_PER_CHAT', '20'))
+WATCH_NOTIFY_BATCH = int(os.getenv('WATCH_NOTIFY_BATCH', '25'))  # avisos enviados a la vez
+WATCH_NOTIFY_PAUSE = float(os.getenv('WATCH_NOTIFY_PAUSE', '1'))  # pausa entre lotes (límite de Telegram ~30 msg/s)
+
+# Estado compartido entre workers: 'memory' (un solo proceso), 'sqlite' (varios
+# procesos en la misma máquina) o 'redis' (varias máquinas)
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'memory').lower()
+STATE_SQLITE_PATH = os.getenv('STATE_SQLITE_PATH', 'uptodaw_state.db')
+REDIS_URL = os.getenv('REDIS_URL', '')  # redis://[:password@]host:6379/0
+SHARED_LOCK_TTL = float(os.getenv('SHARED_LOCK_TTL', '30'))  # segundos que un worker puede retener un fetch
+
+# Rate limiting por usuario (token bucket)
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', str(MAX_REQUESTS_PER_MINUTE)))
+RATE_LIMIT_IDLE_TTL = int(os.getenv('RATE_LIMIT_IDLE_TTL', '600'))
+
+# Presupuesto global de peticiones salientes a Uptodown
+UPSTREAM_REQUESTS_PER_MINUTE = int(os.getenv('UPSTREAM_REQUESTS_PER_MINUTE', '120'))
+UPSTREAM_BURST = int(os.getenv('UPSTREAM_BURST', '20'))
+UPSTREAM_MAX_QUEUE = int(os.getenv('UPSTREAM_MAX_QUEUE', '50'))
+UPSTREAM_MAX_WAIT = float(os.getenv('UPSTREAM_MAX_WAIT', '10'))
+
+# Cache de búsquedas en memoria
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '2000'))
+SEARCH_CACHE_STALE_TTL = int(os.getenv('SEARCH_CACHE_STALE_TTL', '900'))
+CACHE_PURGE_INTERVAL = int(os.getenv('CACHE_PURGE_INTERVAL', '60'))
+
+# Cache persistente en disco (búsquedas y enlaces de descarga)
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', 'uptodaw_cache.db')
+DOWNLOAD_CACHE_DURATION = int(os.getenv('DOWNLOAD_CACHE_DURATION', '3600'))
+DOWNLOAD_CACHE_MAX_ENTRIES = int(os.getenv('DOWNLOAD_CACHE_MAX_ENTRIES', '2000'))
+# Sin versión conocida, un file_id de Telegram se reutiliza sin comprobar Uptodown durante este tiempo
+FILE_ID_VERIFY_INTERVAL = int(os.getenv('FILE_ID_VERIFY_INTERVAL', '21600'))
+
+# Prefetch de enlaces de descarga tras mostrar resultados
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', '1') == '1'
+PREFETCH_TOP_N = int(os.getenv('PREFETCH_TOP_N', '3'))
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', '2'))
+# Tokens del presupuesto de Uptodown que el prefetch nunca consume
+PREFETCH_BUDGET_RESERVE = float(os.getenv('PREFETCH_BUDGET_RESERVE', '5'))
+
+# Relay de APKs (cuando Telegram no puede descargar la URL directamente)
+APK_MAX_BYTES = int(os.getenv('APK_MAX_BYTES', str(50 * 1024 * 1024)))  # límite de subida de la Bot API
+APK_RELAY_WORKERS = int(os.getenv('APK_RELAY_WORKERS', '3'))
+APK_CHUNK_SIZE = int(os.getenv('APK_CHUNK_SIZE', str(64 * 1024)))
+APK_SPOOL_DIR = os.getenv('APK_SPOOL_DIR', '')
+APK_DOWNLOAD_TIMEOUT = float(os.getenv('APK_DOWNLOAD_TIMEOUT', '120'))
+TELEGRAM_UPLOAD_TIMEOUT = float(os.getenv('TELEGRAM_UPLOAD_TIMEOUT', '300'))
+
+# Cliente HTTP asíncrono (pool de conexiones keep-alive)
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+SEARCH_TIMEOUT = float(os.getenv('SEARCH_TIMEOUT', '15'))
+DOWNLOAD_PAGE_TIMEOUT = float(os.getenv('DOWNLOAD_PAGE_TIMEOUT', '20'))
+# Páginas ya parseadas cuyos validadores (ETag / Last-Modified) se recuerdan para revalidar
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv('PAGE_CACHE_MAX_ENTRIES', '2000'))
+
+# Resiliencia frente a Uptodown (los timeouts de arriba pasan a ser el máximo por llamada)
+UPSTREAM_MIN_TIMEOUT = float(os.getenv('UPSTREAM_MIN_TIMEOUT', '2'))
+UPSTREAM_TIMEOUT_MULTIPLIER = float(os.getenv('UPSTREAM_TIMEOUT_MULTIPLIER', '3'))  # veces el p99 observado
+UPSTREAM_HEDGE_QUANTILE = float(os.getenv('UPSTREAM_HEDGE_QUANTILE', '0.95'))
+UPSTREAM_HEDGE_RATIO = float(os.getenv('UPSTREAM_HEDGE_RATIO', '0.1'))  # máximo de peticiones duplicadas
+UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', '2'))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv('UPSTREAM_RETRY_BACKOFF', '0.3'))
+CIRCUIT_FAILURES = int(os.getenv('CIRCUIT_FAILURES', '5'))
+CIRCUIT_COOLDOWN = float(os.getenv('CIRCUIT_COOLDOWN', '30'))
+# Con Uptodown caído se sirven búsquedas y enlaces caducados hasta con esta antigüedad extra
+STALE_IF_ERROR_TTL = int(os.getenv('STALE_IF_ERROR_TTL', '86400'))
+
+# Diagnóstico: peticiones lentas y profiler para administradores
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', '3'))  # segundos
+SLOW_LOG_SIZE = int(os.getenv('SLOW_LOG_SIZE', '50'))
+SLOW_LOG_PATH = os.getenv('SLOW_LOG_PATH', '')  # JSONL opcional con el desglose de cada petición lenta
+ADMIN_IDS = {int(user_id) for user_id in os.getenv('ADMIN_IDS', '').split(',') if user_id.strip()}
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', '60'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
@@ -1,30 +1,38 @@
-from flask import Flask
-from threading import Thread
+import asyncio
+import hmac
+import json
+import logging
+import socket
 import time
+from threading import Thread
+from urllib.parse import urlparse
+
+import metrics
+
+logger = logging.getLogger(__name__)
 
-app = Flask('')
+MAX_BODY_BYTES = 1024 * 1024
+IDLE_TIMEOUT = 30
 
-@app.route('/')
-def home():
-    return """
+HOME_TEMPLATE = """
     <!DOCTYPE html>
     <html>
     <head>
         <title>🤖 Bot Uptodown</title>
         <style>
-            body { 
-                font-family: Arial, sans-serif; 
-                text-align: center; 
-                padding: 50px; 
+            body {{
+                font-family: Arial, sans-serif;
+                text-align: center;
+                padding: 50px;
                 background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
                 color: white;
-            }
-            .container {
+            }}
+            .container {{
                 background: rgba(255,255,255,0.1);
                 padding: 30px;
                 border-radius: 15px;
                 backdrop-filter: blur(10px);
-            }
+            }}
         </style>
     </head>
     <body>
@@ -36,13 +44,146 @@ def home():
         </div>
     </body>
     </html>
-    """.format(time=time.strftime("%Y-%m-%d %H:%M:%S"))
+    """
+
+def render_home() -> str:
+    return HOME_TEMPLATE.format(time=time.strftime("%Y-%m-%d %H:%M:%S"))
+
+def create_app():
+    """Servidor Flask para el modo polling (Flask solo se importa si se usa)"""
+    from flask import Flask, Response
+
+    app = Flask('')
 
-def run():
-    app.run(host='0.0.0.0', port=8080)
+    @app.route('/')
+    def home():
+        return render_home()
 
-def keep_alive():
-    server = Thread(target=run)
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
+
+def run(port: int = 8080):
+    create_app().run(host='0.0.0.0', port=port)
+
+def keep_alive(port: int = 8080):
+    server = Thread(target=run, args=(port,))
     server.daemon = True
     server.start()
-    print("🟢 Servidor keep-alive iniciado en puerto 8080")
+    print(f"🟢 Servidor keep-alive iniciado en puerto {port}")
+
+def listen_socket(host: str, port: int) -> socket.socket:
+    """Abre el puerto ya, antes de que exista el event loop
+
+    Las conexiones que lleguen mientras el bot arranca esperan en el backlog
+    del kernel y se atienden en cuanto AsyncKeepAlive empieza a servir.
+    """
+    return socket.create_server((host, port), backlog=128)
+
+
+class AsyncKeepAlive:
+    """Servidor HTTP asíncrono en el mismo event loop que el bot
+
+    Sirve la página de estado, /metrics y, en modo webhook, el endpoint al que
+    Telegram envía las actualizaciones. Sustituye al servidor Flask en su hilo
+    aparte (también en polling con arranque rápido). Con `sock` sirve un
+    socket abierto de antemano con listen_socket().
+    """
+
+    def __init__(self, host: str, port: int, webhook_path: str = None, secret: str = None,
+                 on_update=None, sock: socket.socket = None):
+        self.host = host
+        self.port = port
+        self.sock = sock
+        self.webhook_path = webhook_path
+        self.secret = secret
+        self.on_update = on_update
+        self._server = None
+
+    async def start(self):
+        if self.sock is not None:
+            self._server = await asyncio.start_server(self._handle, sock=self.sock)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"🟢 Servidor web asíncrono iniciado en puerto {self.port}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, 'text/plain', b'Payload too large', keep_alive=False)
+                    break
+                body = await asyncio.wait_for(reader.readexactly(length), IDLE_TIMEOUT) if length else b''
+
+                status, content_type, payload = await self._route(method, urlparse(target).path, headers, body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, content_type, payload, keep_alive, head_only=method == 'HEAD')
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, headers: dict, body: bytes):
+        if method in ('GET', 'HEAD') and path == '/':
+            return 200, 'text/html; charset=utf-8', render_home().encode('utf-8')
+        if method in ('GET', 'HEAD') and path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', metrics.REGISTRY.render().encode('utf-8')
+        if method == 'POST' and self.webhook_path and path == self.webhook_path:
+            return await self._webhook(headers, body)
+        return 404, 'text/plain', b'Not found'
+
+    async def _webhook(self, headers: dict, body: bytes):
+        if self.secret:
+            received = headers.get('x-telegram-bot-api-secret-token', '')
+            if not hmac.compare_digest(received, self.secret):
+                return 403, 'text/plain', b'Forbidden'
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400, 'text/plain', b'Invalid JSON'
+
+        try:
+            await self.on_update(data)
+        except Exception as e:
+            metrics.ERRORS.inc(type=type(e).__name__, where='webhook')
+            logger.error(f"❌ Error encolando update del webhook: {e}")
+            return 500, 'text/plain', b'Error'
+        return 200, 'text/plain', b'OK'
+
+    @staticmethod
+    async def _respond(writer, status: int, content_type: str, payload: bytes, keep_alive: bool = True,
+                       head_only: bool = False):
+        reason = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+                  413: 'Payload Too Large', 500: 'Internal Server Error'}.get(status, 'OK')
+        head = (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + (b'' if head_only else payload))
+        await writer.drain()
@@ -1,29 +1,112 @@
 import os
-import requests
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
-from bs4 import BeautifulSoup
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+)
+from telegram.ext import (
+    Application, CommandHandler, CallbackQueryHandler, ContextTypes, InlineQueryHandler, MessageHandler, filters
+)
+from telegram.error import TelegramError, Forbidden, RetryAfter
 import logging
-import time
 import hashlib
+import signal
+from keep_alive import keep_alive, listen_socket, AsyncKeepAlive
+import asyncio
+import json
 import re
-from urllib.parse import urljoin, urlparse
-import random
-from keep_alive import keep_alive
-
-# Iniciar servidor keep-alive
-keep_alive()
+import time
+from config import (
+    MAX_REQUESTS_PER_MINUTE,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_IDLE_TTL,
+    UPSTREAM_REQUESTS_PER_MINUTE,
+    UPSTREAM_BURST,
+    UPSTREAM_MAX_QUEUE,
+    UPSTREAM_MAX_WAIT,
+    CACHE_DURATION,
+    SEARCH_CACHE_MAX_ENTRIES,
+    SEARCH_CACHE_STALE_TTL,
+    CACHE_PURGE_INTERVAL,
+    CACHE_DB_PATH,
+    DOWNLOAD_CACHE_DURATION,
+    DOWNLOAD_CACHE_MAX_ENTRIES,
+    FILE_ID_VERIFY_INTERVAL,
+    PREFETCH_ENABLED,
+    PREFETCH_TOP_N,
+    PREFETCH_CONCURRENCY,
+    PREFETCH_BUDGET_RESERVE,
+    BOT_MODE,
+    PORT,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    UPDATE_WORKERS,
+    UPDATE_MAX_QUEUE,
+    UPDATE_PRIORITY_STEP,
+    APP_INDEX_MAX_ENTRIES,
+    APP_CATALOG_MAX_ENTRIES,
+    MULTI_MAX_QUERIES,
+    MULTI_CONCURRENCY,
+    MULTI_RESULTS_PER_QUERY,
+    APP_CLICK_POPULARITY,
+    INLINE_MAX_RESULTS,
+    INLINE_CACHE_TIME,
+    STATE_BACKEND,
+    STATE_SQLITE_PATH,
+    REDIS_URL,
+    SHARED_LOCK_TTL,
+    UPSTREAM_MIN_TIMEOUT,
+    UPSTREAM_TIMEOUT_MULTIPLIER,
+    UPSTREAM_HEDGE_QUANTILE,
+    UPSTREAM_HEDGE_RATIO,
+    UPSTREAM_RETRIES,
+    UPSTREAM_RETRY_BACKOFF,
+    CIRCUIT_FAILURES,
+    CIRCUIT_COOLDOWN,
+    STALE_IF_ERROR_TTL,
+    WATCH_INTERVAL,
+    WATCH_JITTER,
+    WATCH_CONCURRENCY,
+    WATCH_BUDGET_RESERVE,
+    WATCH_MAX_PER_CHAT,
+    WATCH_NOTIFY_BATCH,
+    WATCH_NOTIFY_PAUSE,
+    SLOW_REQUEST_THRESHOLD,
+    SLOW_LOG_SIZE,
+    SLOW_LOG_PATH,
+    ADMIN_IDS,
+    PROFILE_DIR,
+    PROFILE_MAX_SECONDS,
+    PROFILE_INTERVAL,
+    TELEGRAM_API_URL,
+    FAST_START,
+    SNAPSHOT_PATH,
+    SNAPSHOT_INTERVAL,
+    SNAPSHOT_MAX_AGE,
+)
+from cache import TTLCache
+from storage import PersistentStore
+from singleflight import SingleFlight
+from rate_limit import UpstreamBudget
+from state import create_backend
+from resilience import Resilience, CircuitBreaker
+from snapshot import Snapshotter
+import metrics
+import tracing
+from tracing import SamplingProfiler
+from metrics import track_handler
+from relay import ApkRelay
+from prefetch import Prefetcher
+from watcher import AppWatcher
+from app_index import AppIndex, tokenize
+from catalog import AppCatalog, parse_callback, WATCH_PREFIX, UNWATCH_PREFIX
+from scheduler import UpdateScheduler, PRIORITY_CHEAP, PRIORITY_CALLBACK, PRIORITY_SCRAPE
+from uptodown import UptodownParser, normalize_query, is_transient
 
 # Configuración
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 if not TOKEN:
     raise Exception("❌ No se ha configurado TELEGRAM_BOT_TOKEN en Secrets")
 
-UPTODOWN_URL = "https://www.uptodown.com"
-MAX_REQUESTS_PER_MINUTE = 10
-MAX_SEARCH_RESULTS = 8
-CACHE_DURATION = 300
-
 # Configurar logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -32,252 +115,621 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Estructuras de datos
-user_requests = {}
-search_cache = {}
-download_cache = {}
-
-class UptodownParser:
-    def __init__(self):
-        self.session = requests.Session()
-        self.user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        ]
-        self.update_headers()
-
-    def update_headers(self):
-        """Actualiza los headers con User-Agent aleatorio"""
-        self.session.headers.update({
-            'User-Agent': random.choice(self.user_agents),
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Cache-Control': 'max-age=0',
-        })
-
-    def validate_url(self, url: str) -> bool:
-        """Valida que la URL sea de Uptodown"""
+# Estado compartido entre procesos (rate limiting, cache y locks de single-flight)
+state = create_backend(
+    STATE_BACKEND,
+    sqlite_path=STATE_SQLITE_PATH,
+    redis_url=REDIS_URL,
+    idle_ttl=RATE_LIMIT_IDLE_TTL,
+    purge_interval=CACHE_PURGE_INTERVAL,
+)
+upstream_budget = UpstreamBudget(
+    per_minute=UPSTREAM_REQUESTS_PER_MINUTE,
+    burst=UPSTREAM_BURST,
+    max_queue=UPSTREAM_MAX_QUEUE,
+    max_wait=UPSTREAM_MAX_WAIT,
+    # Con un backend compartido el presupuesto es global entre workers
+    shared=(lambda: state_take('rate:upstream', UPSTREAM_REQUESTS_PER_MINUTE / 60, UPSTREAM_BURST))
+    if state.shared else None,
+)
+search_cache = TTLCache(
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    ttl=CACHE_DURATION,
+    stale_ttl=SEARCH_CACHE_STALE_TTL,
+    purge_interval=CACHE_PURGE_INTERVAL,
+)
+download_cache = TTLCache(
+    max_entries=DOWNLOAD_CACHE_MAX_ENTRIES,
+    ttl=DOWNLOAD_CACHE_DURATION,
+    purge_interval=CACHE_PURGE_INTERVAL,
+)
+store = PersistentStore(CACHE_DB_PATH, stale_grace=STALE_IF_ERROR_TTL)
+catalog = AppCatalog(store, max_entries=APP_CATALOG_MAX_ENTRIES)
+app_index = AppIndex(max_entries=APP_INDEX_MAX_ENTRIES)
+inflight = SingleFlight(state, lock_ttl=SHARED_LOCK_TTL)
+
+# Protecciones frente a un Uptodown lento o caído
+resilience = Resilience(
+    is_transient,
+    min_timeout=UPSTREAM_MIN_TIMEOUT,
+    timeout_multiplier=UPSTREAM_TIMEOUT_MULTIPLIER,
+    hedge_quantile=UPSTREAM_HEDGE_QUANTILE,
+    hedge_ratio=UPSTREAM_HEDGE_RATIO,
+    retries=UPSTREAM_RETRIES,
+    backoff=UPSTREAM_RETRY_BACKOFF,
+    breaker=CircuitBreaker(failures=CIRCUIT_FAILURES, cooldown=CIRCUIT_COOLDOWN),
+)
+
+# Diagnóstico: trazas de peticiones lentas y profiler bajo demanda (/slow, /profile)
+tracing.configure(SLOW_REQUEST_THRESHOLD, SLOW_LOG_SIZE, SLOW_LOG_PATH)
+profiler = SamplingProfiler(PROFILE_INTERVAL)
+
+# Instancia global del parser
+parser = UptodownParser(budget=upstream_budget, resilience=resilience)
+apk_relay = ApkRelay(parser)
+
+# Estado caliente que sobrevive a los reinicios (Replit reinicia a menudo)
+snapshots = Snapshotter(SNAPSHOT_PATH, interval=SNAPSHOT_INTERVAL, max_age=SNAPSHOT_MAX_AGE)
+snapshots.register('search', search_cache.dump, search_cache.load)
+snapshots.register('download', download_cache.dump, download_cache.load)
+snapshots.register('pages', parser.pages.dump, parser.pages.load)
+# Las latencias no caducan con el tiempo parado: la ventana se restaura tal cual
+snapshots.register('latency', resilience.dump, lambda latencies, elapsed: resilience.load(latencies))
+snapshots.register('budget', upstream_budget.dump, upstream_budget.load)
+if not state.shared:
+    # Con un backend compartido el rate limiting ya vive fuera del proceso
+    snapshots.register('rate_limit', state.dump, state.load)
+
+# Servidor de estado en polling con arranque rápido (se crea en main())
+health_server = None
+
+# Métricas calculadas a partir del estado existente
+metrics.RATE_LIMIT_REJECTIONS.set_function(lambda: upstream_budget.shed, scope='upstream')
+metrics.IN_FLIGHT.set_function(lambda: upstream_budget.waiting, kind='upstream_queue')
+metrics.IN_FLIGHT.set_function(lambda: len(inflight), kind='coalesced_fetches')
+metrics.CACHE_REQUESTS.set_function(lambda: inflight.remote, cache='single_flight', result='remote')
+metrics.CACHE_REQUESTS.set_function(lambda: inflight.started, cache='single_flight', result='started')
+metrics.CACHE_REQUESTS.set_function(lambda: inflight.coalesced, cache='single_flight', result='coalesced')
+metrics.IN_FLIGHT.set_function(lambda: apk_relay.queued, kind='apk_relay_queue')
+metrics.UPSTREAM_EVENTS.set_function(lambda: resilience.hedges, event='hedge')
+metrics.UPSTREAM_EVENTS.set_function(lambda: resilience.hedge_wins, event='hedge_win')
+metrics.UPSTREAM_EVENTS.set_function(lambda: resilience.retried, event='retry')
+metrics.UPSTREAM_EVENTS.set_function(lambda: resilience.breaker.opened, event='circuit_open')
+metrics.UPSTREAM_EVENTS.set_function(lambda: resilience.breaker.rejected, event='fast_fail')
+metrics.CACHE_ENTRIES.set_function(lambda: len(search_cache), cache='search')
+metrics.CACHE_ENTRIES.set_function(lambda: len(download_cache), cache='download')
+metrics.CACHE_ENTRIES.set_function(lambda: len(app_index), cache='app_index')
+metrics.CACHE_ENTRIES.set_function(lambda: len(catalog), cache='catalog')
+metrics.CACHE_ENTRIES.set_function(lambda: len(parser.pages), cache='page')
+metrics.CACHE_ENTRIES.set_function(lambda: len(watcher), cache='watched_apps')
+
+async def reply_text(message, text, **kwargs):
+    """reply_text midiendo la latencia de la API de Telegram"""
+    with metrics.stage('telegram', 'reply_text'):
+        return await message.reply_text(text, **kwargs)
+
+async def edit_message_text(query, text, **kwargs):
+    with metrics.stage('telegram', 'edit_message_text'):
+        return await query.edit_message_text(text, **kwargs)
+
+async def reply_document(message, **kwargs):
+    with metrics.stage('telegram', 'reply_document'):
+        return await message.reply_document(**kwargs)
+
+async def state_take(key: str, rate: float, capacity: float, cost: float = 1) -> float:
+    """Token bucket del backend de estado; si no responde, se deja pasar"""
+    try:
+        return await state.take(key, rate, capacity, cost)
+    except Exception as e:
+        metrics.ERRORS.inc(type=type(e).__name__, where='state')
+        logger.warning(f"⚠️ Backend de estado no disponible ({state.name}): {e}")
+        return 0.0
+
+async def rate_limit_wait(user_id: int, cost: int = 1) -> float:
+    """Rate limiting por usuario: 0 si puede seguir, si no los segundos de espera"""
+    wait = await state_take(f"rate:user:{user_id}", MAX_REQUESTS_PER_MINUTE / 60, RATE_LIMIT_BURST, cost)
+    if wait:
+        metrics.RATE_LIMIT_REJECTIONS.inc(scope='user')
+    return wait
+
+async def shared_get(key: str):
+    """Valor JSON del cache compartido entre workers (None si no hay o no es compartido)"""
+    if not state.shared:
+        return None
+    try:
+        value = await state.get(key)
+    except Exception as e:
+        metrics.ERRORS.inc(type=type(e).__name__, where='state')
+        logger.warning(f"⚠️ Error leyendo estado compartido: {e}")
+        return None
+    return json.loads(value) if value else None
+
+async def shared_set(key: str, value, ttl: float):
+    if not state.shared:
+        return
+    try:
+        await state.set(key, json.dumps(value, ensure_ascii=False).encode(), ttl)
+    except Exception as e:
+        metrics.ERRORS.inc(type=type(e).__name__, where='state')
+        logger.warning(f"⚠️ Error guardando estado compartido: {e}")
+
+def get_cache_key(query: str) -> str:
+    """Genera clave para cache a partir de la búsqueda normalizada"""
+    return hashlib.md5(normalize_query(query).encode()).hexdigest()
+
+# Revalidaciones en segundo plano en curso (clave -> task)
+revalidations = {}
+
+async def get_cached_search(query: str):
+    """Obtiene los records del cache (refrescando en segundo plano si están caducados)"""
+    cache_key = get_cache_key(query)
+    cached = search_cache.get(cache_key)
+    source = 'hit'
+    if cached is None:
+        cached = await load_shared_search(cache_key)
+        source = 'shared'
+    if cached is None:
+        cached = await load_persisted_search(cache_key)
+        source = 'disk'
+    if cached is None:
+        metrics.CACHE_REQUESTS.inc(cache='search', result='miss')
+        return None
+
+    app_ids, stale = cached
+    if stale:
+        source = 'stale'
+        schedule_revalidation(query, cache_key)
+    metrics.CACHE_REQUESTS.inc(cache='search', result=source)
+    return await catalog.records(app_ids)
+
+async def load_shared_search(cache_key: str):
+    """Recupera una búsqueda que guardó otro worker y la sube al cache en memoria
+
+    En el estado compartido se guardan nombre y URL (los IDs del catálogo son
+    locales de cada worker si no comparten disco).
+    """
+    shared = await shared_get(f"search:{cache_key}")
+    if shared is None:
+        return None
+    age = max(0.0, time.time() - shared['stored_at'])
+    app_ids = [record.id for record in await catalog.intern_results(shared['results'], popularity=0)]
+    search_cache.set(cache_key, app_ids, age=age)
+    return app_ids, age >= CACHE_DURATION
+
+async def shared_search(query: str):
+    """Resultado que otro worker acaba de publicar (para el single-flight entre procesos)"""
+    cached = await load_shared_search(get_cache_key(query))
+    return await catalog.records(cached[0]) if cached else None
+
+async def load_persisted_search(cache_key: str):
+    """Recupera una búsqueda del disco y la sube al cache en memoria"""
+    try:
+        persisted = await store.run(store.get_search, cache_key)
+    except Exception as e:
+        logger.warning(f"⚠️ Error leyendo cache persistente: {e}")
+        return None
+    if persisted is None:
+        return None
+
+    app_ids, age = persisted
+    search_cache.set(cache_key, app_ids, age=age)
+    return app_ids, age >= CACHE_DURATION
+
+async def load_stale_search(query: str):
+    """Última búsqueda guardada aunque haya caducado, para cuando Uptodown falla"""
+    try:
+        persisted = await store.run(store.get_search, get_cache_key(query), grace=STALE_IF_ERROR_TTL)
+    except Exception as e:
+        logger.warning(f"⚠️ Error leyendo cache persistente: {e}")
+        return None
+    if not persisted or not persisted[0]:
+        return None
+
+    app_ids, _ = persisted
+    metrics.CACHE_REQUESTS.inc(cache='search', result='stale_if_error')
+    return await catalog.records(app_ids)
+
+async def search_or_stale(query: str):
+    """(records, es_stale): busca en Uptodown y, si falla, sirve la última búsqueda conocida"""
+    try:
+        return await fetch_search(query), False
+    except Exception as e:
+        records = await load_stale_search(query)
+        if not records:
+            raise
+        logger.warning(f"⚠️ Búsqueda servida desde cache caducado ({e})")
+        return records, True
+
+async def set_cached_search(query: str, records):
+    """Guarda en cache (memoria y disco) los IDs de los resultados, no copias"""
+    cache_key = get_cache_key(query)
+    app_ids = [record.id for record in records]
+    search_cache.set(cache_key, app_ids)
+    try:
+        await store.run(store.set_search, cache_key, app_ids, CACHE_DURATION + SEARCH_CACHE_STALE_TTL)
+    except Exception as e:
+        logger.warning(f"⚠️ Error guardando cache persistente: {e}")
+    await shared_set(
+        f"search:{cache_key}",
+        {'results': [{'name': record.name, 'url': record.url} for record in records], 'stored_at': time.time()},
+        CACHE_DURATION + SEARCH_CACHE_STALE_TTL,
+    )
+
+async def load_shared_download(app_url: str):
+    shared = await shared_get(f"download:{app_url}")
+    if shared is None:
+        return None
+    download_cache.set(app_url, shared['info'], age=max(0.0, time.time() - shared['stored_at']))
+    return shared['info']
+
+async def get_cached_download(app_url: str):
+    """Obtiene el enlace de descarga ya resuelto {'url', 'version'} (memoria, otro worker o disco)"""
+    cached = download_cache.get(app_url)
+    if cached is not None:
+        metrics.CACHE_REQUESTS.inc(cache='download', result='hit')
+        return cached[0]
+    info = await load_shared_download(app_url)
+    if info is not None:
+        metrics.CACHE_REQUESTS.inc(cache='download', result='shared')
+        return info
+    try:
+        persisted = await store.run(store.get_download, app_url)
+    except Exception as e:
+        logger.warning(f"⚠️ Error leyendo cache persistente: {e}")
+        persisted = None
+    if persisted is None:
+        metrics.CACHE_REQUESTS.inc(cache='download', result='miss')
+        return None
+
+    info, age = persisted
+    download_cache.set(app_url, info, age=age)
+    metrics.CACHE_REQUESTS.inc(cache='download', result='disk')
+    return info
+
+async def set_cached_download(app_url: str, info: dict):
+    """Guarda un enlace de descarga resuelto (memoria, disco y estado compartido)"""
+    download_cache.set(app_url, info)
+    try:
+        await store.run(store.set_download, app_url, info, DOWNLOAD_CACHE_DURATION)
+    except Exception as e:
+        logger.warning(f"⚠️ Error guardando cache persistente: {e}")
+    await shared_set(f"download:{app_url}", {'info': info, 'stored_at': time.time()}, DOWNLOAD_CACHE_DURATION)
+
+async def fetch_search(query: str):
+    """Busca en Uptodown compartiendo el fetch entre búsquedas idénticas simultáneas"""
+    return await inflight.do(
+        ('search', get_cache_key(query)), search_and_cache, query,
+        lookup=lambda: shared_search(query),
+    )
+
+async def search_and_cache(query: str):
+    results = await parser.search_apps(query)
+    records = await catalog.intern_results(results)
+    await set_cached_search(query, records)
+    app_index.add_records(records)
+    return records
+
+async def resolve_callback(data: str):
+    """(URL, record) de un callback_data: "app:<id>" o la URL de botones antiguos"""
+    app_id = parse_callback(data)
+    if app_id is None:
+        return data, catalog.by_url(data)
+    record = await catalog.get(app_id)
+    return (record.url, record) if record else (None, None)
+
+async def record_app_click(record):
+    """Un clic de descarga hace más popular la app en las sugerencias"""
+    if record is None:
+        return
+    await catalog.touch(record, APP_CLICK_POPULARITY)
+    app_index.changed()
+
+async def load_app_index():
+    """Reconstruye el índice de sugerencias desde el catálogo en disco"""
+    try:
+        app_index.add_records(await catalog.load(APP_INDEX_MAX_ENTRIES))
+    except Exception as e:
+        logger.warning(f"⚠️ Error cargando índice de apps: {e}")
+        return
+    logger.info(f"🗂 Índice de apps cargado: {len(app_index)} apps")
+
+async def load_app_index_deferred(slice_seconds: float = 0.002, batch: int = 20):
+    """Como load_app_index, pero sin retrasar los updates
+
+    La consulta a SQLite va en un hilo y el indexado se hace en rodajas de
+    `slice_seconds`, cediendo el loop entre una y otra: los updates que llegan
+    mientras tanto solo esperan una rodaja.
+    """
+    start = time.perf_counter()
+    try:
+        rows = await store.run(store.load_apps, APP_INDEX_MAX_ENTRIES)
+    except Exception as e:
+        logger.warning(f"⚠️ Error cargando índice de apps: {e}")
+        return
+    position = 0
+    while position < len(rows):
+        deadline = time.perf_counter() + slice_seconds
+        while position < len(rows) and time.perf_counter() < deadline:
+            app_index.add_records(catalog.add_rows(rows[position:position + batch]))
+            position += batch
+        await asyncio.sleep(0)
+    logger.info(f"🗂 Índice de apps cargado en segundo plano: {len(app_index)} apps en {time.perf_counter() - start:.1f} s")
+
+async def resolve_download(app_url: str):
+    """Resuelve {'url', 'version'} usando el cache antes que Uptodown"""
+    info = await get_cached_download(app_url)
+    if info:
+        logger.info(f"✅ Cache hit de descarga para: {app_url}")
+        return info
+
+    try:
+        return await coalesced_download(app_url)
+    except Exception as e:
+        # Con Uptodown caído, un enlace caducado suele seguir sirviendo
         try:
-            parsed = urlparse(url)
-            allowed_domains = ['uptodown.com', 'www.uptodown.com']
-            return parsed.netloc in allowed_domains
+            persisted = await store.run(store.get_download, app_url, grace=STALE_IF_ERROR_TTL)
         except Exception:
-            return False
+            persisted = None
+        if persisted is None:
+            raise
+        metrics.CACHE_REQUESTS.inc(cache='download', result='stale_if_error')
+        logger.warning(f"⚠️ Enlace de {app_url} servido desde cache caducado ({e})")
+        return persisted[0]
 
-    def search_apps(self, query: str):
-        """Busca aplicaciones en Uptodown con múltiples selectors"""
-        try:
-            logger.info(f"🔍 Buscando: {query}")
-            
-            # Limpiar query
-            query = re.sub(r'[^\w\s-]', '', query).strip()
-            if len(query) < 2:
-                raise Exception("Búsqueda demasiado corta")
+async def download_and_cache(app_url: str):
+    info = await parser.get_download_info(app_url)
+    if info:
+        await set_cached_download(app_url, info)
+    return info
 
-            url = f"{UPTODOWN_URL}/search"
-            params = {"q": query}
-            
-            self.update_headers()  # Cambiar User-Agent
-            response = self.session.get(url, params=params, timeout=15)
-            response.raise_for_status()
-            
-            logger.info(f"✅ Página descargada - Status: {response.status_code}")
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            results = []
-            
-            # Múltiples selectors para mayor compatibilidad
-            selectors = [
-                '.app[data-url]',
-                '.app-card',
-                '.item[data-url]',
-                'div[data-url]',
-                '.name a',
-                '.app-name a',
-                'a[href*="/android/"]',
-                '.result-item'
-            ]
-            
-            for selector in selectors:
-                elements = soup.select(selector)
-                logger.info(f"Selector '{selector}' encontró {len(elements)} elementos")
-                
-                for element in elements[:MAX_SEARCH_RESULTS]:
-                    try:
-                        if element.name == 'a':
-                            app_url = element.get('href')
-                            app_name = element.get_text(strip=True)
-                        else:
-                            link = element.find('a')
-                            if link:
-                                app_url = link.get('href')
-                                app_name = link.get_text(strip=True)
-                            else:
-                                app_url = element.get('data-url')
-                                app_name = element.get_text(strip=True)
-                        
-                        if app_url and app_name:
-                            # Asegurar URL completa
-                            if not app_url.startswith('http'):
-                                app_url = urljoin(UPTODOWN_URL, app_url)
-                            
-                            if self.validate_url(app_url) and len(app_name) > 2:
-                                results.append({
-                                    "name": app_name[:100],
-                                    "url": app_url,
-                                    "description": app_name
-                                })
-                                logger.info(f"✅ App encontrada: {app_name}")
-                                
-                                if len(results) >= MAX_SEARCH_RESULTS:
-                                    break
-                    
-                    except Exception as e:
-                        logger.warning(f"Error procesando elemento: {e}")
-                        continue
-                
-                if results:
-                    break
-            
-            # Si no encontramos con selectors, buscar manualmente en enlaces
-            if not results:
-                logger.info("Buscando enlaces manualmente...")
-                all_links = soup.find_all('a', href=True)
-                for link in all_links:
-                    href = link['href']
-                    text = link.get_text(strip=True)
-                    if '/android/' in href and text and len(text) > 2:
-                        if not href.startswith('http'):
-                            href = urljoin(UPTODOWN_URL, href)
-                        
-                        if self.validate_url(href):
-                            results.append({
-                                "name": text[:100],
-                                "url": href,
-                                "description": text
-                            })
-                            if len(results) >= MAX_SEARCH_RESULTS:
-                                break
-            
-            logger.info(f"📊 Total de resultados encontrados: {len(results)}")
-            return results
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Error de red en búsqueda: {e}")
-            raise Exception(f"Error de conexión: {str(e)}")
-        except Exception as e:
-            logger.error(f"❌ Error inesperado en búsqueda: {e}")
-            raise Exception(f"Error en la búsqueda: {str(e)}")
+async def coalesced_download(app_url: str):
+    """Resuelve un enlace en Uptodown compartiendo el fetch entre peticiones simultáneas
+
+    Lo usan los clics, el prefetch y la vigilancia de versiones: si coinciden
+    sobre la misma app, solo sale una petición (también entre workers).
+    """
+    return await inflight.do(
+        ('download', app_url), download_and_cache, app_url,
+        lookup=lambda: load_shared_download(app_url),
+    )
+
+async def has_cached_download(app_url: str) -> bool:
+    """¿Está resuelto ya el enlace? (sin contar en las métricas de cache)"""
+    if download_cache.peek(app_url):
+        return True
+    try:
+        return await store.run(store.get_download, app_url) is not None
+    except Exception:
+        return False
+
+prefetcher = Prefetcher(
+    coalesced_download,
+    has_cached_download,
+    upstream_budget,
+    top_n=PREFETCH_TOP_N,
+    concurrency=PREFETCH_CONCURRENCY,
+    budget_reserve=PREFETCH_BUDGET_RESERVE,
+)
+
+async def poll_watched_app(app_id: int):
+    """Consulta Uptodown (petición condicional) para una app vigilada y refresca su enlace"""
+    record = await catalog.get(app_id)
+    if record is None or not await store.run(store.watchers, app_id):
+        # Sin suscriptores (p. ej. se borraron desde otro worker): se deja de vigilar
+        watcher.unwatch(app_id)
+        return None
+    return await coalesced_download(record.url)
+
+async def claim_watch_check(app_id: int) -> bool:
+    """Con varios workers, solo uno comprueba cada app por intervalo"""
+    try:
+        return await state.lock(f"watch:{app_id}", str(os.getpid()), WATCH_INTERVAL * 0.9)
+    except Exception as e:
+        logger.warning(f"⚠️ Lock de vigilancia no disponible: {e}")
+        return True
+
+async def save_watched_version(app_id: int, version: str):
+    try:
+        await store.run(store.set_watched_version, app_id, version)
+    except Exception as e:
+        logger.warning(f"⚠️ Error guardando versión vigilada: {e}")
+
+async def load_watches():
+    """Programa las comprobaciones de las apps vigiladas guardadas en disco"""
+    try:
+        watcher.load(await store.run(store.watched_apps))
+    except Exception as e:
+        logger.warning(f"⚠️ Error cargando apps vigiladas: {e}")
+        return
+    logger.info(f"👀 Apps vigiladas: {len(watcher)}")
 
-    def get_download_url(self, app_url: str):
-        """Obtiene URL de descarga con múltiples estrategias"""
+def watch_keyboard(record, download: bool = False):
+    buttons = []
+    if download:
+        buttons.append([InlineKeyboardButton("📥 Descargar", callback_data=record.callback_data)])
+    buttons.append([InlineKeyboardButton("🔕 Dejar de vigilar", callback_data=f"{UNWATCH_PREFIX}{record.id}")])
+    return InlineKeyboardMarkup(buttons)
+
+async def send_watch_notice(bot, chat_id: int, record, text: str, document):
+    """Aviso de versión nueva: el APK (URL o file_id) o, si no se puede, un botón de descarga"""
+    with metrics.stage('telegram', 'watch_notice'):
+        if document:
+            return await bot.send_document(
+                chat_id, document=document, filename=f"{record.url.split('/')[-1] or 'aplicacion'}.apk",
+                caption=text, parse_mode='Markdown', reply_markup=watch_keyboard(record),
+            )
+        return await bot.send_message(
+            chat_id, text, parse_mode='Markdown', reply_markup=watch_keyboard(record, download=True)
+        )
+
+async def drop_blocked_chat(chat_id: int):
+    """El usuario bloqueó el bot o salió del grupo: se borran sus suscripciones"""
+    metrics.WATCH_EVENTS.inc(result='unsubscribed')
+    try:
+        await store.run(store.remove_chat_watches, chat_id)
+    except Exception as e:
+        logger.warning(f"⚠️ Error borrando suscripciones de {chat_id}: {e}")
+
+async def notify_watchers(bot, app_id: int, previous, info: dict):
+    """Avisa de una versión nueva a todos los suscriptores, por lotes
+
+    El APK se sube a Telegram una sola vez: el primer envío usa un file_id ya
+    guardado para esta versión o la URL, y el resto reutiliza ese file_id.
+    """
+    record = await catalog.get(app_id)
+    chat_ids = await store.run(store.watchers, app_id)
+    if record is None or not chat_ids:
+        return
+
+    version = info.get('version')
+    text = f"🆕 *Nueva versión de {record.name}*" + (f": v{version}" if version else "")
+    cached = await get_cached_file(record.url)
+    document = cached[0] if cached and version and cached[1] == version else None
+
+    pending = list(chat_ids)
+    # La subida se intenta con un chat tras otro hasta que una funcione
+    while document is None and pending:
+        chat_id = pending.pop(0)
         try:
-            logger.info(f"📥 Obteniendo descarga para: {app_url}")
-            
-            if not self.validate_url(app_url):
-                raise Exception("URL no válida")
+            try:
+                message = await send_watch_notice(bot, chat_id, record, text, info['url'])
+            except RetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                message = await send_watch_notice(bot, chat_id, record, text, info['url'])
+        except Forbidden:
+            await drop_blocked_chat(chat_id)
+            continue
+        except TelegramError as e:
+            # Telegram no pudo descargar el APK: a todos se les manda el botón de descarga
+            logger.warning(f"⚠️ No se pudo enviar el APK de {record.name} a los suscriptores: {e}")
+            pending.insert(0, chat_id)
+            break
+        await remember_file(record.url, version, message)
+        document = message.document.file_id
+        metrics.WATCH_EVENTS.inc(result='notified')
 
-            # Asegurar que tenemos la URL de descarga
-            if not app_url.endswith('/download'):
-                app_url = app_url.rstrip('/') + '/download'
-            
-            self.update_headers()
-            response = self.session.get(app_url, timeout=20)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Múltiples selectors para el botón de descarga
-            download_selectors = [
-                'a[data-url*="download"]',
-                'a.download[href]',
-                'a.button.download',
-                '.download-link',
-                'a[href*="/download/"]',
-                'button[data-url*="download"]',
-                '.download-button a',
-                'a.dl[href]'
-            ]
-            
-            for selector in download_selectors:
-                download_element = soup.select_one(selector)
-                if download_element:
-                    download_url = download_element.get('data-url') or download_element.get('href')
-                    if download_url:
-                        if not download_url.startswith('http'):
-                            download_url = urljoin(UPTODOWN_URL, download_url)
-                        
-                        if self.validate_url(download_url):
-                            logger.info(f"✅ Enlace de descarga encontrado: {download_url}")
-                            return download_url
-            
-            # Buscar manualmente en enlaces que contengan "download"
-            download_links = soup.find_all('a', href=re.compile(r'download', re.I))
-            for link in download_links:
-                href = link.get('href')
-                if href and ('download' in href.lower() or 'apk' in href.lower()):
-                    if not href.startswith('http'):
-                        href = urljoin(UPTODOWN_URL, href)
-                    
-                    if self.validate_url(href):
-                        logger.info(f"✅ Enlace de descarga manual: {href}")
-                        return href
-            
-            logger.error("❌ No se pudo encontrar enlace de descarga")
-            return None
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Error de red en descarga: {e}")
-            raise Exception(f"Error de conexión en descarga: {str(e)}")
-        except Exception as e:
-            logger.error(f"❌ Error inesperado en descarga: {e}")
-            raise Exception(f"Error al obtener descarga: {str(e)}")
+    for start in range(0, len(pending), WATCH_NOTIFY_BATCH):
+        if start:
+            await asyncio.sleep(WATCH_NOTIFY_PAUSE)
+        batch = pending[start:start + WATCH_NOTIFY_BATCH]
+        results = await asyncio.gather(
+            *(send_watch_notice(bot, chat_id, record, text, document) for chat_id in batch),
+            return_exceptions=True,
+        )
+        for chat_id, result in zip(batch, results):
+            if isinstance(result, RetryAfter):
+                await asyncio.sleep(result.retry_after)
+                try:
+                    result = await send_watch_notice(bot, chat_id, record, text, document)
+                except TelegramError as e:
+                    result = e
+            if isinstance(result, Forbidden):
+                await drop_blocked_chat(chat_id)
+            elif isinstance(result, BaseException):
+                metrics.WATCH_EVENTS.inc(result='notify_failed')
+                logger.warning(f"⚠️ Aviso de {record.name} no entregado a {chat_id}: {result}")
+            else:
+                metrics.WATCH_EVENTS.inc(result='notified')
 
-# Instancia global del parser
-parser = UptodownParser()
+    logger.info(f"📣 Nueva versión de {record.name} avisada a {len(chat_ids)} chats")
+    if not await store.run(store.watchers, app_id):
+        watcher.unwatch(app_id)
 
-def check_rate_limit(user_id: int) -> bool:
-    """Verifica rate limiting por usuario"""
-    now = time.time()
-    if user_id not in user_requests:
-        user_requests[user_id] = []
-    
-    # Limpiar requests antiguos
-    user_requests[user_id] = [req_time for req_time in user_requests[user_id] if now - req_time < 60]
-    
-    if len(user_requests[user_id]) >= MAX_REQUESTS_PER_MINUTE:
+watcher = AppWatcher(
+    poll_watched_app,
+    notify_watchers,
+    save_watched_version,
+    budget=upstream_budget,
+    claim=claim_watch_check,
+    interval=WATCH_INTERVAL,
+    jitter=WATCH_JITTER,
+    concurrency=WATCH_CONCURRENCY,
+    budget_reserve=WATCH_BUDGET_RESERVE,
+)
+
+async def get_cached_file(app_url: str):
+    """(file_id, versión, edad) del último APK enviado a Telegram para la app"""
+    try:
+        return await store.run(store.get_telegram_file, app_url)
+    except Exception as e:
+        logger.warning(f"⚠️ Error leyendo file_id guardado: {e}")
+        return None
+
+async def remember_file(app_url: str, version, message):
+    """Guarda el file_id que Telegram asignó al APK subido"""
+    if message is None or message.document is None:
+        return
+    try:
+        await store.run(store.set_telegram_file, app_url, version, message.document.file_id)
+    except Exception as e:
+        logger.warning(f"⚠️ Error guardando file_id: {e}")
+
+async def forget_file(app_url: str):
+    try:
+        await store.run(store.delete_telegram_file, app_url)
+    except Exception as e:
+        logger.warning(f"⚠️ Error borrando file_id: {e}")
+
+def file_is_current(record, info) -> bool:
+    """¿Sigue siendo válido el file_id guardado para la versión actual?"""
+    _, version, age = record
+    if info is not None and info.get('version') and version:
+        return info['version'] == version
+    # Sin versión conocida: se confía en el file_id durante un tiempo limitado
+    return age < FILE_ID_VERIFY_INTERVAL
+
+def document_caption(app_name: str, version) -> str:
+    version_text = f" v{version}" if version else ""
+    return f"📦 *{app_name}*{version_text}\n⬇️ Descarga completada desde Uptodown"
+
+def format_mb(size: int) -> str:
+    return f"{size / (1024 * 1024):.1f} MB"
+
+async def relay_document(query, url: str, filename: str, caption: str):
+    """Descarga el APK por bloques y lo sube a Telegram mostrando el progreso"""
+    async def progress(phase, done, total):
+        if phase == 'queued':
+            text = "⏳ *En cola para descargar el APK...*"
+        elif phase == 'upload':
+            text = f"📤 *Subiendo a Telegram...* ({format_mb(done)})"
+        elif total:
+            text = f"📥 *Descargando APK...* {done * 100 // total}% ({format_mb(done)} de {format_mb(total)})"
+        else:
+            text = f"📥 *Descargando APK...* {format_mb(done)}"
+        try:
+            await edit_message_text(query, text, parse_mode='Markdown')
+        except TelegramError:
+            pass  # el progreso es orientativo
+
+    with tracing.span('relay'):
+        return await apk_relay.relay(
+            url, query.get_bot(), query.message.chat_id, filename, caption, progress=progress
+        )
+
+async def send_by_file_id(message, file_id: str, app_name: str, version) -> bool:
+    """Reenvía un APK ya subido a Telegram sin volver a descargarlo"""
+    try:
+        await reply_document(message, document=file_id, caption=document_caption(app_name, version))
+        return True
+    except TelegramError as e:
+        logger.warning(f"⚠️ file_id no válido para {app_name}: {e}")
         return False
-    
-    user_requests[user_id].append(now)
-    return True
 
-def get_cache_key(query: str) -> str:
-    """Genera clave para cache"""
-    return hashlib.md5(query.lower().encode()).hexdigest()
+def schedule_revalidation(query: str, cache_key: str):
+    """Lanza un refresco de la búsqueda sin bloquear al usuario"""
+    if cache_key in revalidations or resilience.breaker.is_open:
+        return
+    task = asyncio.get_running_loop().create_task(revalidate_search(query))
+    revalidations[cache_key] = task
+    task.add_done_callback(lambda _: revalidations.pop(cache_key, None))
 
-def get_cached_search(query: str):
-    """Obtiene resultados del cache"""
-    cache_key = get_cache_key(query)
-    if cache_key in search_cache:
-        cached_data = search_cache[cache_key]
-        if time.time() - cached_data['timestamp'] < CACHE_DURATION:
-            return cached_data['results']
-    return None
-
-def set_cached_search(query: str, results):
-    """Guarda resultados en cache"""
-    cache_key = get_cache_key(query)
-    search_cache[cache_key] = {
-        'results': results,
-        'timestamp': time.time()
-    }
+async def revalidate_search(query: str):
+    """Refresca una entrada caducada del cache de búsquedas"""
+    try:
+        await fetch_search(query)
+        logger.info(f"♻️ Cache revalidado para: {query}")
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo revalidar '{query}': {e}")
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /start"""
@@ -286,6 +738,9 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 *Comandos disponibles:*
 /search <nombre> - Buscar aplicaciones
+/multi <app1, app2> - Buscar varias a la vez
+/watch <nombre> - Avisarme de versiones nuevas
+/unwatch - Dejar de vigilar una app
 /help - Mostrar ayuda
 /stats - Estadísticas
 
@@ -296,22 +751,22 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 🌐 *Desarrollado para fines educativos*
     """
-    await update.message.reply_text(welcome_text, parse_mode='Markdown')
+    await reply_text(update.message, welcome_text, parse_mode='Markdown')
 
 async def search_app(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador de búsqueda"""
     user_id = update.effective_user.id
     
     # Verificar rate limit
-    if not check_rate_limit(user_id):
-        await update.message.reply_text(
+    if await rate_limit_wait(user_id):
+        await reply_text(update.message, 
             "⏰ *Límite de tasa excedido*\nPor favor espera 1 minuto antes de otra búsqueda.",
             parse_mode='Markdown'
         )
         return
     
     if not context.args:
-        await update.message.reply_text(
+        await reply_text(update.message, 
             "ℹ️ *Uso:* `/search <nombre de la aplicación>`\nEjemplo: `/search whatsapp`",
             parse_mode='Markdown'
         )
@@ -321,20 +776,21 @@ async def search_app(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # Verificar cache primero
-        cached_results = get_cached_search(query)
+        with tracing.span('cache'):
+            cached_results = await get_cached_search(query)
         if cached_results:
             results = cached_results
             cache_msg = " (desde cache)"
             logger.info(f"✅ Cache hit para: {query}")
         else:
-            await update.message.reply_text(f"🔍 *Buscando:* `{query}`...", parse_mode='Markdown')
-            results = parser.search_apps(query)
-            set_cached_search(query, results)
-            cache_msg = ""
+            await reply_text(update.message, f"🔍 *Buscando:* `{query}`...", parse_mode='Markdown')
+            with tracing.span('upstream'):
+                results, stale = await search_or_stale(query)
+            cache_msg = " (desde cache: Uptodown no responde)" if stale else ""
             logger.info(f"✅ Búsqueda completada para: {query}")
 
         if not results:
-            await update.message.reply_text(
+            await reply_text(update.message, 
                 "❌ *No se encontraron resultados*\n\n"
                 "💡 *Sugerencias:*\n"
                 "• Verifica el nombre de la aplicación\n"
@@ -347,26 +803,30 @@ async def search_app(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Crear teclado con resultados
         keyboard = []
         for app in results:
-            button_text = app["name"]
+            button_text = app.name
             if len(button_text) > 30:
                 button_text = button_text[:27] + "..."
-            keyboard.append([InlineKeyboardButton(button_text, callback_data=app["url"])])
+            keyboard.append([InlineKeyboardButton(button_text, callback_data=app.callback_data)])
 
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        await update.message.reply_text(
+        await reply_text(update.message, 
             f"📱 *Resultados para* `{query}`{cache_msg}:\n"
             f"*Encontrados:* {len(results)} aplicaciones\n"
             f"Selecciona una para descargar:",
             reply_markup=reply_markup,
             parse_mode='Markdown'
         )
+        
+        if PREFETCH_ENABLED:
+            prefetcher.schedule(user_id, [app.url for app in results])
 
     except Exception as e:
         error_msg = str(e)
+        metrics.ERRORS.inc(type=type(e).__name__, where='search_app')
         logger.error(f"❌ Error en búsqueda: {error_msg}")
         
-        await update.message.reply_text(
+        await reply_text(update.message, 
             f"😵 *Error en la búsqueda*\n\n"
             f"*Detalles:* {error_msg}\n\n"
             f"💡 *Posibles soluciones:*\n"
@@ -376,38 +836,195 @@ async def search_app(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
 
+def split_queries(text: str):
+    """Búsquedas de /multi separadas por comas, sin repetidas"""
+    queries = []
+    seen = set()
+    for part in re.split(r'[,;\n]', text):
+        query = " ".join(part.split())
+        key = normalize_query(query)
+        if len(key) >= 2 and key not in seen:
+            seen.add(key)
+            queries.append(query)
+    return queries
+
+async def multi_search(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /multi: varias búsquedas en paralelo con un único teclado"""
+    user_id = update.effective_user.id
+    queries = split_queries(update.message.text.partition(' ')[2])
+
+    if not queries:
+        await reply_text(update.message,
+            "ℹ️ *Uso:* `/multi app1, app2, app3`\nEjemplo: `/multi whatsapp, telegram, vlc`",
+            parse_mode='Markdown'
+        )
+        return
+    if len(queries) > MULTI_MAX_QUERIES:
+        await reply_text(update.message,
+            f"⚠️ *Máximo {MULTI_MAX_QUERIES} búsquedas por* `/multi`",
+            parse_mode='Markdown'
+        )
+        return
+
+    try:
+        # Cada búsqueda que no está en memoria cuenta para el rate limit como un
+        # /search. Se mira sin efectos (ni revalidaciones ni métricas) y solo se
+        # resuelve tras pasar el límite.
+        expected_misses = sum(1 for query in queries if get_cache_key(query) not in search_cache)
+        if await rate_limit_wait(user_id, cost=max(1, expected_misses)):
+            await reply_text(update.message,
+                "⏰ *Límite de tasa excedido*\nPor favor espera 1 minuto antes de otra búsqueda.",
+                parse_mode='Markdown'
+            )
+            return
+
+        results = {query: await get_cached_search(query) for query in queries}
+        misses = [query for query in queries if not results[query]]
+
+        if misses:
+            await reply_text(update.message, f"🔍 *Buscando {len(misses)} aplicaciones...*", parse_mode='Markdown')
+
+            limit = asyncio.Semaphore(MULTI_CONCURRENCY)
+
+            async def run(query):
+                async with limit:
+                    records, _ = await search_or_stale(query)
+                    return records
+
+            # La latencia total es la de la búsqueda más lenta, no la suma
+            fetched = await asyncio.gather(*(run(query) for query in misses), return_exceptions=True)
+            results.update(zip(misses, fetched))
+
+        keyboard = []
+        lines = []
+        shown = set()
+        for query in queries:
+            outcome = results[query]
+            if isinstance(outcome, BaseException):
+                metrics.ERRORS.inc(type=type(outcome).__name__, where='multi_search')
+                logger.error(f"❌ Error en búsqueda múltiple '{query}': {outcome}")
+                lines.append(f"• `{query}`: ❌ error")
+                continue
+            if not outcome:
+                lines.append(f"• `{query}`: sin resultados")
+                continue
+
+            cache_msg = "" if query in misses else " (desde cache)"
+            lines.append(f"• `{query}`: {len(outcome)} aplicaciones{cache_msg}")
+            for app in outcome[:MULTI_RESULTS_PER_QUERY]:
+                if app.id in shown:
+                    continue
+                shown.add(app.id)
+                button_text = app.name
+                if len(button_text) > 30:
+                    button_text = button_text[:27] + "..."
+                keyboard.append([InlineKeyboardButton(button_text, callback_data=app.callback_data)])
+
+        summary = "\n".join(lines)
+        if not keyboard:
+            await reply_text(update.message,
+                f"❌ *No se encontraron resultados*\n\n{summary}",
+                parse_mode='Markdown'
+            )
+            return
+
+        await reply_text(update.message,
+            f"📱 *Resultados de {len(queries)} búsquedas:*\n{summary}\n\nSelecciona una para descargar:",
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+
+        if PREFETCH_ENABLED:
+            # El primer resultado de cada búsqueda es el que más se pulsa
+            prefetcher.schedule(user_id, [
+                results[query][0].url for query in queries
+                if results[query] and not isinstance(results[query], BaseException)
+            ])
+
+    except Exception as e:
+        error_msg = str(e)
+        metrics.ERRORS.inc(type=type(e).__name__, where='multi_search')
+        logger.error(f"❌ Error en búsqueda múltiple: {error_msg}")
+        await reply_text(update.message,
+            f"😵 *Error en la búsqueda*\n\n*Detalles:* {error_msg}",
+            parse_mode='Markdown'
+        )
+
 async def handle_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Manejador de botones de descarga"""
     query = update.callback_query
-    app_url = query.data
+    app_url, record = await resolve_callback(query.data)
     user_id = update.effective_user.id
+
+    if app_url is None:
+        await query.answer("⚠️ Resultado caducado, vuelve a buscar la aplicación.", show_alert=True)
+        return
+    
+    wait = await rate_limit_wait(user_id)
+    if wait:
+        await query.answer(f"⏰ Límite de tasa excedido. Espera {int(wait) + 1} s.", show_alert=True)
+        return
     
     await query.answer()
+    await record_app_click(record)
     
     try:
         logger.info(f"🔄 Iniciando descarga para usuario {user_id}: {app_url}")
-        await query.edit_message_text("📥 *Procesando descarga...*", parse_mode='Markdown')
+        await edit_message_text(query, "📥 *Procesando descarga...*", parse_mode='Markdown')
         
-        download_url = parser.get_download_url(app_url)
+        # Obtener nombre del archivo
+        app_name = app_url.split('/')[-1] or "aplicacion"
+        filename = f"{app_name}.apk"
         
-        if download_url:
-            # Obtener nombre del archivo
-            app_name = app_url.split('/')[-1] or "aplicacion"
-            filename = f"{app_name}.apk"
-            
+        with tracing.span('cache'):
+            info = await get_cached_download(app_url)
+            cached_file = await get_cached_file(app_url)
+        if cached_file and not file_is_current(cached_file, info):
+            # Comprobar en Uptodown si la versión ha cambiado desde el último envío
+            if info is None:
+                with tracing.span('resolve'):
+                    info = await resolve_download(app_url)
+            if not file_is_current(cached_file, info):
+                logger.info(f"🆕 Nueva versión de {app_name}: se descarta el file_id guardado")
+                await forget_file(app_url)
+                cached_file = None
+        
+        if cached_file:
+            file_id, version, _ = cached_file
+            if await send_by_file_id(query.message, file_id, app_name, version):
+                metrics.CACHE_REQUESTS.inc(cache='file_id', result='hit')
+                await edit_message_text(query, "✅ *Descarga completada y enviada*")
+                logger.info(f"⚡ APK reenviado por file_id para usuario {user_id}")
+                return
+            await forget_file(app_url)
+        metrics.CACHE_REQUESTS.inc(cache='file_id', result='miss')
+        
+        if info is None:
+            with tracing.span('resolve'):
+                info = await resolve_download(app_url)
+        
+        if info:
+            version = info.get('version')
             logger.info(f"✅ Enviando archivo: {filename}")
             
             # Enviar el documento
-            await query.message.reply_document(
-                document=download_url,
-                filename=filename,
-                caption=f"📦 *{app_name}*\n⬇️ Descarga completada desde Uptodown"
-            )
-            await query.edit_message_text("✅ *Descarga completada y enviada*")
+            caption = document_caption(app_name, version)
+            try:
+                message = await reply_document(query.message, 
+                    document=info['url'],
+                    filename=filename,
+                    caption=caption
+                )
+            except TelegramError as e:
+                # Telegram no pudo descargar la URL: la retransmitimos nosotros
+                logger.warning(f"⚠️ Telegram no pudo usar la URL ({e}), usando relay")
+                message = await relay_document(query, info['url'], filename, caption)
+            await remember_file(app_url, version, message)
+            await edit_message_text(query, "✅ *Descarga completada y enviada*")
             logger.info(f"✅ Descarga enviada exitosamente para usuario {user_id}")
             
         else:
-            await query.edit_message_text(
+            await edit_message_text(query, 
                 "❌ *No se pudo obtener el enlace de descarga*\n\n"
                 "💡 *Posibles causas:*\n"
                 "• La aplicación no está disponible\n"
@@ -419,30 +1036,263 @@ async def handle_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     except Exception as e:
         error_msg = str(e)
+        metrics.ERRORS.inc(type=type(e).__name__, where='handle_button')
         logger.error(f"❌ Error en descarga: {error_msg}")
         
-        await query.edit_message_text(
+        await edit_message_text(query, 
             f"😵 *Error en la descarga*\n\n"
             f"*Detalles:* {error_msg}\n\n"
             f"💡 *Intenta de nuevo más tarde*",
             parse_mode='Markdown'
         )
 
+async def watched_records(chat_id: int):
+    """Records de las apps que vigila un chat"""
+    try:
+        app_ids = await store.run(store.chat_watches, chat_id)
+    except Exception as e:
+        logger.warning(f"⚠️ Error leyendo suscripciones: {e}")
+        return []
+    return await catalog.records(app_ids)
+
+def app_button(record, prefix: str, icon: str):
+    button_text = record.name
+    if len(button_text) > 28:
+        button_text = button_text[:25] + "..."
+    return [InlineKeyboardButton(f"{icon} {button_text}", callback_data=f"{prefix}{record.id}")]
+
+async def watch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /watch: sin argumentos lista las apps vigiladas; con un nombre, busca para elegir"""
+    chat_id = update.effective_chat.id
+    if not context.args:
+        records = await watched_records(chat_id)
+        if not records:
+            await reply_text(update.message,
+                "ℹ️ *Uso:* `/watch <nombre de la aplicación>`\n"
+                "Te avisaré cuando salga una versión nueva. Ejemplo: `/watch whatsapp`",
+                parse_mode='Markdown'
+            )
+            return
+        lines = [
+            f"• {record.name}" + (f" (v{watcher.version(record.id)})" if watcher.version(record.id) else "")
+            for record in records
+        ]
+        await reply_text(update.message,
+            f"👀 *Apps vigiladas ({len(records)}/{WATCH_MAX_PER_CHAT}):*\n" + "\n".join(lines)
+            + "\n\nUsa /unwatch para dejar de vigilar alguna.",
+            parse_mode='Markdown'
+        )
+        return
+
+    wait = await rate_limit_wait(update.effective_user.id)
+    if wait:
+        await reply_text(update.message,
+            "⏰ *Límite de tasa excedido*\nPor favor espera 1 minuto antes de otra búsqueda.",
+            parse_mode='Markdown'
+        )
+        return
+
+    query = " ".join(context.args)
+    try:
+        results = await get_cached_search(query)
+        if not results:
+            results, _ = await search_or_stale(query)
+    except Exception as e:
+        metrics.ERRORS.inc(type=type(e).__name__, where='watch_command')
+        await reply_text(update.message, f"😵 *Error en la búsqueda*\n\n*Detalles:* {e}", parse_mode='Markdown')
+        return
+    if not results:
+        await reply_text(update.message, "❌ *No se encontraron resultados*", parse_mode='Markdown')
+        return
+
+    await reply_text(update.message,
+        f"👀 *¿Qué app quieres vigilar?* (`{query}`)",
+        reply_markup=InlineKeyboardMarkup([app_button(record, WATCH_PREFIX, "👀") for record in results]),
+        parse_mode='Markdown'
+    )
+
+async def unwatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /unwatch: botones con las apps vigiladas (filtradas por nombre si se indica)"""
+    records = await watched_records(update.effective_chat.id)
+    if context.args:
+        words = tokenize(" ".join(context.args))
+        records = [
+            record for record in records
+            if all(any(name_word.startswith(word) for name_word in tokenize(record.name)) for word in words)
+        ]
+    if not records:
+        await reply_text(update.message, "ℹ️ No estás vigilando ninguna app con ese nombre.")
+        return
+    await reply_text(update.message,
+        "🔕 *¿Qué app quieres dejar de vigilar?*",
+        reply_markup=InlineKeyboardMarkup([app_button(record, UNWATCH_PREFIX, "🔕") for record in records]),
+        parse_mode='Markdown'
+    )
+
+async def watch_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Botones de /watch ("watch:<id>") y /unwatch ("unwatch:<id>")"""
+    query = update.callback_query
+    chat_id = update.effective_chat.id
+    subscribe = query.data.startswith(WATCH_PREFIX)
+    app_id = parse_callback(query.data, WATCH_PREFIX if subscribe else UNWATCH_PREFIX)
+    record = await catalog.get(app_id) if app_id is not None else None
+    if record is None:
+        await query.answer("⚠️ Resultado caducado, vuelve a buscar la aplicación.", show_alert=True)
+        return
+
+    if not subscribe:
+        await store.run(store.remove_watch, chat_id, app_id)
+        if not await store.run(store.watchers, app_id):
+            watcher.unwatch(app_id)
+        await query.answer()
+        await edit_message_text(query, f"🔕 Ya no vigilas *{record.name}*", parse_mode='Markdown')
+        return
+
+    watched = await store.run(store.chat_watches, chat_id)
+    if app_id not in watched and len(watched) >= WATCH_MAX_PER_CHAT:
+        await query.answer(f"⚠️ Máximo {WATCH_MAX_PER_CHAT} apps vigiladas. Usa /unwatch.", show_alert=True)
+        return
+    await query.answer()
+
+    # Versión de partida: con ella el primer cambio ya se puede avisar
+    version = watcher.version(app_id)
+    if version is None:
+        try:
+            info = await resolve_download(record.url)
+            version = info.get('version') if info else None
+        except Exception as e:
+            logger.info(f"Sin versión de partida para {record.name}: {e}")
+    await store.run(store.add_watch, chat_id, app_id, version)
+    watcher.watch(app_id, version)
+    version_text = f" (ahora v{version})" if version else ""
+    await edit_message_text(query,
+        f"👀 Vigilando *{record.name}*{version_text}\nTe avisaré cuando salga una versión nueva.",
+        parse_mode='Markdown'
+    )
+
+def format_ms(seconds: float) -> str:
+    return "∞" if seconds == float('inf') else f"{seconds * 1000:.0f} ms"
+
+def latency_lines() -> str:
+    """Resumen de los histogramas de latencia por etapa"""
+    lines = []
+    for labels in metrics.STAGE_SECONDS.label_sets():
+        snapshot = metrics.STAGE_SECONDS.snapshot(**labels)
+        lines.append(
+            f"• `{labels['stage']}/{labels['op']}`: {snapshot['count']} · "
+            f"media {format_ms(snapshot['mean'])} · p95 ≤ {format_ms(snapshot['p95'])}"
+        )
+    return "\n".join(lines) or "• Sin datos todavía"
+
+def upstream_line() -> str:
+    """Estado del circuito y timeouts adaptativos frente a Uptodown"""
+    upstream = resilience.stats()
+    circuit = upstream['state']
+    if resilience.breaker.is_open:
+        circuit += f", reintento en {int(upstream['retry_after']) + 1} s"
+    timeouts = " · ".join(
+        f"{op} {format_ms(timeout)}" for op, timeout in sorted(upstream['timeouts'].items())
+        if timeout != float('inf')
+    ) or "fijos"
+    return (
+        f"circuito {circuit} · timeouts {timeouts} · {upstream['hedges']} hedges "
+        f"({upstream['hedge_wins']} ganados) · {upstream['retries']} reintentos · {upstream['rejected']} cortadas"
+    )
+
+def error_lines() -> str:
+    """Errores más frecuentes por tipo de excepción"""
+    errors = sorted(metrics.ERRORS.samples(), key=lambda item: -item[1])[:3]
+    return "\n".join(f"• `{error_type}` en `{where}`: {count}" for (error_type, where), count in errors) or "• Ninguno"
+
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /stats"""
-    total_users = len(user_requests)
+    total_users = await state.bucket_count()
     cached_searches = len(search_cache)
+    selectors = parser.selector_stats()
+    search_selectors = selectors['search']
+    download_selectors = selectors['download']
     
     stats_text = f"""
 📊 *Estadísticas del Bot*
 
-👥 *Usuarios únicos:* {total_users}
+👥 *Usuarios activos:* {'n/d' if total_users is None else total_users}
 💾 *Búsquedas en cache:* {cached_searches}
-⚡ *Rate Limit:* {MAX_REQUESTS_PER_MINUTE}/minuto
+⚡ *Rate Limit:* {MAX_REQUESTS_PER_MINUTE}/minuto ({int(metrics.RATE_LIMIT_REJECTIONS.value(scope='user'))} rechazadas)
+🗄 *Estado:* `{state.name}` ({inflight.remote} búsquedas resueltas por otro worker)
+🛡 *Uptodown:* {upstream_line()}
+🌐 *Presupuesto Uptodown:* {int(upstream_budget.available)}/{UPSTREAM_BURST} ({upstream_budget.waiting} en cola, {upstream_budget.shed} descartadas)
+
+🎯 *Selectors de búsqueda:* `{search_selectors['order'][0]}` primero ({search_selectors['runs']} parseos, {search_selectors['fallback_hits']} por fallback)
+🎯 *Selectors de descarga:* `{download_selectors['order'][0]}` primero ({download_selectors['runs']} parseos, {download_selectors['fallback_hits']} por fallback)
+
+📈 *Aciertos de cache:* búsquedas {metrics.cache_hit_ratio('search'):.0%} · descargas {metrics.cache_hit_ratio('download'):.0%} · APKs por file\_id {metrics.cache_hit_ratio('file_id'):.0%} · páginas sin reparsear {metrics.cache_hit_ratio('page'):.0%}
+🔄 *En curso:* {int(metrics.IN_FLIGHT.value(kind='handler'))} handlers · {int(metrics.IN_FLIGHT.value(kind='upstream'))} peticiones a Uptodown
+👀 *Vigilancia:* {len(watcher)} apps · {int(metrics.WATCH_EVENTS.value(result='updated'))} versiones nuevas · {int(metrics.WATCH_EVENTS.value(result='notified'))} avisos enviados
+📬 *Cola de updates:* {len(update_scheduler)}/{UPDATE_MAX_QUEUE} ({update_scheduler.rejected} rechazados por saturación)
+
+⏱ *Latencias:*
+{latency_lines()}
+
+🐞 *Errores:*
+{error_lines()}
 
 🛠 *Estado:* ✅ Operativo
     """
-    await update.message.reply_text(stats_text, parse_mode='Markdown')
+    await reply_text(update.message, stats_text, parse_mode='Markdown')
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_IDS
+
+async def slow_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /slow (solo administradores): últimas peticiones lentas con su desglose"""
+    if not is_admin(update.effective_user.id):
+        return
+    traces = tracing.slow_log.latest(5)
+    if not traces:
+        await reply_text(update.message, f"🐢 Ninguna petición ha superado {SLOW_REQUEST_THRESHOLD:g} s")
+        return
+    blocks = []
+    for trace in traces:
+        started = time.strftime('%H:%M:%S', time.localtime(trace.started_at))
+        attrs = " ".join(f"{key}={value}" for key, value in trace.attrs.items())
+        blocks.append(f"{started} {trace.name} {trace.duration * 1000:.0f} ms {attrs}\n{trace.breakdown()}")
+    text = f"🐢 Peticiones lentas (>{SLOW_REQUEST_THRESHOLD:g} s, {tracing.slow_log.recorded} en total):\n\n" + "\n\n".join(blocks)
+    # Sin Markdown: los nombres de los spans llevan guiones bajos
+    await reply_text(update.message, text[:4000])
+
+async def run_profile(message, seconds: int):
+    """Perfila el proceso en segundo plano y envía el resultado al terminar"""
+    path = os.path.join(PROFILE_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+    try:
+        samples, top = await profiler.profile(seconds, path)
+    except Exception as e:
+        await reply_text(message, f"❌ Error en el perfil: {e}")
+        return
+    logger.info(f"🔬 Perfil de {seconds} s guardado en {path} ({samples} muestras)")
+    lines = "\n".join(f"{count * 100 // max(samples, 1)}% {frame}" for frame, count in top)
+    await reply_text(message, f"🔬 Perfil guardado en {path} ({samples} muestras)\n\nFunciones más vistas:\n{lines}")
+    try:
+        with open(path, 'rb') as f:
+            await reply_document(message, document=f, filename=os.path.basename(path))
+    except (OSError, TelegramError) as e:
+        logger.warning(f"⚠️ No se pudo enviar el perfil: {e}")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando /profile [segundos] (solo administradores): perfil por muestreo en formato folded"""
+    if not is_admin(update.effective_user.id):
+        return
+    try:
+        seconds = int(context.args[0]) if context.args else 10
+    except ValueError:
+        await reply_text(update.message, "ℹ️ *Uso:* `/profile <segundos>`", parse_mode='Markdown')
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    if profiler.running:
+        await reply_text(update.message, "⏳ Ya hay un perfil en curso")
+        return
+    await reply_text(update.message, f"🔬 Perfilando durante {seconds} s...")
+    # En segundo plano: el handler no ocupa un worker ni aparece como petición lenta
+    asyncio.get_running_loop().create_task(run_profile(update.message, seconds))
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /help"""
@@ -453,6 +1303,16 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 `/search nombre_app` - Buscar aplicaciones
 Ejemplo: `/search whatsapp`
 
+⌨️ *Modo inline:*
+Escribe `@nombre_del_bot whats` en cualquier chat para ver sugerencias al instante
+
+📚 *Varias a la vez:*
+`/multi whatsapp, telegram, vlc` - Hasta {max_multi} búsquedas en paralelo
+
+👀 *Versiones nuevas:*
+`/watch whatsapp` - Te aviso (con el APK) cuando salga una versión nueva
+`/watch` - Ver tus apps vigiladas · `/unwatch` - Dejar de vigilar
+
 📥 *Cómo descargar:*
 1. Usa `/search` para encontrar apps
 2. Haz clic en el botón de la app
@@ -468,32 +1328,227 @@ Si encuentras errores:
 • Verifica tu conexión
 • Intenta con otra aplicación
 • Espera unos minutos
-    """.format(max_req=MAX_REQUESTS_PER_MINUTE)
+    """.format(max_req=MAX_REQUESTS_PER_MINUTE, max_multi=MULTI_MAX_QUERIES)
     
-    await update.message.reply_text(help_text, parse_mode='Markdown')
+    await reply_text(update.message, help_text, parse_mode='Markdown')
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sugerencias mientras se escribe (@bot whats…) desde el índice local, sin red"""
+    inline = update.inline_query
+    text = inline.query.strip()
+    with metrics.stage('index', 'suggest'):
+        suggestions = app_index.suggest(text, INLINE_MAX_RESULTS)
+
+    # Elegir una sugerencia envía /search y solo entonces se consulta Uptodown
+    results = [
+        InlineQueryResultArticle(
+            id=app.callback_data,
+            title=app.name,
+            description=app.url,
+            input_message_content=InputTextMessageContent(f"/search {app.name}"),
+        )
+        for app in suggestions
+    ]
+    if len(normalize_query(text)) >= 2:
+        results.append(InlineQueryResultArticle(
+            id=hashlib.md5(f"search:{text}".encode()).hexdigest(),
+            title=f"🔍 Buscar «{text[:50]}» en Uptodown",
+            input_message_content=InputTextMessageContent(f"/search {text[:200]}"),
+        ))
+    await inline.answer(results, cache_time=INLINE_CACHE_TIME)
+
+async def search_from_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/search enviado desde el modo inline (el texto puede llegar sin entidad de comando)"""
+    context.args = update.message.text.split()[1:]
+    await search_app(update, context)
+
+def classify_update(update) -> int:
+    """Prioridad de un update: lo que se resuelve sin ir a Uptodown va primero"""
+    if not isinstance(update, Update):
+        return PRIORITY_CHEAP
+    if update.callback_query:
+        if (update.callback_query.data or '').startswith((WATCH_PREFIX, UNWATCH_PREFIX)):
+            return PRIORITY_CHEAP
+        # Solo memoria: clasificar es síncrono y no puede esperar al disco
+        data = update.callback_query.data or ''
+        app_id = parse_callback(data)
+        if app_id is None:
+            record = catalog.by_url(data)
+        else:
+            record = catalog.peek(app_id)
+        if record is not None and download_cache.peek(record.url):
+            return PRIORITY_CHEAP
+        return PRIORITY_CALLBACK
+    text = update.message.text if update.message and update.message.text else ''
+    command, _, query = text.partition(' ')
+    command = command.split('@')[0]
+    if command == '/multi':
+        queries = split_queries(query)
+    elif command in ('/search', '/watch') and query.strip():
+        queries = [query]
+    else:
+        return PRIORITY_CHEAP
+    if all(search_cache.peek(get_cache_key(query)) for query in queries):
+        return PRIORITY_CHEAP
+    return PRIORITY_SCRAPE
+
+async def reply_busy(update):
+    """Respuesta inmediata cuando la cola de updates está llena"""
+    if not isinstance(update, Update):
+        return
+    if update.callback_query:
+        await update.callback_query.answer("⏳ Bot saturado, reintenta en unos segundos.", show_alert=True)
+    elif update.effective_message:
+        await reply_text(update.effective_message,
+            "⏳ *Bot saturado*\nHay muchas peticiones en cola, reintenta en unos segundos.",
+            parse_mode='Markdown'
+        )
+
+update_scheduler = UpdateScheduler(
+    workers=UPDATE_WORKERS,
+    max_queue=UPDATE_MAX_QUEUE,
+    classify=classify_update,
+    on_busy=reply_busy,
+    priority_step=UPDATE_PRIORITY_STEP,
+)
+metrics.IN_FLIGHT.set_function(lambda: len(update_scheduler), kind='update_queue')
+metrics.RATE_LIMIT_REJECTIONS.set_function(lambda: update_scheduler.rejected, scope='busy')
+
+async def post_init(application: Application):
+    """Arranca las tareas de fondo una vez creado el event loop"""
+    if health_server is not None:
+        await health_server.start()
+    snapshots.restore()
+    search_cache.start_purger()
+    download_cache.start_purger()
+    state.start()
+    if FAST_START:
+        # Las sugerencias inline van llenándose mientras el bot ya responde
+        asyncio.get_running_loop().create_task(load_app_index_deferred())
+    else:
+        await load_app_index()
+    await load_watches()
+    watcher.start(application.bot)
+    snapshots.start()
+
+async def post_shutdown(application: Application):
+    """Libera el pool de conexiones HTTP al apagar el bot"""
+    prefetcher.cancel_all()
+    watcher.stop()
+    snapshots.stop()
+    snapshots.save()
+    search_cache.stop_purger()
+    download_cache.stop_purger()
+    await parser.close()
+    await apk_relay.close()
+    store.close()
+    await state.close()
+    if health_server is not None:
+        await health_server.stop()
+
+def webhook_settings():
+    """Ruta y secreto del webhook (derivados del token si no se configuran)"""
+    digest = hashlib.sha256(TOKEN.encode()).hexdigest()
+    path = WEBHOOK_PATH or f"/telegram/{digest[:24]}"
+    if not path.startswith('/'):
+        path = '/' + path
+    secret = WEBHOOK_SECRET or digest[24:56]
+    return path, secret
+
+async def run_webhook(application: Application):
+    """Modo webhook: Telegram empuja los updates a un servidor en este mismo event loop"""
+    if not WEBHOOK_URL:
+        raise Exception("❌ BOT_MODE=webhook requiere configurar WEBHOOK_URL")
+
+    path, secret = webhook_settings()
+
+    async def on_update(data: dict):
+        await application.update_queue.put(Update.de_json(data, application.bot))
+
+    server = AsyncKeepAlive('0.0.0.0', PORT, webhook_path=path, secret=secret, on_update=on_update)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    if FAST_START:
+        # La página de estado responde mientras se inicializa el bot; los updates que
+        # lleguen antes de start() esperan en la cola (el webhook aún no está registrado)
+        await server.start()
+    async with application:
+        await post_init(application)
+        await application.start()
+        if not FAST_START:
+            await server.start()
+        await application.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip('/') + path,
+            secret_token=secret,
+            allowed_updates=Update.ALL_TYPES,
+        )
+        logger.info(f"🪝 Webhook registrado en {WEBHOOK_URL.rstrip('/')}/...")
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            await post_shutdown(application)
 
 def main():
     """Función principal"""
+    global health_server
     try:
+        if FAST_START and BOT_MODE != 'webhook':
+            # El puerto queda abierto ya; se sirve en cuanto arranca el event loop
+            health_server = AsyncKeepAlive('0.0.0.0', PORT, sock=listen_socket('0.0.0.0', PORT))
+
         # Crear aplicación de Telegram
-        application = Application.builder().token(TOKEN).build()
+        builder = Application.builder().token(TOKEN)
+        if TELEGRAM_API_URL:
+            builder = builder.base_url(f"{TELEGRAM_API_URL.rstrip('/')}/bot").base_file_url(
+                f"{TELEGRAM_API_URL.rstrip('/')}/file/bot"
+            )
+        application = (
+            builder
+            .concurrent_updates(update_scheduler)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
         
         # Añadir handlers
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("search", search_app))
-        application.add_handler(CommandHandler("stats", stats_command))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CallbackQueryHandler(handle_button))
+        application.add_handler(CommandHandler("start", track_handler(start)))
+        application.add_handler(CommandHandler("search", track_handler(search_app)))
+        application.add_handler(CommandHandler("multi", track_handler(multi_search)))
+        application.add_handler(CommandHandler("stats", track_handler(stats_command)))
+        application.add_handler(CommandHandler("help", track_handler(help_command)))
+        application.add_handler(CommandHandler("watch", track_handler(watch_command)))
+        application.add_handler(CommandHandler("unwatch", track_handler(unwatch_command)))
+        application.add_handler(CommandHandler("slow", track_handler(slow_command)))
+        application.add_handler(CommandHandler("profile", track_handler(profile_command)))
+        application.add_handler(CallbackQueryHandler(
+            track_handler(watch_button), pattern=f"^({WATCH_PREFIX}|{UNWATCH_PREFIX})"
+        ))
+        application.add_handler(CallbackQueryHandler(track_handler(handle_button)))
+        application.add_handler(InlineQueryHandler(track_handler(inline_query)))
+        application.add_handler(MessageHandler(
+            filters.Regex(r'^/search(@\w+)?\s+\S') & ~filters.COMMAND, track_handler(search_from_text)
+        ))
         
         # Iniciar bot
         logger.info("🤖 Iniciando Bot Uptodown en Replit...")
         print("=" * 50)
         print("🚀 BOT UPTODOWN INICIADO")
-        print("🌐 Keep-alive activo")
+        print(f"🌐 Modo: {BOT_MODE}")
         print("📱 Busca tu bot en Telegram y envía /start")
         print("=" * 50)
         
-        application.run_polling()
+        if BOT_MODE == 'webhook':
+            asyncio.run(run_webhook(application))
+        else:
+            if health_server is None:
+                # Iniciar servidor keep-alive
+                keep_alive(PORT)
+            application.run_polling()
         
     except Exception as e:
         logger.critical(f"❌ Error crítico al iniciar bot: {e}")
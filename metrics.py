@@ -0,0 +1,273 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+import tracing
+
+# Métricas en formato de exposición de Prometheus, sin dependencias externas.
+# Se actualizan desde el event loop y se leen desde el servidor keep-alive,
+# por eso cada métrica protege su estado con un lock.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._functions = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def set_function(self, function, **labels):
+        """El valor se calcula al exportar (útil para contadores que ya existen)"""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def value(self, **labels):
+        key = self._key(labels)
+        with self._lock:
+            function = self._functions.get(key)
+            if function is None:
+                return self._values.get(key, 0)
+        return function()
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            values[key] = function()
+        return sorted(values.items())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.samples():
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            state['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Context manager que observa la duración del bloque (también con await dentro)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels) -> dict:
+        """count, media y percentiles aproximados (límite superior del bucket)"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            if state is None:
+                return {'count': 0, 'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+            counts = list(state['counts'])
+            total, count = state['sum'], state['count']
+
+        def quantile(q):
+            target = q * count
+            running = 0
+            for index, bucket_count in enumerate(counts):
+                running += bucket_count
+                if running >= target:
+                    return self.buckets[index] if index < len(self.buckets) else float('inf')
+            return float('inf')
+
+        return {
+            'count': count,
+            'mean': total / count,
+            'p50': quantile(0.5),
+            'p95': quantile(0.95),
+            'p99': quantile(0.99),
+        }
+
+    def label_sets(self):
+        with self._lock:
+            return [dict(zip(self.label_names, key)) for key in sorted(self._values)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state['counts']))) for key, state in self._values.items())
+        for key, state in items:
+            running = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), state['counts']):
+                running += bucket_count
+                labels = _format_labels(self.label_names, key, ('le', _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {running}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'uptodaw_stage_seconds', "Latencia por etapa (fetch, parse, telegram)", labels=('stage', 'op')
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'uptodaw_cache_requests_total', "Consultas al cache por resultado", labels=('cache', 'result')
+))
+CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    'uptodaw_cache_hit_ratio', "Proporción de consultas servidas desde cache", labels=('cache',)
+))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    'uptodaw_cache_entries', "Entradas en memoria por cache", labels=('cache',)
+))
+RATE_LIMIT_REJECTIONS = REGISTRY.register(Counter(
+    'uptodaw_rate_limit_rejections_total', "Peticiones rechazadas por rate limiting", labels=('scope',)
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'uptodaw_in_flight_requests', "Peticiones en curso", labels=('kind',)
+))
+PREFETCHES = REGISTRY.register(Counter(
+    'uptodaw_prefetch_total', "Enlaces de descarga precargados por resultado", labels=('result',)
+))
+UPSTREAM_EVENTS = REGISTRY.register(Counter(
+    'uptodaw_upstream_events_total', "Hedges, reintentos y aperturas del circuito frente a Uptodown", labels=('event',)
+))
+WATCH_EVENTS = REGISTRY.register(Counter(
+    'uptodaw_watch_events_total', "Comprobaciones y avisos de apps vigiladas por resultado", labels=('result',)
+))
+ERRORS = REGISTRY.register(Counter(
+    'uptodaw_errors_total', "Errores por tipo de excepción", labels=('type', 'where')
+))
+
+
+def cache_hit_ratio(cache: str) -> float:
+    """Aciertos (frescos, stale o desde disco) sobre el total de consultas"""
+    results = {labels[1]: value for labels, value in CACHE_REQUESTS.samples() if labels[0] == cache}
+    # stale_if_error no es otra consulta: se anota tras el miss de la misma petición
+    results.pop('stale_if_error', None)
+    total = sum(results.values())
+    if not total:
+        return 0.0
+    return (total - results.get('miss', 0)) / total
+
+
+for _cache in ('search', 'download', 'file_id', 'page'):
+    CACHE_HIT_RATIO.set_function(functools.partial(cache_hit_ratio, _cache), cache=_cache)
+
+
+@contextmanager
+def stage(stage: str, op: str):
+    """Mide una etapa en el histograma de latencias y como span de la traza en curso"""
+    with STAGE_SECONDS.time(stage=stage, op=op), tracing.span(f"{stage}/{op}"):
+        yield
+
+
+def _describe_update(update) -> dict:
+    """Quién y qué pidió, para identificar una traza lenta"""
+    attrs = {}
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        attrs['user'] = user.id
+    message = getattr(update, 'message', None)
+    callback = getattr(update, 'callback_query', None)
+    if message is not None and message.text:
+        attrs['input'] = message.text[:64]
+    elif callback is not None and callback.data:
+        attrs['input'] = callback.data[:64]
+    return attrs
+
+
+def track_handler(handler):
+    """Decora un handler de Telegram: cuenta peticiones en curso, errores no capturados y abre su traza"""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        IN_FLIGHT.inc(kind='handler')
+        try:
+            with tracing.trace(handler.__name__, **_describe_update(update)):
+                return await handler(update, context)
+        except Exception as e:
+            ERRORS.inc(type=type(e).__name__, where=handler.__name__)
+            raise
+        finally:
+            IN_FLIGHT.dec(kind='handler')
+    return wrapper
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+from metrics import PREFETCHES
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Resuelve en segundo plano los enlaces de descarga de los resultados mostrados
+
+    Tras una búsqueda, los primeros `top_n` resultados se resuelven en orden de
+    prioridad (el primero antes), de uno en uno por búsqueda y con un máximo
+    global de `concurrency` a la vez. Solo se usa el presupuesto de Uptodown que
+    sobra por encima de `budget_reserve`, que queda para el tráfico de usuarios.
+    Una nueva búsqueda del mismo usuario cancela su prefetch anterior.
+    `fetch(url)` e `is_cached(url)` son corrutinas.
+    """
+
+    def __init__(self, fetch, is_cached, budget, top_n: int = 3, concurrency: int = 2,
+                 budget_reserve: float = 5):
+        self.fetch = fetch
+        self.is_cached = is_cached
+        self.budget = budget
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.budget_reserve = budget_reserve
+        self._slots = None
+        self._tasks = {}
+
+    def __len__(self):
+        return len(self._tasks)
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._slots
+
+    def schedule(self, owner, app_urls):
+        """Programa el prefetch de los resultados mostrados a `owner`"""
+        self.cancel(owner)
+        pending = app_urls[:self.top_n]
+        if not pending:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._run(pending))
+        self._tasks[owner] = task
+        task.add_done_callback(lambda t: self._forget(owner, t))
+
+    def _forget(self, owner, task):
+        if self._tasks.get(owner) is task:
+            del self._tasks[owner]
+
+    def cancel(self, owner):
+        task = self._tasks.pop(owner, None)
+        if task is not None:
+            task.cancel()
+
+    def cancel_all(self):
+        for owner in list(self._tasks):
+            self.cancel(owner)
+
+    async def _run(self, app_urls):
+        for app_url in app_urls:
+            # Ya resuelto, o resuelto mientras tanto (clic del usuario u otro prefetch)
+            if await self.is_cached(app_url):
+                PREFETCHES.inc(result='cached')
+                continue
+            if self.budget is not None and self.budget.available < self.budget_reserve + 1:
+                PREFETCHES.inc(len(app_urls) - app_urls.index(app_url), result='skipped_budget')
+                return
+
+            async with self.slots:
+                try:
+                    await self.fetch(app_url)
+                    PREFETCHES.inc(result='fetched')
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    PREFETCHES.inc(result='error')
+                    logger.info(f"Prefetch fallido para {app_url}: {e}")
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+
+class UpstreamBusy(Exception):
+    """El presupuesto global de peticiones a Uptodown está agotado"""
+
+    def __init__(self):
+        super().__init__("Uptodown está recibiendo demasiadas peticiones, inténtalo en unos segundos")
+
+
+class TokenBucketLimiter:
+    """Rate limiting por usuario con token buckets de coste O(1)
+
+    El estado de cada usuario es una tupla (tokens, última actualización).
+    Un bucket inactivo durante `capacity / rate` segundos vuelve a estar lleno,
+    así que borrarlo no cambia el resultado: quien lo usa llama a `purge_idle()`
+    periódicamente para expulsar a los usuarios inactivos sin perder precisión.
+    """
+
+    def __init__(self, per_minute: float, burst: int, idle_ttl: float = 600):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.idle_ttl = max(idle_ttl, burst / self.rate)
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def allow(self, key, cost: float = 1) -> bool:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+        if tokens < cost:
+            self._buckets[key] = (tokens, now)
+            return False
+        self._buckets[key] = (tokens - cost, now)
+        return True
+
+    def retry_after(self, key, cost: float = 1) -> float:
+        """Segundos hasta que `key` vuelva a tener `cost` tokens"""
+        if key not in self._buckets:
+            return 0.0
+        tokens, updated = self._buckets[key]
+        tokens = min(self.capacity, tokens + (time.monotonic() - updated) * self.rate)
+        return max(0.0, (cost - tokens) / self.rate)
+
+    def dump(self):
+        """Buckets como [clave, tokens, segundos desde su última actualización]"""
+        now = time.monotonic()
+        return [[key, tokens, now - updated] for key, (tokens, updated) in self._buckets.items()]
+
+    def load(self, entries, elapsed: float = 0):
+        """Carga buckets de dump(); los que ya estarían llenos no hace falta cargarlos"""
+        now = time.monotonic()
+        for key, tokens, idle in entries:
+            idle += elapsed
+            if idle < self.idle_ttl:
+                self._buckets[key] = (tokens, now - idle)
+
+    def purge_idle(self) -> int:
+        """Expulsa los buckets sin actividad (que ya estarían llenos)"""
+        limit = time.monotonic() - self.idle_ttl
+        idle = [key for key, (_, updated) in self._buckets.items() if updated <= limit]
+        for key in idle:
+            del self._buckets[key]
+        return len(idle)
+
+
+class UpstreamBudget:
+    """Token bucket global para las peticiones salientes a Uptodown
+
+    `acquire()` reserva un token: si no hay, la petición espera su turno en
+    orden de llegada. Si la cola supera `max_queue` o la espera superaría
+    `max_wait` segundos, la petición se descarta con UpstreamBusy.
+
+    Con varios procesos, `shared` es una corrutina que toma un token del
+    bucket compartido y devuelve los segundos de espera (0 = concedido), de
+    modo que el presupuesto es global y no se multiplica por cada worker.
+    """
+
+    def __init__(self, per_minute: float, burst: int, max_queue: int, max_wait: float,
+                 shared=None):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self.shared = shared
+        self.waiting = 0
+        self.shed = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def dump(self) -> dict:
+        # Las reservas en cola (saldo negativo) no sobreviven a un reinicio
+        return {'tokens': max(0.0, self.available)}
+
+    def load(self, data: dict, elapsed: float = 0):
+        """Restaura el saldo: un reinicio no regala una ráfaga completa contra Uptodown"""
+        self._tokens = min(self.capacity, data['tokens'] + elapsed * self.rate)
+        self._updated = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        """Consume un token solo si hay uno disponible ya (nunca espera)"""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self, timeout: float = None):
+        """Reserva un token esperando como mucho `timeout` segundos (y nunca más de `max_wait`)"""
+        max_wait = self.max_wait if timeout is None else min(self.max_wait, timeout)
+        deadline = time.monotonic() + max_wait
+        await self._acquire_local(max_wait)
+        if self.shared is not None:
+            await self._acquire_shared(deadline)
+
+    async def _acquire_local(self, max_wait: float):
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return
+
+        # Reserva: el saldo negativo representa la cola de peticiones en espera
+        wait = (1 - self._tokens) / self.rate
+        if self.waiting >= self.max_queue or wait > max_wait:
+            self.shed += 1
+            raise UpstreamBusy()
+
+        self._tokens -= 1
+        self.waiting += 1
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self._tokens += 1  # devuelve la reserva
+            raise
+        finally:
+            self.waiting -= 1
+
+    async def _acquire_shared(self, deadline: float):
+        self.waiting += 1
+        try:
+            while True:
+                wait = await self.shared()
+                if not wait:
+                    return
+                if time.monotonic() + wait > deadline:
+                    self.shed += 1
+                    raise UpstreamBusy()
+                await asyncio.sleep(wait)
+        finally:
+            self.waiting -= 1
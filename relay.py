@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+from telegram import Message
+from telegram.error import TelegramError
+
+from config import (
+    APK_MAX_BYTES,
+    APK_RELAY_WORKERS,
+    APK_CHUNK_SIZE,
+    APK_SPOOL_DIR,
+    APK_DOWNLOAD_TIMEOUT,
+    TELEGRAM_UPLOAD_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+)
+from metrics import stage, IN_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+APK_MIME_TYPE = 'application/vnd.android.package-archive'
+
+
+class ApkTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"El APK supera el límite de {limit // (1024 * 1024)} MB")
+
+
+class ApkRelay:
+    """Descarga APKs de Uptodown a disco y los sube a Telegram en streaming
+
+    Se usa cuando Telegram no puede descargar la URL por sí mismo. El APK se
+    copia por bloques a un fichero temporal y se sube por bloques con una
+    petición multipart propia (python-telegram-bot cargaría el fichero entero
+    en memoria), así que la memoria no depende del tamaño del APK. Como mucho
+    `workers` relays se ejecutan a la vez; el resto espera turno.
+    """
+
+    def __init__(self, parser, max_bytes: int = APK_MAX_BYTES, workers: int = APK_RELAY_WORKERS,
+                 chunk_size: int = APK_CHUNK_SIZE, spool_dir: str = APK_SPOOL_DIR,
+                 progress_interval: float = 2.0):
+        self.parser = parser
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.spool_dir = spool_dir or None
+        self.progress_interval = progress_interval
+        self._slots = None
+        self._telegram_client = None
+        self.queued = 0
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    @property
+    def telegram_client(self) -> httpx.AsyncClient:
+        if self._telegram_client is None or self._telegram_client.is_closed:
+            self._telegram_client = httpx.AsyncClient(timeout=httpx.Timeout(
+                TELEGRAM_UPLOAD_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT
+            ))
+        return self._telegram_client
+
+    async def close(self):
+        if self._telegram_client is not None:
+            await self._telegram_client.aclose()
+            self._telegram_client = None
+
+    async def relay(self, url: str, bot, chat_id, filename: str, caption: str, progress=None) -> Message:
+        """Descarga `url` y la envía como documento; `progress(fase, hecho, total)` informa del avance"""
+        self.queued += 1
+        try:
+            if self.slots.locked() and progress:
+                await progress('queued', 0, None)
+            await self.slots.acquire()
+        finally:
+            self.queued -= 1
+
+        IN_FLIGHT.inc(kind='apk_relay')
+        try:
+            path = await self.spool(url, progress)
+            try:
+                if progress:
+                    await progress('upload', os.path.getsize(path), None)
+                with stage('telegram', 'upload_document'):
+                    return await self.upload(bot, chat_id, path, filename, caption)
+            finally:
+                os.unlink(path)
+        finally:
+            IN_FLIGHT.dec(kind='apk_relay')
+            self.slots.release()
+
+    async def spool(self, url: str, progress=None) -> str:
+        """Copia el APK a un fichero temporal por bloques y devuelve su ruta"""
+        if self.parser.budget is not None:
+            await self.parser.budget.acquire()
+
+        spool = tempfile.NamedTemporaryFile(prefix='uptodaw-', suffix='.apk', dir=self.spool_dir, delete=False)
+        try:
+            with stage('fetch', 'apk'):
+                async with self.parser.client.stream(
+                    'GET', url, headers=self.parser.random_headers(),
+                    timeout=httpx.Timeout(APK_DOWNLOAD_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                ) as response:
+                    response.raise_for_status()
+                    if response.headers.get('Content-Type', '').startswith('text/html'):
+                        raise Exception("Uptodown devolvió una página en lugar del APK")
+
+                    total = int(response.headers.get('Content-Length') or 0) or None
+                    if total and total > self.max_bytes:
+                        raise ApkTooLarge(self.max_bytes)
+
+                    done = 0
+                    last_report = time.monotonic()
+                    async for chunk in response.aiter_bytes(self.chunk_size):
+                        done += len(chunk)
+                        if done > self.max_bytes:
+                            raise ApkTooLarge(self.max_bytes)
+                        spool.write(chunk)
+                        if progress and time.monotonic() - last_report >= self.progress_interval:
+                            last_report = time.monotonic()
+                            await progress('download', done, total)
+            spool.close()
+            logger.info(f"💾 APK en disco: {done / (1024 * 1024):.1f} MB")
+            return spool.name
+        except BaseException:
+            spool.close()
+            os.unlink(spool.name)
+            raise
+
+    async def upload(self, bot, chat_id, path: str, filename: str, caption: str) -> Message:
+        """sendDocument multipart leyendo el fichero por bloques"""
+        with open(path, 'rb') as document:
+            response = await self.telegram_client.post(
+                f"{bot.base_url}/sendDocument",
+                data={'chat_id': str(chat_id), 'caption': caption},
+                files={'document': (filename, document, APK_MIME_TYPE)},
+            )
+        payload = response.json()
+        if not payload.get('ok'):
+            raise TelegramError(payload.get('description', f"HTTP {response.status_code}"))
+        return Message.de_json(payload['result'], bot)
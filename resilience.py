@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpen(Exception):
+    """Uptodown está degradado y el circuito corta las peticiones sin esperar"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Uptodown no responde ahora mismo, inténtalo en {int(retry_after) + 1} s")
+
+
+class LatencyWindow:
+    """Últimas `size` latencias observadas para calcular percentiles exactos"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def __iter__(self):
+        return iter(self._samples)
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Circuito cerrado / abierto / semiabierto frente a un upstream
+
+    Tras `failures` llamadas fallidas seguidas el circuito se abre y durante
+    `cooldown` segundos las llamadas fallan al instante. Después se deja pasar
+    una única llamada de prueba: si sale bien el circuito se cierra, y si no
+    vuelve a abrirse.
+    """
+
+    CLOSED = 'cerrado'
+    OPEN = 'abierto'
+    HALF_OPEN = 'semiabierto'
+
+    def __init__(self, failures: int = 5, cooldown: float = 30):
+        self.failure_threshold = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+    @property
+    def is_open(self) -> bool:
+        """¿Fallaría ahora una llamada? (sin contar como intento)"""
+        if self.state == self.OPEN:
+            return self.retry_after > 0
+        return self.state == self.HALF_OPEN and self._probing
+
+    def before_call(self) -> bool:
+        """Reserva el paso de una llamada; devuelve True si es la de prueba"""
+        if self.state == self.OPEN:
+            if self.retry_after > 0:
+                self.rejected += 1
+                raise CircuitOpen(self.retry_after)
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise CircuitOpen(1)
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("✅ Uptodown responde de nuevo: circuito cerrado")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+                logger.warning(f"🔌 Uptodown degradado: circuito abierto durante {self.cooldown:.0f} s")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """La llamada de prueba terminó sin veredicto (p. ej. un 404 o una cancelación)"""
+        self._probing = False
+
+
+class Resilience:
+    """Timeouts adaptativos, hedging, reintentos con jitter y circuit breaker
+
+    - El timeout de cada intento es `timeout_multiplier` veces el p99 de las
+      latencias recientes de la operación, entre `min_timeout` y el timeout
+      fijo de la llamada (que sigue siendo el máximo que espera un usuario).
+    - Si un intento supera el p95 sin responder se lanza una segunda petición
+      igual (hedge) y gana la primera que responda. Los hedges se limitan a
+      `hedge_ratio` de las llamadas para no duplicar la carga cuando todo va
+      lento.
+    - Los errores transitorios se reintentan hasta `retries` veces con backoff
+      exponencial y jitter completo, siempre dentro del plazo de la llamada.
+    - Tras varios fallos seguidos el circuito se abre y las llamadas fallan en
+      milisegundos con CircuitOpen; quien llama puede servir cache caducado.
+
+    `attempt(timeout, hedge, sent, deadline)` hace una petición de como mucho
+    `timeout` segundos, sin esperar en colas locales más allá de `deadline`
+    (monotonic), y llama a `sent()` cuando sale hacia el upstream: el p95 del
+    hedge se cuenta desde ahí, no desde que empezó a esperar turno.
+    `retryable(exc)` decide qué errores son del upstream (y cuentan para el
+    circuito) y cuáles no.
+    """
+
+    def __init__(self, retryable, min_timeout: float = 2, timeout_multiplier: float = 3,
+                 hedge_quantile: float = 0.95, hedge_ratio: float = 0.1, retries: int = 2,
+                 backoff: float = 0.3, window: int = 200, min_samples: int = 20,
+                 breaker: CircuitBreaker = None):
+        self.retryable = retryable
+        self.min_timeout = min_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge_quantile = hedge_quantile
+        self.hedge_ratio = hedge_ratio
+        self.retries = retries
+        self.backoff = backoff
+        self.window = window
+        self.min_samples = min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies = {}
+        self.calls = 0
+        self.hedges = 0
+        self._hedges_pending = 0
+        self.hedge_wins = 0
+        self.retried = 0
+
+    def _window(self, op: str) -> LatencyWindow:
+        window = self._latencies.get(op)
+        if window is None:
+            window = self._latencies[op] = LatencyWindow(self.window)
+        return window
+
+    def observe(self, op: str, seconds: float):
+        """Latencia de una petición (los timeouts se anotan con el valor del timeout)"""
+        self._window(op).observe(seconds)
+
+    def timeout(self, op: str, ceiling: float) -> float:
+        window = self._window(op)
+        if len(window) < self.min_samples:
+            return ceiling
+        adaptive = window.quantile(0.99) * self.timeout_multiplier
+        return min(ceiling, max(self.min_timeout, adaptive))
+
+    def hedge_delay(self, op: str):
+        """Segundos tras los que merece la pena un hedge, o None sin datos suficientes"""
+        window = self._window(op)
+        if len(window) < self.min_samples:
+            return None
+        return window.quantile(self.hedge_quantile)
+
+    def _can_hedge(self) -> bool:
+        # Los hedges lanzados que aún no han salido también cuentan para el límite
+        return self.hedges + self._hedges_pending < self.hedge_ratio * self.calls
+
+    async def call(self, op: str, attempt, ceiling: float):
+        """Ejecuta `attempt` con todas las protecciones; nunca tarda más de `ceiling`"""
+        probe = self.breaker.before_call()
+        self.calls += 1
+        deadline = time.monotonic() + ceiling
+        retries = 0 if probe else self.retries
+        try:
+            for number in range(retries + 1):
+                remaining = deadline - time.monotonic()
+                timeout = min(self.timeout(op, ceiling), remaining)
+                try:
+                    result = await self._hedged(op, attempt, timeout, deadline, hedge=not probe)
+                except Exception as e:
+                    if not self.retryable(e):
+                        raise
+                    delay = random.uniform(0, self.backoff * 2 ** number)
+                    if (number == retries or self.breaker.is_open
+                            or deadline - time.monotonic() - delay < self.min_timeout):
+                        self.breaker.record_failure()
+                        raise
+                    self.retried += 1
+                    logger.info(f"🔁 Reintentando {op} en {delay:.2f} s tras: {e}")
+                    with tracing.span('backoff'):
+                        await asyncio.sleep(delay)
+                    continue
+                self.breaker.record_success()
+                return result
+        finally:
+            if probe:
+                self.breaker.release()
+
+    async def _hedged(self, op: str, attempt, timeout: float, deadline: float, hedge: bool):
+        delay = self.hedge_delay(op) if hedge else None
+        if delay is None or delay >= timeout:
+            return await attempt(timeout, False, None, deadline)
+
+        loop = asyncio.get_running_loop()
+        sent = asyncio.Event()
+        first = loop.create_task(attempt(timeout, False, sent.set, deadline))
+        tasks = [first]
+        try:
+            # El reloj del hedge arranca cuando el original sale, no mientras hace cola
+            waiter = loop.create_task(sent.wait())
+            try:
+                await asyncio.wait([first, waiter], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            sent_at = time.monotonic()
+            if not first.done():
+                await asyncio.wait(tasks, timeout=delay)
+            # El hedge no puede durar más de lo que le queda al original
+            remaining = min(sent_at + timeout, deadline) - time.monotonic()
+            if first.done() or not self._can_hedge() or remaining <= 0:
+                return await first
+
+            second = loop.create_task(self._send_hedge(attempt, remaining, deadline))
+            tasks.append(second)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    # Si falla el hedge se sigue esperando al original, y su error es el que cuenta
+                    if task is first or error is None:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # El perdedor puede haber fallado en la misma tanda que el ganador
+                    task.exception()
+
+    async def _send_hedge(self, attempt, timeout: float, deadline: float):
+        """Lanza el hedge; solo cuenta como hedge si la petición llega a salir"""
+        self._hedges_pending += 1
+        counted = False
+
+        def sent():
+            nonlocal counted
+            counted = True
+            self._hedges_pending -= 1
+            self.hedges += 1
+
+        try:
+            return await attempt(timeout, True, sent, deadline)
+        finally:
+            if not counted:
+                self._hedges_pending -= 1
+
+    def dump(self) -> dict:
+        """Latencias recientes por operación (para no reaprender timeouts tras un reinicio)"""
+        return {op: list(window) for op, window in self._latencies.items()}
+
+    def load(self, latencies: dict):
+        for op, samples in latencies.items():
+            window = self._window(op)
+            for seconds in samples:
+                window.observe(seconds)
+
+    def stats(self) -> dict:
+        """Estado del circuito, contadores y timeout adaptativo actual por operación"""
+        return {
+            'state': self.breaker.state,
+            'retry_after': self.breaker.retry_after,
+            'calls': self.calls,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'retries': self.retried,
+            'opened': self.breaker.opened,
+            'rejected': self.breaker.rejected,
+            'timeouts': {op: self.timeout(op, float('inf')) for op in self._latencies},
+        }
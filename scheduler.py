@@ -0,0 +1,141 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+# Prioridades (menor = antes)
+PRIORITY_CHEAP = 0      # comandos, aciertos de cache
+PRIORITY_CALLBACK = 1   # clics en botones de descarga
+PRIORITY_SCRAPE = 2     # búsquedas que requieren ir a Uptodown
+
+
+class UpdateScheduler(BaseUpdateProcessor):
+    """Procesa updates en paralelo con un número fijo de workers
+
+    - Orden por usuario: los updates de un mismo usuario se ejecutan de uno en
+      uno y en el orden en que llegaron.
+    - Prioridades: cada update espera con un plazo `llegada + prioridad *
+      priority_step`, así el trabajo barato adelanta a los scrapes pero un
+      scrape que lleva esperando `priority_step` segundos ya no se queda atrás.
+    - Backpressure: con `max_queue` updates esperando, los nuevos reciben una
+      respuesta inmediata de "ocupado" (`on_busy`) en lugar de encolarse.
+    """
+
+    def __init__(self, workers: int, max_queue: int, classify=None, on_busy=None,
+                 priority_step: float = 5.0):
+        # El semáforo de BaseUpdateProcessor solo acota el total admitido (con
+        # margen para las respuestas de "ocupado"); los workers se gestionan aquí
+        super().__init__(2 * (workers + max_queue))
+        self.workers = workers
+        self.max_queue = max_queue
+        self.classify = classify
+        self.on_busy = on_busy
+        self.priority_step = priority_step
+        self._active = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._tails = {}
+        self.pending = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return self.pending
+
+    @staticmethod
+    def user_key(update):
+        """Usuario (o chat) al que pertenece el update, para mantener su orden"""
+        user = getattr(update, 'effective_user', None)
+        if user is not None:
+            return user.id
+        chat = getattr(update, 'effective_chat', None)
+        return chat.id if chat is not None else None
+
+    def priority(self, update) -> int:
+        if self.classify is None:
+            return PRIORITY_SCRAPE
+        try:
+            return self.classify(update)
+        except Exception as e:
+            logger.warning(f"⚠️ Error clasificando update: {e}")
+            return PRIORITY_SCRAPE
+
+    async def do_process_update(self, update, coroutine):
+        if self.pending >= self.max_queue:
+            self.rejected += 1
+            coroutine.close()
+            await self._reply_busy(update)
+            return
+
+        priority = self.priority(update)
+        user = self.user_key(update)
+        previous = self._tails.get(user)
+        done = asyncio.Event()
+        if user is not None:
+            self._tails[user] = done
+
+        self.pending += 1
+        acquired = False
+        try:
+            if previous is not None:
+                await previous.wait()
+            await self._acquire(priority)
+            acquired = True
+            self.pending -= 1
+            await coroutine
+        finally:
+            if acquired:
+                self._release()
+            else:
+                self.pending -= 1
+                coroutine.close()
+            done.set()
+            if self._tails.get(user) is done:
+                del self._tails[user]
+
+    async def _acquire(self, priority: int):
+        """Espera un worker libre respetando el plazo según la prioridad"""
+        if self._active < self.workers and not self._waiting:
+            self._active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        deadline = time.monotonic() + priority * self.priority_step
+        heapq.heappush(self._waiting, (deadline, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # El worker ya se había transferido: devolverlo
+                self._release()
+            else:
+                future.cancel()
+            raise
+
+    def _release(self):
+        """Pasa el worker al siguiente update en espera (o lo libera)"""
+        while self._waiting:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    async def _reply_busy(self, update):
+        if self.on_busy is None:
+            return
+        try:
+            await self.on_busy(update)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo avisar de saturación: {e}")
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        for _, _, future in self._waiting:
+            future.cancel()
+        self._waiting.clear()
@@ -0,0 +1,311 @@
+import logging
+import re
+import threading
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Subconjunto de CSS que usan los selectors del bot:
+#   tag, .clase, [attr], [attr=v], [attr*=v], [attr^=v], [attr$=v], flag " i"
+#   y el combinador descendiente (espacio)
+_TOKEN_RE = re.compile(
+    r'(?P<tag>^[a-zA-Z][\w-]*|^\*)'
+    r'|\.(?P<cls>[\w-]+)'
+    r'|\[(?P<attr>[\w-]+)(?:(?P<op>[*^$]?=)"(?P<value>[^"]*)"(?:\s+(?P<flag>i))?)?\]'
+)
+
+# Partes separadas por espacios, respetando los espacios dentro de [...]
+_COMPOUND_RE = re.compile(r'(?:\[[^\]]*\]|[^\s\[])+')
+
+
+def _compile_compound(text: str):
+    """Compila un selector simple (sin combinadores) a una función predicado"""
+    tag = None
+    classes = []
+    attrs = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise ValueError(f"Selector no soportado: {text!r}")
+        if match.group('tag') and match.group('tag') != '*':
+            tag = match.group('tag').lower()
+        elif match.group('cls'):
+            classes.append(match.group('cls'))
+        elif match.group('attr'):
+            value = match.group('value')
+            insensitive = match.group('flag') == 'i'
+            if value is not None and insensitive:
+                value = value.lower()
+            attrs.append((match.group('attr'), match.group('op'), value, insensitive))
+        pos = match.end()
+
+    # Clave de indexado: permite descartar el selector sin evaluarlo
+    if tag is not None:
+        key = ('tag', tag)
+    elif classes:
+        key = ('class', classes[0])
+    elif attrs:
+        key = ('attr', attrs[0][0])
+    else:
+        key = None
+
+    def matches(el) -> bool:
+        if tag is not None and el.tag != tag:
+            return False
+        if classes:
+            el_classes = el.get('class', '').split()
+            for cls in classes:
+                if cls not in el_classes:
+                    return False
+        for name, op, value, insensitive in attrs:
+            actual = el.get(name)
+            if actual is None:
+                return False
+            if op is None:
+                continue
+            if insensitive:
+                actual = actual.lower()
+            if op == '=' and actual != value:
+                return False
+            if op == '*=' and value not in actual:
+                return False
+            if op == '^=' and not actual.startswith(value):
+                return False
+            if op == '$=' and not actual.endswith(value):
+                return False
+        return True
+
+    return matches, key
+
+
+class Selector:
+    """Selector CSS compilado con soporte de combinador descendiente"""
+
+    __slots__ = ('css', 'key', 'ancestor_keys', '_parts')
+
+    def __init__(self, css: str):
+        self.css = css
+        compiled = [_compile_compound(part) for part in _COMPOUND_RE.findall(css)]
+        self._parts = [matches for matches, _ in compiled]
+        self.key = compiled[-1][1]
+        self.ancestor_keys = [key for _, key in compiled[:-1] if key is not None]
+
+    def __repr__(self):
+        return f"Selector({self.css!r})"
+
+    def matches(self, el) -> bool:
+        if not self._parts[-1](el):
+            return False
+        # Resto de la cadena de derecha a izquierda contra los ancestros
+        index = len(self._parts) - 2
+        if index < 0:
+            return True
+        for ancestor in el.iterancestors():
+            if self._parts[index](ancestor):
+                index -= 1
+                if index < 0:
+                    return True
+        return False
+
+
+FALLBACK = -1
+_local = threading.local()
+
+
+def parse_html(html):
+    """Parsea HTML con lxml (mucho más rápido que html.parser de Python)"""
+    if isinstance(html, str) and html.lstrip().startswith('<?xml'):
+        # lxml no acepta str con declaración de encoding
+        html = html.encode('utf-8')
+    if not html or not html.strip():
+        return None
+    # etree sin las clases de elemento de lxml.html: crear cada nodo es más barato
+    # (los parsers de lxml no deben compartirse entre hilos)
+    # lxml se importa con el primer parseo, no al arrancar el bot
+    from lxml import etree
+
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = etree.HTMLParser()
+    with tracing.span('html'):
+        return etree.fromstring(html, parser)
+
+
+def text_of(el) -> str:
+    """Equivalente a get_text(strip=True) de BeautifulSoup"""
+    return "".join(part.strip() for part in el.itertext())
+
+
+class SelectorEngine:
+    """Evalúa todos los selectors candidatos en un único recorrido del árbol
+
+    El orden de prueba se adapta: cada acierto suma puntuación al selector
+    (con decaimiento), y el que ha funcionado recientemente se prueba primero.
+    Si el selector preferido llena su cupo, el recorrido termina antes.
+    """
+
+    def __init__(self, name: str, selectors, fallback: str = None, decay: float = 0.9):
+        self.name = name
+        self.selectors = [Selector(css) for css in selectors]
+        self.fallback = Selector(fallback) if fallback else None
+        self.decay = decay
+        self._scores = [0.0] * len(self.selectors)
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.hits = {selector.css: 0 for selector in self.selectors}
+        self.fallback_hits = 0
+        self.misses = 0
+        self._build_index()
+
+    def order(self):
+        """Índices de selectors por puntuación (empate: orden original)"""
+        return sorted(range(len(self.selectors)), key=lambda i: (-self._scores[i], i))
+
+    def _build_index(self):
+        """Agrupa los selectors por tag, clase o atributo de su parte derecha"""
+        self._by_tag = {}
+        self._by_class = {}
+        self._by_attr = {}
+        self._anywhere = []
+        entries = list(enumerate(self.selectors))
+        if self.fallback is not None:
+            entries.append((FALLBACK, self.fallback))
+        for index, selector in entries:
+            if selector.key is None:
+                self._anywhere.append((index, selector))
+                continue
+            kind, value = selector.key
+            table = {'tag': self._by_tag, 'class': self._by_class, 'attr': self._by_attr}[kind]
+            table.setdefault(value, []).append((index, selector))
+
+        self._ancestor_watch = {key for _, selector in entries for key in selector.ancestor_keys}
+        self._ancestor_attrs = [key for key in self._ancestor_watch if key[0] == 'attr']
+
+    def _candidates(self, el, classes):
+        """Selectors que podrían coincidir con el elemento"""
+        candidates = list(self._by_tag.get(el.tag, ()))
+        if self._by_class:
+            for cls in classes:
+                candidates.extend(self._by_class.get(cls, ()))
+        for name, entries in self._by_attr.items():
+            if el.get(name) is not None:
+                candidates.extend(entries)
+        candidates.extend(self._anywhere)
+        return candidates
+
+    def _observe(self, el, classes, seen):
+        """Anota las claves de ancestro presentes en el elemento
+
+        El recorrido es en preorden, así que cuando llega un elemento todos sus
+        ancestros ya se han visto: si la clave de un ancestro requerido no ha
+        aparecido aún, el selector descendiente no puede coincidir.
+        """
+        watch = self._ancestor_watch
+        if ('tag', el.tag) in watch:
+            seen.add(('tag', el.tag))
+        for cls in classes:
+            if ('class', cls) in watch:
+                seen.add(('class', cls))
+        for key in self._ancestor_attrs:
+            if el.get(key[1]) is not None:
+                seen.add(key)
+
+    def collect(self, root, limit: int, preferred: int = None, with_fallback: bool = True):
+        """Un único recorrido: hasta `limit` coincidencias por selector
+
+        Con `preferred`, el recorrido se corta en cuanto ese selector llena su
+        cupo y se devuelve None en lugar de las coincidencias del fallback.
+        """
+        found = [[] for _ in self.selectors]
+        fallback_found = []
+        full = set()
+        seen = set()
+
+        for el in root.iter():
+            if not isinstance(el.tag, str):
+                continue  # comentarios e instrucciones de proceso
+            classes = el.get('class')
+            classes = classes.split() if classes else ()
+            if self._ancestor_watch:
+                self._observe(el, classes, seen)
+
+            for index, selector in self._candidates(el, classes):
+                if selector.ancestor_keys and not all(key in seen for key in selector.ancestor_keys):
+                    continue
+                if index == FALLBACK:
+                    if with_fallback and selector.matches(el):
+                        fallback_found.append(el)
+                    continue
+                if index in full or not selector.matches(el):
+                    continue
+                found[index].append(el)
+                if len(found[index]) >= limit:
+                    full.add(index)
+                    if index == preferred:
+                        return found, None
+                    if not with_fallback and len(full) == len(self.selectors):
+                        return found, fallback_found
+
+        return found, fallback_found
+
+    def run(self, html, extract, limit: int, fallback_extract=None):
+        """Devuelve el resultado del primer selector (en orden adaptativo) que produce algo
+
+        `extract(elements)` convierte las coincidencias en resultados; una lista
+        vacía o None significa que el selector no sirvió. `html` puede ser un
+        árbol ya parseado con parse_html para aplicar varios motores sin reparsear.
+        """
+        root = parse_html(html) if isinstance(html, (str, bytes)) else html
+        if root is None:
+            return None
+        with tracing.span(f"selectors/{self.name}"):
+            return self._run(root, extract, limit, fallback_extract)
+
+    def _run(self, root, extract, limit: int, fallback_extract):
+        order = self.order()
+        found, fallback_found = self.collect(root, limit, preferred=order[0])
+        if fallback_found is None:
+            # El preferido llenó su cupo y el recorrido se cortó
+            result = extract(found[order[0]])
+            if result:
+                self._record(order[0])
+                return result
+            found, fallback_found = self.collect(root, limit)
+
+        for i in order:
+            if not found[i]:
+                continue
+            result = extract(found[i])
+            if result:
+                self._record(i)
+                logger.info(f"🎯 [{self.name}] Selector '{self.selectors[i].css}' ({len(found[i])} elementos)")
+                return result
+
+        result = fallback_extract(fallback_found) if fallback_extract and fallback_found else None
+        self._record(None, fallback=bool(result))
+        return result
+
+    def _record(self, index, fallback: bool = False):
+        with self._lock:
+            self.runs += 1
+            self._scores = [score * self.decay for score in self._scores]
+            if index is not None:
+                self._scores[index] += 1
+                self.hits[self.selectors[index].css] += 1
+            elif fallback:
+                self.fallback_hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        """Estadísticas de aciertos por selector"""
+        with self._lock:
+            return {
+                'runs': self.runs,
+                'hits': dict(self.hits),
+                'fallback_hits': self.fallback_hits,
+                'misses': self.misses,
+                'order': [self.selectors[i].css for i in self.order()],
+            }
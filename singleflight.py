@@ -0,0 +1,88 @@
+import asyncio
+import itertools
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Agrupa peticiones idénticas en vuelo para que compartan un único fetch
+
+    La primera llamada con una clave lanza la tarea; las siguientes esperan el
+    mismo resultado. La tarea está protegida con `shield`, así que si el
+    usuario que la inició cancela, el resto sigue recibiendo la respuesta.
+
+    Con un backend de estado compartido, además, solo un proceso hace el fetch:
+    los demás esperan a que el resultado aparezca en el cache compartido
+    (`lookup`) mientras el lock siga tomado.
+    """
+
+    def __init__(self, backend=None, lock_ttl: float = 30, poll_interval: float = 0.2):
+        self.backend = backend if backend is not None and backend.shared else None
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._tokens = itertools.count()
+        self._calls = {}
+        self.started = 0
+        self.coalesced = 0
+        self.remote = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __contains__(self, key):
+        return key in self._calls
+
+    async def do(self, key, func, *args, lookup=None):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._run(key, func, args, lookup))
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Evita el aviso de "excepción nunca recuperada" si nadie la esperaba ya
+        if not task.cancelled():
+            task.exception()
+
+    async def _run(self, key, func, args, lookup):
+        if self.backend is None:
+            return await func(*args)
+
+        lock_key = 'lock:' + ':'.join(str(part) for part in key)
+        owner = f"{self._owner}-{next(self._tokens)}"
+        deadline = asyncio.get_running_loop().time() + self.lock_ttl
+        while True:
+            try:
+                locked = await self.backend.lock(lock_key, owner, self.lock_ttl)
+            except Exception as e:
+                logger.warning(f"⚠️ Lock compartido no disponible: {e}")
+                return await func(*args)
+
+            if locked:
+                try:
+                    return await func(*args)
+                finally:
+                    try:
+                        await self.backend.unlock(lock_key, owner)
+                    except Exception as e:
+                        logger.warning(f"⚠️ No se pudo liberar el lock {lock_key}: {e}")
+
+            # Otro proceso está haciendo este fetch: esperar a que publique el resultado
+            await asyncio.sleep(self.poll_interval)
+            if lookup is not None:
+                result = await lookup()
+                if result is not None:
+                    self.remote += 1
+                    return result
+            if asyncio.get_running_loop().time() > deadline:
+                return await func(*args)
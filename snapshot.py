@@ -0,0 +1,119 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class Snapshotter:
+    """Foto compacta del estado caliente para arrancar con él tras un reinicio
+
+    Cada sección se registra con `dump()` (devuelve algo serializable en JSON)
+    y `restore(data, elapsed)`, donde `elapsed` son los segundos que han
+    pasado desde la foto: las secciones envejecen sus entradas con ese tiempo,
+    así que un cache que caducó mientras el bot estaba parado no revive.
+
+    La foto se escribe al apagar y cada `interval` segundos (por si el proceso
+    muere sin apagarse), en JSON comprimido y con reemplazo atómico. Las fotos
+    con más de `max_age` segundos se ignoran.
+    """
+
+    def __init__(self, path: str, interval: float = 300, max_age: float = 86400):
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self._sections = {}
+        self._task = None
+
+    def register(self, name: str, dump, restore):
+        self._sections[name] = (dump, restore)
+
+    def dump(self) -> dict:
+        """Secciones a guardar (se llama desde el event loop: nada cambia mientras tanto)"""
+        sections = {}
+        for name, (dump, _) in self._sections.items():
+            try:
+                sections[name] = dump()
+            except Exception as e:
+                logger.warning(f"⚠️ Snapshot: no se pudo exportar '{name}': {e}")
+        return {'version': SNAPSHOT_VERSION, 'saved_at': time.time(), 'sections': sections}
+
+    def write(self, snapshot: dict) -> int:
+        """Escribe la foto de forma atómica y devuelve su tamaño en bytes"""
+        data = gzip.compress(json.dumps(snapshot, separators=(',', ':')).encode('utf-8'), compresslevel=6)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+        return len(data)
+
+    def save(self):
+        """Exporta y escribe en el hilo actual (al apagar, cuando ya no hay event loop que cuidar)"""
+        if not self.path:
+            return
+        try:
+            size = self.write(self.dump())
+        except Exception as e:
+            logger.warning(f"⚠️ Error guardando snapshot: {e}")
+            return
+        logger.info(f"📸 Snapshot guardado en {self.path} ({size / 1024:.1f} KB)")
+
+    async def save_async(self):
+        """Exporta en el loop y comprime y escribe en un hilo"""
+        if not self.path:
+            return
+        try:
+            await asyncio.to_thread(self.write, self.dump())
+        except Exception as e:
+            logger.warning(f"⚠️ Error guardando snapshot: {e}")
+
+    def restore(self) -> bool:
+        """Carga la última foto si existe y no es demasiado vieja"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        start = time.perf_counter()
+        try:
+            with open(self.path, 'rb') as f:
+                snapshot = json.loads(gzip.decompress(f.read()))
+        except Exception as e:
+            logger.warning(f"⚠️ Snapshot ilegible, se ignora: {e}")
+            return False
+
+        elapsed = max(0.0, time.time() - snapshot.get('saved_at', 0))
+        if snapshot.get('version') != SNAPSHOT_VERSION or elapsed > self.max_age:
+            logger.info(f"📸 Snapshot descartado (versión {snapshot.get('version')}, {elapsed:.0f} s)")
+            return False
+
+        sections = snapshot.get('sections', {})
+        for name, (_, restore) in self._sections.items():
+            if name not in sections:
+                continue
+            try:
+                restore(sections[name], elapsed)
+            except Exception as e:
+                logger.warning(f"⚠️ Snapshot: no se pudo restaurar '{name}': {e}")
+        logger.info(
+            f"📸 Snapshot restaurado ({', '.join(sections)}) de hace {elapsed:.0f} s "
+            f"en {(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+        return True
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save_async()
+
+    def start(self):
+        """Arranca el guardado periódico en el event loop actual"""
+        if self.path and self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._save_loop())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
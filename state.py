@@ -0,0 +1,507 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from rate_limit import TokenBucketLimiter
+
+logger = logging.getLogger(__name__)
+
+# Token bucket atómico en Redis. Devuelve como texto los segundos de espera
+# (0 = concedido): Redis convierte los números de Lua a enteros.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens < cost then
+    wait = (cost - tokens) / rate
+else
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+# Toma un lock libre o renueva el propio (como los backends en memoria y SQLite).
+# Repetirlo con el mismo dueño da el mismo resultado: se puede reintentar.
+LOCK_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current == false or current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Libera un lock solo si sigue siendo de quien lo tomó
+UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class StateBackend(ABC):
+    """Estado compartido entre procesos del bot: cache, rate limiting y locks
+
+    - get/set/delete: valores bytes con TTL en segundos.
+    - take: token bucket atómico; devuelve 0 si se concede o los segundos
+      hasta que habría saldo suficiente.
+    - lock/unlock: lock con dueño y caducidad, para el single-flight entre
+      procesos (si el dueño muere, el lock caduca solo). El mismo dueño puede
+      volver a tomarlo, lo que renueva su caducidad.
+
+    `shared` indica si el estado lo ven otros procesos: con el backend en
+    memoria no tiene sentido duplicar el cache ni usar locks.
+    """
+
+    shared = True
+    name = ''
+
+    @abstractmethod
+    async def get(self, key: str):
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        ...
+
+    @abstractmethod
+    async def lock(self, key: str, owner: str, ttl: float) -> bool:
+        ...
+
+    @abstractmethod
+    async def unlock(self, key: str, owner: str):
+        ...
+
+    async def bucket_count(self):
+        """Buckets de rate limiting activos (None si el backend no lo sabe)"""
+        return None
+
+    def start(self):
+        """Arranca las tareas de mantenimiento (dentro del event loop)"""
+
+    async def close(self):
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """Estado en el propio proceso (un único worker)"""
+
+    shared = False
+    name = 'memory'
+
+    def __init__(self, idle_ttl: float = 600, purge_interval: float = 60):
+        self.idle_ttl = idle_ttl
+        self.purge_interval = purge_interval
+        self._values = {}
+        self._locks = {}
+        self._limiters = {}
+        self._purge_task = None
+
+    async def get(self, key: str):
+        entry = self._values.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._values[key] = (value, time.monotonic() + ttl)
+
+    async def delete(self, key: str):
+        self._values.pop(key, None)
+
+    def _limiter(self, rate: float, capacity: float) -> TokenBucketLimiter:
+        limiter = self._limiters.get((rate, capacity))
+        if limiter is None:
+            limiter = TokenBucketLimiter(rate * 60, capacity, self.idle_ttl)
+            self._limiters[rate, capacity] = limiter
+        return limiter
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        limiter = self._limiter(rate, capacity)
+        if limiter.allow(key, cost):
+            return 0.0
+        return max(limiter.retry_after(key, cost), 1e-3)
+
+    async def lock(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.monotonic()
+        current = self._locks.get(key)
+        if current is not None and current[1] > now and current[0] != owner:
+            return False
+        self._locks[key] = (owner, now + ttl)
+        return True
+
+    async def unlock(self, key: str, owner: str):
+        current = self._locks.get(key)
+        if current is not None and current[0] == owner:
+            del self._locks[key]
+
+    async def bucket_count(self):
+        return sum(len(limiter) for limiter in self._limiters.values())
+
+    def dump(self):
+        """Buckets de rate limiting como [rate, capacity, buckets] (los valores y locks no se guardan)"""
+        return [[rate, capacity, limiter.dump()] for (rate, capacity), limiter in self._limiters.items()]
+
+    def load(self, entries, elapsed: float = 0):
+        for rate, capacity, buckets in entries:
+            self._limiter(rate, capacity).load(buckets, elapsed)
+
+    def purge(self) -> int:
+        now = time.monotonic()
+        removed = 0
+        for table in (self._values, self._locks):
+            expired = [key for key, (_, expires_at) in table.items() if expires_at <= now]
+            for key in expired:
+                del table[key]
+            removed += len(expired)
+        for limiter in self._limiters.values():
+            removed += limiter.purge_idle()
+        return removed
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            self.purge()
+
+    def start(self):
+        if self._purge_task is None or self._purge_task.done():
+            self._purge_task = asyncio.get_running_loop().create_task(self._purge_loop())
+
+    async def close(self):
+        if self._purge_task is not None:
+            self._purge_task.cancel()
+            self._purge_task = None
+
+
+class SQLiteBackend(StateBackend):
+    """Estado en un fichero SQLite compartido por los procesos de una máquina
+
+    Las operaciones de lectura-modificación-escritura usan BEGIN IMMEDIATE,
+    que bloquea la base de datos para escritura durante la transacción.
+    Todas las llamadas a SQLite van a un hilo propio con su conexión: esperar
+    el lock de otro proceso (hasta `timeout` segundos) no para el event loop,
+    y al haber un único hilo las transacciones no se pisan entre sí.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path: str, purge_interval: float = 60, timeout: float = 5):
+        self.path = path
+        self.purge_interval = purge_interval
+        self.timeout = timeout
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='state-sqlite')
+        self._purge_task = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """Conexión del hilo de SQLite (solo se usa desde `_run`)"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                         check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS kv (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS locks (
+                    key TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+            """)
+            logger.info(f"🗄 Estado compartido en SQLite: {self.path}")
+        return self._conn
+
+    async def _run(self, work, transaction: bool = False):
+        """Ejecuta `work(conn)` en el hilo de SQLite, dentro de BEGIN IMMEDIATE si `transaction`
+
+        Si quien espera se cancela, la operación termina igualmente en el hilo
+        (con su COMMIT o ROLLBACK), así que la base de datos queda coherente.
+        """
+        def run():
+            conn = self.conn
+            if not transaction:
+                return work(conn)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+        return await asyncio.get_running_loop().run_in_executor(self._executor, run)
+
+    async def get(self, key: str):
+        def work(conn):
+            return conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        row = await self._run(work)
+        return row[0] if row else None
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._run(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl)
+        ))
+
+    async def delete(self, key: str):
+        await self._run(lambda conn: conn.execute("DELETE FROM kv WHERE key = ?", (key,)))
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        def work(conn):
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            wait = 0.0
+            if tokens < cost:
+                wait = (cost - tokens) / rate
+            else:
+                tokens -= cost
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, expires_at) VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + capacity / rate)
+            )
+            return wait
+        return await self._run(work, transaction=True)
+
+    async def lock(self, key: str, owner: str, ttl: float) -> bool:
+        def work(conn):
+            now = time.time()
+            row = conn.execute("SELECT owner, expires_at FROM locks WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now and row[0] != owner:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO locks (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner, now + ttl)
+            )
+            return True
+        return await self._run(work, transaction=True)
+
+    async def unlock(self, key: str, owner: str):
+        await self._run(lambda conn: conn.execute("DELETE FROM locks WHERE key = ? AND owner = ?", (key, owner)))
+
+    async def bucket_count(self):
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT COUNT(*) FROM buckets WHERE expires_at > ?", (time.time(),)
+        ).fetchone())
+        return row[0]
+
+    def purge(self) -> int:
+        now = time.time()
+        removed = 0
+        for table in ('kv', 'buckets', 'locks'):
+            removed += self.conn.execute(f"DELETE FROM {table} WHERE expires_at <= ?", (now,)).rowcount
+        return removed
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self.purge)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Error purgando estado compartido: {e}")
+
+    def start(self):
+        if self._purge_task is None or self._purge_task.done():
+            self._purge_task = asyncio.get_running_loop().create_task(self._purge_loop())
+
+    async def close(self):
+        if self._purge_task is not None:
+            self._purge_task.cancel()
+            self._purge_task = None
+        def close_conn():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await asyncio.get_running_loop().run_in_executor(self._executor, close_conn)
+        self._executor.shutdown(wait=False)
+
+
+class RedisError(Exception):
+    """Respuesta de error (-ERR ...) del servidor Redis"""
+
+
+class RedisBackend(StateBackend):
+    """Estado en Redis (o cualquier servidor que hable RESP), para varias máquinas
+
+    Cliente mínimo del protocolo RESP sobre una única conexión asyncio; los
+    comandos se serializan con un lock, que basta para el volumen del bot.
+    """
+
+    name = 'redis'
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self._scripts = {}
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        if self.password:
+            await self._call('AUTH', self.password)
+        if self.db:
+            await self._call('SELECT', self.db)
+        logger.info(f"🗄 Estado compartido en Redis: {self.host}:{self.port}/{self.db}")
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Conexión con Redis cerrada")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisError(f"Respuesta RESP no válida: {line!r}")
+
+    async def _call(self, *args):
+        self._writer.write(self._encode(args))
+        await self._writer.drain()
+        return await asyncio.wait_for(self._read_reply(), self.timeout)
+
+    async def command(self, *args, idempotent: bool = True):
+        """Envía un comando y devuelve su respuesta
+
+        Si la conexión falla se descarta y se reintenta una vez, salvo que el
+        comando ya se hubiera enviado y no sea idempotente (`take`): el primer
+        envío pudo ejecutarse y repetirlo cobraría dos veces.
+        """
+        async with self._lock:
+            for attempt in (1, 2):
+                sent = False
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    sent = True
+                    return await self._call(*args)
+                except RedisError:
+                    raise  # respuesta completa: la conexión sigue sincronizada
+                except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, OSError):
+                    # Conexión rota o respuesta a medias: se descarta
+                    self._drop()
+                    if attempt == 2 or (sent and not idempotent):
+                        raise
+                except BaseException:
+                    # Cancelado entre la escritura y la lectura: la respuesta pendiente
+                    # llegaría como respuesta del siguiente comando
+                    self._drop()
+                    raise
+
+    def _drop(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def _eval(self, script: str, keys, args, idempotent: bool = True):
+        """EVALSHA con el script cacheado por el servidor (EVAL si no lo tiene)"""
+        sha = self._scripts.get(script)
+        if sha is not None:
+            try:
+                return await self.command('EVALSHA', sha, len(keys), *keys, *args, idempotent=idempotent)
+            except RedisError as e:
+                if not str(e).startswith('NOSCRIPT'):
+                    raise
+        self._scripts[script] = (await self.command('SCRIPT', 'LOAD', script)).decode()
+        return await self.command('EVAL', script, len(keys), *keys, *args, idempotent=idempotent)
+
+    async def get(self, key: str):
+        return await self.command('GET', key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.command('SET', key, value, 'PX', max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str):
+        await self.command('DEL', key)
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        reply = await self._eval(TOKEN_BUCKET_SCRIPT, [key], [rate, capacity, cost, time.time()], idempotent=False)
+        return float(reply)
+
+    async def lock(self, key: str, owner: str, ttl: float) -> bool:
+        return await self._eval(LOCK_SCRIPT, [key], [owner, max(1, int(ttl * 1000))]) == 1
+
+    async def unlock(self, key: str, owner: str):
+        await self._eval(UNLOCK_SCRIPT, [key], [owner])
+
+    async def close(self):
+        async with self._lock:
+            self._drop()
+
+
+def create_backend(kind: str, sqlite_path: str = None, redis_url: str = None,
+                   idle_ttl: float = 600, purge_interval: float = 60) -> StateBackend:
+    """Backend de estado según la configuración ('memory', 'sqlite' o 'redis')"""
+    if kind == 'memory':
+        return MemoryBackend(idle_ttl=idle_ttl, purge_interval=purge_interval)
+    if kind == 'sqlite':
+        return SQLiteBackend(sqlite_path, purge_interval=purge_interval)
+    if kind == 'redis':
+        if not redis_url:
+            raise Exception("❌ STATE_BACKEND=redis requiere configurar REDIS_URL")
+        return RedisBackend(redis_url)
+    raise Exception(f"❌ STATE_BACKEND desconocido: {kind}")
@@ -0,0 +1,247 @@
+import asyncio
+import functools
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentStore:
+    """Almacén SQLite para búsquedas y enlaces de descarga con TTL propio
+
+    La base de datos se abre la primera vez que se consulta, de modo que el
+    arranque no paga el coste y un bot reiniciado responde desde el disco.
+
+    Los métodos son síncronos; desde el event loop se llaman con `run()`, que
+    los ejecuta en el hilo propio del almacén. Así un worker que tiene el lock
+    de escritura no para los handlers de los demás, y la conexión solo la usa
+    un hilo.
+    """
+
+    def __init__(self, path: str, stale_grace: float = 0):
+        self.path = path
+        # Las entradas caducadas se conservan este tiempo para servirlas si Uptodown falla
+        self.stale_grace = stale_grace
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='store-sqlite')
+
+    async def run(self, method, *args, **kwargs):
+        """Ejecuta `method(*args, **kwargs)` (un método del almacén) en su hilo"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(method, *args, **kwargs)
+        )
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS searches (
+                    key TEXT PRIMARY KEY,
+                    results TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS downloads (
+                    app_url TEXT PRIMARY KEY,
+                    download_url TEXT NOT NULL,
+                    version TEXT,
+                    stored_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS telegram_files (
+                    app_url TEXT PRIMARY KEY,
+                    version TEXT,
+                    file_id TEXT NOT NULL,
+                    stored_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS watches (
+                    chat_id INTEGER NOT NULL,
+                    app_id INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (chat_id, app_id)
+                );
+                CREATE INDEX IF NOT EXISTS watches_by_app ON watches (app_id);
+                CREATE TABLE IF NOT EXISTS watched_apps (
+                    app_id INTEGER PRIMARY KEY,
+                    version TEXT,
+                    checked_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS catalog (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL UNIQUE,
+                    name TEXT NOT NULL,
+                    popularity REAL NOT NULL DEFAULT 0,
+                    seen_at REAL NOT NULL
+                );
+            """)
+            removed = self.purge()
+            logger.info(f"💾 Cache persistente abierto: {self.path} ({removed} entradas caducadas)")
+        return self._conn
+
+    def close(self):
+        """Espera a que terminen las operaciones pendientes y cierra la conexión"""
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def purge(self) -> int:
+        """Borra las entradas caducadas de todas las tablas (pasado el margen `stale_grace`)"""
+        limit = time.time() - self.stale_grace
+        with self.conn:
+            removed = self.conn.execute("DELETE FROM searches WHERE expires_at <= ?", (limit,)).rowcount
+            removed += self.conn.execute("DELETE FROM downloads WHERE expires_at <= ?", (limit,)).rowcount
+        return removed
+
+    def get_search(self, key: str, grace: float = 0):
+        """Devuelve (IDs del catálogo de los resultados, edad en segundos) o None
+
+        Con `grace` también devuelve entradas caducadas hace menos de `grace` segundos.
+        """
+        row = self.conn.execute(
+            "SELECT results, stored_at FROM searches WHERE key = ? AND expires_at > ?",
+            (key, time.time() - grace)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), time.time() - row[1]
+
+    def set_search(self, key: str, results, ttl: float):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO searches (key, results, stored_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(results, ensure_ascii=False), now, now + ttl)
+            )
+
+    def get_download(self, app_url: str, grace: float = 0):
+        """Devuelve ({'url', 'version'}, edad en segundos) o None (`grace` como en get_search)"""
+        row = self.conn.execute(
+            "SELECT download_url, version, stored_at FROM downloads WHERE app_url = ? AND expires_at > ?",
+            (app_url, time.time() - grace)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'url': row[0], 'version': row[1]}, time.time() - row[2]
+
+    def set_download(self, app_url: str, info: dict, ttl: float):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO downloads (app_url, download_url, version, stored_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (app_url, info['url'], info.get('version'), now, now + ttl)
+            )
+
+    def get_telegram_file(self, app_url: str):
+        """Devuelve (file_id, versión, edad en segundos) del último envío de la app, o None"""
+        row = self.conn.execute(
+            "SELECT file_id, version, stored_at FROM telegram_files WHERE app_url = ?",
+            (app_url,)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], time.time() - row[2]
+
+    def set_telegram_file(self, app_url: str, version: str, file_id: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO telegram_files (app_url, version, file_id, stored_at) VALUES (?, ?, ?, ?)",
+                (app_url, version, file_id, time.time())
+            )
+
+    def delete_telegram_file(self, app_url: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM telegram_files WHERE app_url = ?", (app_url,))
+
+    def intern_apps(self, apps, popularity: float = 1.0):
+        """Registra apps vistas en una búsqueda (sumando popularidad) y devuelve sus IDs"""
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO catalog (url, name, popularity, seen_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET name = excluded.name, "
+                "popularity = popularity + excluded.popularity, seen_at = excluded.seen_at",
+                [(app['url'], app['name'], popularity, now) for app in apps]
+            )
+            return [
+                self.conn.execute("SELECT id FROM catalog WHERE url = ?", (app['url'],)).fetchone()[0]
+                for app in apps
+            ]
+
+    def get_app(self, app_id: int):
+        """Devuelve (id, nombre, url, popularidad) o None"""
+        return self.conn.execute(
+            "SELECT id, name, url, popularity FROM catalog WHERE id = ?", (app_id,)
+        ).fetchone()
+
+    def bump_app(self, app_id: int, popularity: float = 1.0):
+        with self.conn:
+            self.conn.execute("UPDATE catalog SET popularity = popularity + ? WHERE id = ?", (popularity, app_id))
+
+    def load_apps(self, limit: int):
+        """Las `limit` apps más populares como (id, nombre, url, popularidad)"""
+        return self.conn.execute(
+            "SELECT id, name, url, popularity FROM catalog ORDER BY popularity DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+    def add_watch(self, chat_id: int, app_id: int, version: str = None) -> bool:
+        """Suscribe un chat a las nuevas versiones de una app; False si ya lo estaba"""
+        with self.conn:
+            added = self.conn.execute(
+                "INSERT OR IGNORE INTO watches (chat_id, app_id, created_at) VALUES (?, ?, ?)",
+                (chat_id, app_id, time.time())
+            ).rowcount
+            # La primera suscripción fija la versión de partida (las siguientes no la tocan)
+            self.conn.execute(
+                "INSERT OR IGNORE INTO watched_apps (app_id, version, checked_at) VALUES (?, ?, NULL)",
+                (app_id, version)
+            )
+        return bool(added)
+
+    def remove_watch(self, chat_id: int, app_id: int) -> bool:
+        with self.conn:
+            removed = self.conn.execute(
+                "DELETE FROM watches WHERE chat_id = ? AND app_id = ?", (chat_id, app_id)
+            ).rowcount
+            self._forget_unwatched()
+        return bool(removed)
+
+    def remove_chat_watches(self, chat_id: int) -> int:
+        """Borra todas las suscripciones de un chat (p. ej. si bloqueó el bot)"""
+        with self.conn:
+            removed = self.conn.execute("DELETE FROM watches WHERE chat_id = ?", (chat_id,)).rowcount
+            self._forget_unwatched()
+        return removed
+
+    def _forget_unwatched(self):
+        self.conn.execute(
+            "DELETE FROM watched_apps WHERE app_id NOT IN (SELECT DISTINCT app_id FROM watches)"
+        )
+
+    def chat_watches(self, chat_id: int):
+        """IDs de las apps que vigila un chat, de la más antigua a la más reciente"""
+        return [row[0] for row in self.conn.execute(
+            "SELECT app_id FROM watches WHERE chat_id = ? ORDER BY created_at", (chat_id,)
+        )]
+
+    def watchers(self, app_id: int):
+        """Chats suscritos a una app"""
+        return [row[0] for row in self.conn.execute("SELECT chat_id FROM watches WHERE app_id = ?", (app_id,))]
+
+    def watched_apps(self):
+        """(app_id, versión conocida, última comprobación) de las apps con suscriptores"""
+        return self.conn.execute("SELECT app_id, version, checked_at FROM watched_apps").fetchall()
+
+    def set_watched_version(self, app_id: int, version: str):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE watched_apps SET version = ?, checked_at = ? WHERE app_id = ?",
+                (version, time.time(), app_id)
+            )
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Traza de la petición en curso. Las tareas y asyncio.to_thread copian el
+# contexto, así que los spans del parseo en otro hilo caen en la misma traza.
+_current = ContextVar('uptodaw_trace', default=None)
+_depth = ContextVar('uptodaw_span_depth', default=0)
+
+
+class Trace:
+    """Spans (nombre, inicio relativo, duración, profundidad) de una petición"""
+
+    __slots__ = ('name', 'attrs', 'started_at', 'start', 'duration', 'spans')
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+
+    def add(self, name: str, start: float, duration: float, depth: int):
+        self.spans.append((name, start - self.start, duration, depth))
+
+    def breakdown(self) -> str:
+        """Una línea por span, en orden de inicio e indentada por anidamiento"""
+        lines = []
+        for name, offset, duration, depth in sorted(self.spans, key=lambda span: span[1]):
+            lines.append(f"{'  ' * (depth + 1)}{name}: {duration * 1000:.1f} ms (+{offset * 1000:.0f} ms)")
+        return "\n".join(lines)
+
+    def as_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'attrs': self.attrs,
+            'started_at': self.started_at,
+            'duration_ms': round((self.duration or 0) * 1000, 2),
+            'spans': [
+                {'name': name, 'offset_ms': round(offset * 1000, 2), 'duration_ms': round(duration * 1000, 2),
+                 'depth': depth}
+                for name, offset, duration, depth in self.spans
+            ],
+        }
+
+
+class SlowLog:
+    """Últimas trazas que superaron `threshold` segundos, con todos sus spans
+
+    Se guardan en memoria (para /slow) y, si se indica `path`, también se
+    añaden como líneas JSON a ese fichero. La escritura la hace un hilo
+    propio, en orden, para no bloquear el event loop con el disco.
+    """
+
+    def __init__(self, threshold: float = 3, size: int = 50, path: str = ''):
+        self.threshold = threshold
+        self.path = path
+        self._traces = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._writer = None
+        self.recorded = 0
+
+    def __len__(self):
+        return len(self._traces)
+
+    def configure(self, threshold: float, size: int, path: str = ''):
+        """Cambia umbral, tamaño y fichero conservando las trazas más recientes"""
+        with self._lock:
+            self.threshold = threshold
+            self.path = path
+            self._traces = deque(self._traces, maxlen=size)
+
+    def record(self, trace: Trace):
+        if trace.duration < self.threshold:
+            return
+        with self._lock:
+            self._traces.append(trace)
+            self.recorded += 1
+        logger.warning(f"🐢 Petición lenta: {trace.name} {trace.duration * 1000:.0f} ms {trace.attrs}\n{trace.breakdown()}")
+        if self.path:
+            if self._writer is None:
+                self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-log')
+            self._writer.submit(self._append, self.path, json.dumps(trace.as_dict(), ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _append(path: str, line: str):
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo escribir el log de peticiones lentas: {e}")
+
+    def latest(self, count: int):
+        with self._lock:
+            return list(self._traces)[-count:][::-1]
+
+
+slow_log = SlowLog()
+
+
+def configure(threshold: float, size: int, path: str = ''):
+    """Ajusta el log de peticiones lentas (se llama una vez al arrancar)"""
+    slow_log.configure(threshold, size, path)
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """Abre la traza de una petición; al cerrarse va al log si fue lenta"""
+    current = Trace(name, attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current.reset(token)
+        slow_log.record(current)
+
+
+@contextmanager
+def span(name: str):
+    """Mide un tramo de la petición en curso (sin coste si no hay traza abierta)"""
+    current = _current.get()
+    # Las tareas lanzadas desde un handler (prefetch, perfiles) heredan la
+    # traza; una vez cerrada, sus spans ya no se le añaden
+    if current is None or current.duration is not None:
+        yield
+        return
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.add(name, start, time.perf_counter() - start, depth)
+        _depth.reset(token)
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Profiler por muestreo de todos los hilos, sin dependencias
+
+    Un hilo aparte toma cada `interval` segundos la pila de los demás hilos
+    (sys._current_frames) y la acumula en formato "folded"
+    (`hilo;f1;f2;f3 N`), que entienden flamegraph.pl, speedscope e inferno.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.running = False
+
+    def _sample(self, seconds: float, stacks: Counter):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                thread_name = names.get(ident) or f"hilo-{ident}"
+                stacks[";".join([thread_name] + frames[::-1])] += 1
+            time.sleep(self.interval)
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+    async def profile(self, seconds: float, path: str):
+        """Muestrea durante `seconds` y escribe el perfil; devuelve (muestras, funciones más vistas)"""
+        if self.running:
+            raise Exception("Ya hay un perfil en curso")
+        self.running = True
+        try:
+            stacks = Counter()
+            thread = threading.Thread(target=self._sample, args=(seconds, stacks), name='profiler', daemon=True)
+            thread.start()
+            while thread.is_alive():
+                await asyncio.sleep(0.1)
+
+            def write():
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+
+            await asyncio.to_thread(write)
+        finally:
+            self.running = False
+
+        # Funciones donde más muestras terminan (tiempo propio; incluye las esperas del loop en select)
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return sum(stacks.values()), leaves.most_common(5)
@@ -0,0 +1,453 @@
+import asyncio
+import hashlib
+import logging
+import random
+import re
+import time
+from urllib.parse import urljoin, urlparse
+
+import httpx
+
+from config import (
+    UPTODOWN_URL,
+    MAX_SEARCH_RESULTS,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_CONNECT_TIMEOUT,
+    SEARCH_TIMEOUT,
+    DOWNLOAD_PAGE_TIMEOUT,
+    PAGE_CACHE_MAX_ENTRIES,
+)
+from selector_engine import SelectorEngine, parse_html, text_of
+from rate_limit import UpstreamBudget, UpstreamBusy
+from resilience import Resilience, CircuitOpen
+from cache import PageCache, CachedPage
+import tracing
+from metrics import stage, IN_FLIGHT, ERRORS, CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.107 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+]
+
+BASE_HEADERS = {
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
+    # Sin 'br': httpx solo lo descomprime si está instalado brotli
+    'Accept-Encoding': 'gzip, deflate',
+    'DNT': '1',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Cache-Control': 'max-age=0',
+}
+
+# Múltiples selectors para mayor compatibilidad
+SEARCH_SELECTORS = [
+    '.app[data-url]',
+    '.app-card',
+    '.item[data-url]',
+    'div[data-url]',
+    '.name a',
+    '.app-name a',
+    'a[href*="/android/"]',
+    '.result-item'
+]
+
+# Múltiples selectors para el botón de descarga
+DOWNLOAD_SELECTORS = [
+    'a[data-url*="download"]',
+    'a.download[href]',
+    'a.button.download',
+    '.download-link',
+    'a[href*="/download/"]',
+    'button[data-url*="download"]',
+    '.download-button a',
+    'a.dl[href]'
+]
+
+# Versión de la app en la página /download
+VERSION_SELECTORS = [
+    '[itemprop="softwareVersion"]',
+    '.version',
+    '.detail .version',
+]
+
+
+def is_transient(error: Exception) -> bool:
+    """¿Es un fallo de Uptodown que merece reintento (red, timeout, 5xx o 429)?"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(error, httpx.TransportError)
+
+
+async def wait_queue(waiter, deadline: float):
+    """Espera una cola local como mucho hasta `deadline`; si no llega a tiempo, UpstreamBusy"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        waiter.close()
+        raise UpstreamBusy()
+    try:
+        await asyncio.wait_for(waiter, remaining)
+    except asyncio.TimeoutError:
+        raise UpstreamBusy()
+
+
+def normalize_query(query: str) -> str:
+    """Normaliza una búsqueda: sin símbolos, espacios simples y minúsculas"""
+    query = re.sub(r'[^\w\s-]', '', query)
+    return " ".join(query.split()).lower()
+
+
+class UptodownParser:
+    """Cliente asíncrono de Uptodown con pool de conexiones compartido"""
+
+    def __init__(self, base_url: str = UPTODOWN_URL,
+                 max_connections: int = HTTP_MAX_CONNECTIONS,
+                 max_per_host: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+                 budget: UpstreamBudget = None,
+                 resilience: Resilience = None,
+                 page_cache_entries: int = PAGE_CACHE_MAX_ENTRIES):
+        self.base_url = base_url
+        self.budget = budget
+        self.resilience = resilience
+        self.pages = PageCache(page_cache_entries)
+        self.user_agents = USER_AGENTS
+        self.allowed_domains = {'uptodown.com', 'www.uptodown.com', urlparse(base_url).netloc}
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self._client = None
+        self._host_limits = {}
+        self.search_engine = SelectorEngine(
+            'search', SEARCH_SELECTORS, fallback='a[href*="/android/"]'
+        )
+        self.download_engine = SelectorEngine(
+            'download', DOWNLOAD_SELECTORS, fallback='a[href*="download" i]'
+        )
+        self.version_engine = SelectorEngine('version', VERSION_SELECTORS)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Crea el cliente HTTP la primera vez que se usa (dentro del event loop)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=BASE_HEADERS,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(SEARCH_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def close(self):
+        """Cierra el pool de conexiones"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def random_headers(self, extra: dict = None) -> dict:
+        """Headers por petición con User-Agent aleatorio"""
+        headers = {'User-Agent': random.choice(self.user_agents)}
+        if extra:
+            headers.update(extra)
+        return headers
+
+    def validate_url(self, url: str) -> bool:
+        """Valida que la URL sea de Uptodown"""
+        try:
+            parsed = urlparse(url)
+            return parsed.netloc in self.allowed_domains
+        except Exception:
+            return False
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        """Semáforo que limita las conexiones simultáneas por host"""
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_limits[host]
+
+    async def fetch(self, url: str, timeout: float, params: dict = None, op: str = 'page',
+                    headers: dict = None) -> httpx.Response:
+        """GET asíncrono con timeouts adaptativos, hedging, reintentos y circuit breaker"""
+        if self.resilience is None:
+            return await self._fetch_once(url, timeout, params, op, headers=headers)
+        return await self.resilience.call(
+            op,
+            lambda attempt_timeout, hedge, sent, deadline: self._fetch_once(
+                url, attempt_timeout, params, op, hedge, headers, sent, deadline
+            ),
+            timeout,
+        )
+
+    async def fetch_parsed(self, url: str, timeout: float, parse, params: dict = None, op: str = 'page'):
+        """Descarga y parsea una página reutilizando el parseo anterior si no ha cambiado
+
+        La petición es condicional (If-None-Match / If-Modified-Since) cuando ya
+        se conoce la página: un 304 reutiliza el resultado guardado sin cuerpo,
+        y un 200 con el mismo digest que la última vez se ahorra el parseo.
+        """
+        key = (url, tuple(sorted(params.items())) if params else ())
+        page = self.pages.get(key)
+        response = await self.fetch(
+            url, timeout, params=params, op=op, headers=page.conditional_headers() if page else None
+        )
+        if response.status_code == 304 and page is not None:
+            CACHE_REQUESTS.inc(cache='page', result='not_modified')
+            return page.result
+
+        digest = hashlib.blake2b(response.content, digest_size=16).digest()
+        if page is not None and page.digest == digest:
+            CACHE_REQUESTS.inc(cache='page', result='unchanged')
+            result = page.result
+        else:
+            CACHE_REQUESTS.inc(cache='page', result='miss')
+            # El parseo es CPU puro: fuera del event loop
+            with stage('parse', op):
+                result = await asyncio.to_thread(parse, response.text)
+        self.pages.set(key, CachedPage(
+            response.headers.get('ETag'), response.headers.get('Last-Modified'), digest, result
+        ))
+        return result
+
+    async def _fetch_once(self, url: str, timeout: float, params: dict = None, op: str = 'page',
+                          hedge: bool = False, headers: dict = None, sent=None,
+                          deadline: float = None) -> httpx.Response:
+        """Una petición respetando el presupuesto global y el límite por host
+
+        Las colas (presupuesto y conexiones por host) esperan como mucho hasta
+        `deadline` (monotonic; por defecto dentro de `timeout`) y si no queda
+        tiempo la petición no sale (UpstreamBusy). Un hedge solo sale si sobra
+        presupuesto ahora mismo: nunca hace cola. `timeout` limita la petición
+        completa, no cada lectura del socket, y `sent()` se llama justo cuando
+        la petición sale hacia Uptodown.
+        """
+        if deadline is None:
+            deadline = time.monotonic() + timeout
+        if self.budget is not None:
+            if not hedge:
+                with tracing.span('budget'):
+                    await wait_queue(self.budget.acquire(deadline - time.monotonic()), deadline)
+            elif not self.budget.try_acquire():
+                raise UpstreamBusy()
+
+        host_limit = self._host_limit(url)
+        await wait_queue(host_limit.acquire(), deadline)
+        try:
+            # Lo que se haya ido en las colas sale del plazo de la petición
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise UpstreamBusy()
+            if sent is not None:
+                sent()
+            IN_FLIGHT.inc(kind='upstream')
+            start = time.perf_counter()
+            try:
+                with stage('fetch' if not hedge else 'hedge', op):
+                    response = await asyncio.wait_for(
+                        self.client.get(url, params=params, headers=self.random_headers(headers), timeout=timeout),
+                        timeout,
+                    )
+            except (asyncio.TimeoutError, httpx.TimeoutException):
+                # Un timeout también informa de la latencia: al menos `timeout` segundos
+                if self.resilience is not None:
+                    self.resilience.observe(op, timeout)
+                raise httpx.ReadTimeout(f"Uptodown no respondió en {timeout:.1f} s")
+            finally:
+                IN_FLIGHT.dec(kind='upstream')
+        finally:
+            host_limit.release()
+        if self.resilience is not None:
+            self.resilience.observe(op, time.perf_counter() - start)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    async def search_apps(self, query: str):
+        """Busca aplicaciones en Uptodown con múltiples selectors"""
+        try:
+            logger.info(f"🔍 Buscando: {query}")
+
+            # Limpiar query
+            query = normalize_query(query)
+            if len(query) < 2:
+                raise Exception("Búsqueda demasiado corta")
+
+            url = f"{self.base_url}/search"
+            results = await self.fetch_parsed(url, SEARCH_TIMEOUT, self.parse_search, params={"q": query}, op='search')
+
+            logger.info(f"📊 Total de resultados encontrados: {len(results)}")
+            return results
+
+        except CircuitOpen as e:
+            # Fallo rápido y esperado mientras Uptodown está degradado
+            logger.warning(f"🔌 Búsqueda cortada por el circuito: {e}")
+            raise
+        except httpx.HTTPError as e:
+            ERRORS.inc(type=type(e).__name__, where='search')
+            logger.error(f"❌ Error de red en búsqueda: {e}")
+            raise Exception(f"Error de conexión: {str(e)}")
+        except Exception as e:
+            ERRORS.inc(type=type(e).__name__, where='search')
+            logger.error(f"❌ Error inesperado en búsqueda: {e}")
+            raise Exception(f"Error en la búsqueda: {str(e)}")
+
+    def parse_search(self, html: str):
+        """Extrae los resultados de una página de búsqueda"""
+        results = self.search_engine.run(
+            html, self._extract_apps, MAX_SEARCH_RESULTS, fallback_extract=self._extract_app_links
+        )
+        return results or []
+
+    def _extract_apps(self, elements):
+        """Convierte las coincidencias de un selector en resultados"""
+        results = []
+        for element in elements[:MAX_SEARCH_RESULTS]:
+            try:
+                if element.tag == 'a':
+                    app_url = element.get('href')
+                    app_name = text_of(element)
+                else:
+                    link = next(element.iter('a'), None)
+                    if link is not None:
+                        app_url = link.get('href')
+                        app_name = text_of(link)
+                    else:
+                        app_url = element.get('data-url')
+                        app_name = text_of(element)
+
+                if app_url and app_name:
+                    # Asegurar URL completa
+                    if not app_url.startswith('http'):
+                        app_url = urljoin(self.base_url, app_url)
+
+                    if self.validate_url(app_url) and len(app_name) > 2:
+                        results.append({
+                            "name": app_name[:100],
+                            "url": app_url,
+                        })
+                        logger.info(f"✅ App encontrada: {app_name}")
+
+                        if len(results) >= MAX_SEARCH_RESULTS:
+                            break
+
+            except Exception as e:
+                logger.warning(f"Error procesando elemento: {e}")
+                continue
+        return results
+
+    def _extract_app_links(self, links):
+        """Último recurso: enlaces a /android/ de toda la página"""
+        logger.info("Buscando enlaces manualmente...")
+        results = []
+        for link in links:
+            href = link.get('href')
+            text = text_of(link)
+            if text and len(text) > 2:
+                if not href.startswith('http'):
+                    href = urljoin(self.base_url, href)
+
+                if self.validate_url(href):
+                    results.append({
+                        "name": text[:100],
+                        "url": href,
+                    })
+                    if len(results) >= MAX_SEARCH_RESULTS:
+                        break
+        return results
+
+    async def get_download_url(self, app_url: str):
+        """Obtiene URL de descarga con múltiples estrategias"""
+        info = await self.get_download_info(app_url)
+        return info['url'] if info else None
+
+    async def get_download_info(self, app_url: str):
+        """Obtiene {'url', 'version'} de la página /download, o None si no hay enlace"""
+        try:
+            logger.info(f"📥 Obteniendo descarga para: {app_url}")
+
+            if not self.validate_url(app_url):
+                raise Exception("URL no válida")
+
+            # Asegurar que tenemos la URL de descarga
+            if not app_url.endswith('/download'):
+                app_url = app_url.rstrip('/') + '/download'
+
+            info = await self.fetch_parsed(app_url, DOWNLOAD_PAGE_TIMEOUT, self.parse_download_info, op='download')
+
+            if not info:
+                logger.error("❌ No se pudo encontrar enlace de descarga")
+            return info
+
+        except CircuitOpen as e:
+            # Fallo rápido y esperado mientras Uptodown está degradado
+            logger.warning(f"🔌 Descarga cortada por el circuito: {e}")
+            raise
+        except httpx.HTTPError as e:
+            ERRORS.inc(type=type(e).__name__, where='download')
+            logger.error(f"❌ Error de red en descarga: {e}")
+            raise Exception(f"Error de conexión en descarga: {str(e)}")
+        except Exception as e:
+            ERRORS.inc(type=type(e).__name__, where='download')
+            logger.error(f"❌ Error inesperado en descarga: {e}")
+            raise Exception(f"Error al obtener descarga: {str(e)}")
+
+    def parse_download_info(self, html: str):
+        """Enlace de descarga y versión de una página /download (un solo parseo)"""
+        root = parse_html(html)
+        if root is None:
+            return None
+        download_url = self.download_engine.run(
+            root, self._extract_download, 1, fallback_extract=self._extract_download_links
+        )
+        if not download_url:
+            return None
+        return {'url': download_url, 'version': self.version_engine.run(root, self._extract_version, 1)}
+
+    def _extract_version(self, elements):
+        for element in elements:
+            version = element.get('content') or text_of(element)
+            if version:
+                return version[:50]
+        return None
+
+    def _extract_download(self, elements):
+        for download_element in elements:
+            download_url = download_element.get('data-url') or download_element.get('href')
+            if download_url:
+                if not download_url.startswith('http'):
+                    download_url = urljoin(self.base_url, download_url)
+
+                if self.validate_url(download_url):
+                    logger.info(f"✅ Enlace de descarga encontrado: {download_url}")
+                    return download_url
+        return None
+
+    def _extract_download_links(self, links):
+        """Último recurso: enlaces que contengan download o apk"""
+        for link in links:
+            href = link.get('href')
+            if href and ('download' in href.lower() or 'apk' in href.lower()):
+                if not href.startswith('http'):
+                    href = urljoin(self.base_url, href)
+
+                if self.validate_url(href):
+                    logger.info(f"✅ Enlace de descarga manual: {href}")
+                    return href
+        return None
+
+    def selector_stats(self) -> dict:
+        """Estadísticas de aciertos de los selectors de búsqueda y descarga"""
+        return {
+            'search': self.search_engine.stats(),
+            'download': self.download_engine.stats(),
+        }
@@ -0,0 +1,176 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+from metrics import WATCH_EVENTS
+
+logger = logging.getLogger(__name__)
+
+
+class AppWatcher:
+    """Comprueba en segundo plano si hay versiones nuevas de las apps vigiladas
+
+    El estado es por app, no por suscriptor: cada app se comprueba como mucho
+    una vez cada `interval` segundos tenga uno o mil suscriptores, y los
+    suscriptores solo se consultan al avisar. Tras cada comprobación la
+    siguiente se programa a `interval` más un jitter aleatorio de hasta
+    `jitter * interval`, así que las apps se reparten solas en el tiempo.
+
+    Las comprobaciones usan solo el presupuesto de Uptodown que sobra por
+    encima de `budget_reserve` (como el prefetch) y como mucho `concurrency`
+    a la vez. `claim(app_id)` permite que, con varios workers, solo uno
+    compruebe cada app por intervalo.
+    """
+
+    def __init__(self, poll, notify, save, budget=None, claim=None, interval: float = 21600,
+                 jitter: float = 0.1, concurrency: int = 2, budget_reserve: float = 5):
+        self.poll = poll
+        self.notify = notify
+        self.save = save
+        self.budget = budget
+        self.claim = claim
+        self.interval = interval
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.budget_reserve = budget_reserve
+        self.bot = None
+        self._versions = {}    # app_id -> versión conocida (None hasta la primera comprobación)
+        self._due = []         # heap (cuándo, seq, app_id)
+        self._scheduled = {}   # app_id -> seq vigente; las entradas viejas del heap se ignoran
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._slots = None
+        self._task = None
+        self._checks = set()
+
+    def __len__(self):
+        return len(self._versions)
+
+    def __contains__(self, app_id):
+        return app_id in self._versions
+
+    def version(self, app_id: int):
+        return self._versions.get(app_id)
+
+    def load(self, apps):
+        """Programa las apps guardadas como (app_id, versión, última comprobación en epoch)"""
+        now = time.time()
+        for app_id, version, checked_at in apps:
+            self._versions[app_id] = version
+            if checked_at is None:
+                delay = random.uniform(0, self.interval)
+            else:
+                # Las atrasadas (bot parado) se reparten en la ventana de jitter, no todas a la vez
+                delay = max(0.0, checked_at + self.interval - now) + random.uniform(0, self.jitter * self.interval)
+            self._schedule(app_id, delay)
+
+    def watch(self, app_id: int, version=None):
+        """Empieza a vigilar una app (no hace nada si ya estaba vigilada)"""
+        if app_id in self._versions:
+            return
+        self._versions[app_id] = version
+        self._schedule(app_id, self._next_delay())
+
+    def unwatch(self, app_id: int):
+        """Deja de vigilar una app (cuando ya no le queda ningún suscriptor)"""
+        self._versions.pop(app_id, None)
+        self._scheduled.pop(app_id, None)
+
+    def _next_delay(self) -> float:
+        return self.interval + random.uniform(0, self.jitter * self.interval)
+
+    def _schedule(self, app_id: int, delay: float):
+        seq = next(self._seq)
+        self._scheduled[app_id] = seq
+        heapq.heappush(self._due, (time.monotonic() + delay, seq, app_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self, bot):
+        """Arranca el bucle en el event loop actual; `bot` se pasa a `notify`"""
+        self.bot = bot
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._checks):
+            task.cancel()
+
+    async def _run(self):
+        while True:
+            # Descarta entradas de apps ya no vigiladas o reprogramadas
+            while self._due and self._scheduled.get(self._due[0][2]) != self._due[0][1]:
+                heapq.heappop(self._due)
+
+            wait = self._due[0][0] - time.monotonic() if self._due else None
+            if wait is None or wait > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            if self.budget is not None and self.budget.available < self.budget_reserve + 1:
+                # Sin presupuesto de sobra: esperar a que se recargue un token
+                await asyncio.sleep(1 / self.budget.rate)
+                continue
+
+            await self._slots.acquire()
+            _, seq, app_id = heapq.heappop(self._due)
+            if self._scheduled.get(app_id) != seq:
+                self._slots.release()
+                continue
+            del self._scheduled[app_id]
+            task = asyncio.get_running_loop().create_task(self._check(app_id))
+            self._checks.add(task)
+            task.add_done_callback(self._checks.discard)
+
+    async def _check(self, app_id: int):
+        released = False
+        try:
+            if self.claim is not None and not await self.claim(app_id):
+                WATCH_EVENTS.inc(result='claimed')
+                return
+
+            info = await self.poll(app_id)
+            self._slots.release()
+            released = True
+            if app_id not in self._versions or not info:
+                WATCH_EVENTS.inc(result='missing' if not info else 'unwatched')
+                return
+
+            version = info.get('version')
+            if not version:
+                # Sin versión en la página no se puede saber si cambió (el enlace
+                # de descarga lleva un token y cambia en cada consulta)
+                WATCH_EVENTS.inc(result='no_version')
+                return
+            previous = self._versions[app_id]
+            self._versions[app_id] = version
+            await self.save(app_id, version)
+            if previous is None or version == previous:
+                WATCH_EVENTS.inc(result='unchanged')
+                return
+
+            WATCH_EVENTS.inc(result='updated')
+            logger.info(f"🆕 App {app_id}: {previous} -> {version}")
+            await self.notify(self.bot, app_id, previous, info)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            WATCH_EVENTS.inc(result='error')
+            logger.warning(f"⚠️ Error comprobando la app vigilada {app_id}: {e}")
+        finally:
+            if not released:
+                self._slots.release()
+            if app_id in self._versions and app_id not in self._scheduled:
+                self._schedule(app_id, self._next_delay())